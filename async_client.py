@@ -0,0 +1,362 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# ----- Program Details -----
+# Asynchronous client for bulk workloads. Requests are written to a few
+# connections without waiting for the previous responses; the server
+# answers the requests of a connection in order, so every connection keeps
+# a queue of the futures waiting for a response and a reader task resolves
+# them one frame at a time. The coroutines can be run many at once with
+# asyncio.gather.
+
+# The asyncio module runs the connections and the waiting requests
+import asyncio
+# The deque keeps the futures of a connection in the order of the requests
+from collections import deque
+# The arguments are checked like the ones of the synchronous client
+from client import (ENCODING, HOST_NAME, PORT, ClientError,
+                    CustomerClient, handshake)
+from protocol import (BUFF_SIZE, CODECS, JSON_CODEC, FrameReader,
+                      encode_frame, encode_message)
+
+MAX_IN_FLIGHT = 1024
+WRITE_BUFFER_LIMIT = 1 << 20
+
+
+class AsyncConnection:
+    """
+    A class used to pipeline requests on one connection
+
+    ...
+    Attributes
+    ----------
+    stream_reader : asyncio.StreamReader
+        the reading side of the connection
+    stream_writer : asyncio.StreamWriter
+        the writing side of the connection
+    codec : codec
+        the encoding negotiated with the server
+    compression : str
+        the compression of the large responses negotiated with the
+        server, None when they are not compressed
+    reader : FrameReader
+        the frame reader of the connection
+    pending : deque
+        the (future, codec) of the requests waiting for a response, in
+        the order they were sent, the codec is None to keep the response
+        encoded
+    outgoing : list
+        the encoded requests not written yet, the requests made during
+        one pass of the event loop are written at once
+    in_flight : asyncio.Semaphore
+        it limits the number of requests waiting for a response
+    reader_task : asyncio.Task
+        the task reading the responses
+
+    Methods
+    -------
+    open(host, port, encoding, max_in_flight, compression)
+        It connects to the server and returns the connection
+    request(req_dict)
+        It sends one request and waits for its response
+    request_payload(payload)
+        It sends one encoded request and waits for the encoded response
+    flush()
+        It writes the outgoing requests to the connection
+    read_responses()
+        It resolves the waiting futures with the responses
+    close()
+        It closes the connection
+    """
+
+    def __init__(self, stream_reader, stream_writer,
+                 max_in_flight=MAX_IN_FLIGHT):
+        self.stream_reader = stream_reader
+        self.stream_writer = stream_writer
+        self.codec = JSON_CODEC
+        self.compression = None
+        self.reader = FrameReader()
+        self.pending = deque()
+        self.outgoing = []
+        self.in_flight = asyncio.Semaphore(max_in_flight)
+        self.reader_task = asyncio.ensure_future(self.read_responses())
+
+    @classmethod
+    async def open(cls, host=HOST_NAME, port=PORT, encoding=ENCODING,
+                   max_in_flight=MAX_IN_FLIGHT, compression=None):
+        """It connects to the server, negotiates the encoding and the
+        compression and returns the connection
+
+        Parameters
+        ----------
+        host : str
+            The host of the server
+        port : int
+            The port of the server
+        encoding : str
+            The encoding asked to the server
+        max_in_flight : int
+            The largest number of requests waiting for a response
+        compression : str
+            The compression of the large responses asked to the server,
+            None for none
+
+        Returns
+        -------
+        AsyncConnection
+            the connected object
+        """
+        try:
+            (stream_reader, stream_writer) = await asyncio.open_connection(
+                host, port)
+        except OSError as e:
+            raise ClientError('Can not connect to {}:{}: {}'.format(
+                host, port, e))
+        connection = cls(stream_reader, stream_writer, max_in_flight)
+        if encoding != 'json' or compression:
+            # the answer is still JSON, the server switches after sending it
+            res_data_dict = await connection.request(
+                handshake(encoding, compression))
+            connection.codec = CODECS.get(res_data_dict.get('encoding'),
+                                          JSON_CODEC)
+            connection.compression = res_data_dict.get('compression')
+            connection.reader.compressed = connection.compression is not None
+        return connection
+
+    async def request(self, req_dict):
+        """It takes a request, sends it without waiting for the previous
+        responses and returns its response
+
+        Parameters
+        ----------
+        req_dict : dict
+            The request for the server
+
+        Returns
+        -------
+        dict
+            a dict containing the response from the server
+        """
+        return await self.send(encode_message(req_dict, self.codec),
+                               self.codec)
+
+    async def request_payload(self, payload):
+        """It takes an already encoded request payload, sends it like
+        request and returns the response payload without decoding it
+
+        Parameters
+        ----------
+        payload : bytes
+            The encoded request
+
+        Returns
+        -------
+        bytes
+            a byte string containing the encoded response
+        """
+        return await self.send(encode_frame(payload), None)
+
+    async def send(self, frame, codec):
+        async with self.in_flight:
+            if self.reader_task.done():
+                raise ClientError('Connection closed')
+            future = asyncio.get_running_loop().create_future()
+            self.pending.append((future, codec))
+            if not self.outgoing:
+                asyncio.get_running_loop().call_soon(self.flush)
+            self.outgoing.append(frame)
+            if self.stream_writer.transport.get_write_buffer_size() \
+                    > WRITE_BUFFER_LIMIT:
+                await self.stream_writer.drain()
+            return await future
+
+    def flush(self):
+        """It writes the outgoing requests to the connection in one write
+        """
+        (outgoing, self.outgoing) = (self.outgoing, [])
+        if not self.stream_writer.is_closing():
+            self.stream_writer.write(b''.join(outgoing))
+
+    async def read_responses(self):
+        """It reads the responses and resolves the waiting futures in the
+        order of the requests, they all fail when the connection is lost
+        """
+        reader = self.reader
+        error = ClientError('Connection closed by server')
+        try:
+            while True:
+                data = await self.stream_reader.read(BUFF_SIZE)
+                if not data:
+                    break
+                reader.feed(data)
+                for payload in reader.frames():
+                    (future, codec) = self.pending.popleft()
+                    if future.done():
+                        # the caller was cancelled
+                        continue
+                    if codec is None:
+                        future.set_result(payload)
+                        continue
+                    try:
+                        future.set_result(codec.decode(payload))
+                    except ValueError as e:
+                        future.set_exception(ClientError(
+                            'Invalid response: {}'.format(e)))
+        except (OSError, IndexError, ValueError) as e:
+            error = ClientError('Connection lost: {}'.format(e))
+        finally:
+            while self.pending:
+                (future, codec) = self.pending.popleft()
+                if not future.done():
+                    future.set_exception(error)
+
+    async def close(self):
+        """It closes the connection
+        """
+        self.stream_writer.close()
+        try:
+            await self.stream_writer.wait_closed()
+        except OSError:
+            pass
+        await asyncio.gather(self.reader_task, return_exceptions=True)
+
+
+class AsyncCustomerClient:
+    """
+    A class used to send many requests at once on a few pipelined
+    connections. The requests about one customer always use the same
+    connection, so they reach the server in the order they were made;
+    the other requests are spread over the connections in turn. Every
+    coroutine returns the response of the server, like the methods of
+    CustomerClient
+
+    ...
+    Attributes
+    ----------
+    connections : list
+        the AsyncConnection objects
+    next_connection : int
+        the position of the connection used by the next request that is
+        not about one customer
+
+    Methods
+    -------
+    connect()
+        It opens the connections
+    request(req_dict, name=None)
+        It sends a request and returns the response
+    get_customer(name)
+        It returns the detail of a customer
+    add_customer(name, age='', address='', phone='')
+        It adds a customer
+    delete_customer(name)
+        It deletes a customer
+    update_customer(name, age=None, address=None, phone=None)
+        It updates any of age, address and phone of a customer at once
+    get_customers(names)
+        It returns the detail of many customers
+    add_customers(customers)
+        It adds many customers
+    delete_customers(names)
+        It deletes many customers
+    close()
+        It closes the connections
+    """
+
+    def __init__(self, host=HOST_NAME, port=PORT, connections=4,
+                 encoding=ENCODING, max_in_flight=MAX_IN_FLIGHT,
+                 compression=None):
+        self.host = host
+        self.port = port
+        self.size = connections
+        self.encoding = encoding
+        self.max_in_flight = max_in_flight
+        self.compression = compression
+        self.connections = []
+        self.next_connection = 0
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def connect(self):
+        """It opens the connections to the server
+        """
+        self.connections = list(await asyncio.gather(*[
+            AsyncConnection.open(self.host, self.port, self.encoding,
+                                 self.max_in_flight, self.compression)
+            for _ in range(self.size)]))
+
+    async def request(self, req_dict, name=None):
+        """It takes a request, sends it on the connection of the customer
+        (the next connection when there is no customer) and returns the
+        response sent by server
+
+        Parameters
+        ----------
+        req_dict : dict
+            The request for the server
+        name : str
+            The name of the customer the request is about
+
+        Returns
+        -------
+        dict
+            a dict containing the response from the server
+        """
+        if not self.connections:
+            raise ClientError('Not connected')
+        if name is not None:
+            connection = self.connections[hash(name) % len(self.connections)]
+        else:
+            connection = self.connections[self.next_connection]
+            self.next_connection = (self.next_connection + 1) \
+                % len(self.connections)
+        return await connection.request(req_dict)
+
+    async def get_customer(self, name):
+        CustomerClient.check(name)
+        return await self.request({'choice': '1', 'name': name}, name)
+
+    async def add_customer(self, name, age='', address='', phone=''):
+        CustomerClient.check(name, age, phone)
+        return await self.request({'choice': '2', 'name': name, 'age': age,
+                                   'address': address, 'phone': phone}, name)
+
+    async def delete_customer(self, name):
+        CustomerClient.check(name)
+        return await self.request({'choice': '3', 'name': name}, name)
+
+    async def update_customer(self, name, age=None, address=None,
+                              phone=None):
+        CustomerClient.check(name, age or '', phone or '')
+        req_dict = {'choice': '13', 'name': name}
+        for (field, value) in (('age', age), ('address', address),
+                               ('phone', phone)):
+            if value is not None:
+                req_dict[field] = value
+        return await self.request(req_dict, name)
+
+    async def get_customers(self, names):
+        return await self.request({'choice': '10', 'names': list(names)})
+
+    async def add_customers(self, customers):
+        customers = list(customers)
+        for customer in customers:
+            CustomerClient.check(customer.get('name', ''),
+                                 customer.get('age', ''),
+                                 customer.get('phone', ''))
+        return await self.request({'choice': '11', 'customers': customers})
+
+    async def delete_customers(self, names):
+        return await self.request({'choice': '12', 'names': list(names)})
+
+    async def close(self):
+        """It closes the connections
+        """
+        (connections, self.connections) = (self.connections, [])
+        await asyncio.gather(*[connection.close()
+                               for connection in connections])
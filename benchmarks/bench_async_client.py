@@ -0,0 +1,92 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# ----- Program Details -----
+# Benchmark of bulk loading and verifying customers with the synchronous
+# CustomerClient (one request waits for the previous response) against
+# the pipelined AsyncCustomerClient (many requests in flight on a few
+# connections), against a server on a loopback port.
+#
+# Usage (from the repository root):
+#     python -m benchmarks.bench_async_client --customers 20000
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from async_client import AsyncCustomerClient
+from benchmarks.common import (free_port, generate_data, start_server,
+                               stop_server)
+from client import CustomerClient
+
+CHUNK_SIZE = 2000
+
+
+def new_customer(prefix, index):
+    return {'name': '{}{:08d}'.format(prefix, index), 'age': '30',
+            'address': '{} Rue Guy'.format(index), 'phone': '514 555-1234'}
+
+
+def sync_load(port, args):
+    client = CustomerClient(port=port)
+    customers = [new_customer('Sync', index)
+                 for index in range(args.customers)]
+    start = time.perf_counter()
+    for customer in customers:
+        client.add_customer(**customer)
+    for customer in customers:
+        assert client.get_customer(customer['name'])['name'] \
+            == customer['name']
+    elapsed = time.perf_counter() - start
+    client.close()
+    return 2 * args.customers / elapsed
+
+
+async def async_load(port, args):
+    customers = [new_customer('Async', index)
+                 for index in range(args.customers)]
+    async with AsyncCustomerClient(port=port,
+                                   connections=args.connections) as client:
+        start = time.perf_counter()
+        for offset in range(0, len(customers), CHUNK_SIZE):
+            await asyncio.gather(*[
+                client.add_customer(**customer)
+                for customer in customers[offset:offset + CHUNK_SIZE]])
+        for offset in range(0, len(customers), CHUNK_SIZE):
+            responses = await asyncio.gather(*[
+                client.get_customer(customer['name'])
+                for customer in customers[offset:offset + CHUNK_SIZE]])
+            assert all(response.get('name') for response in responses)
+        elapsed = time.perf_counter() - start
+    return 2 * args.customers / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark of the synchronous and asyncio clients')
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--customers', type=int, default=20000)
+    parser.add_argument('--connections', type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_path = os.path.join(tmp_dir, 'data.txt')
+        generate_data(data_path, args.rows)
+        port = free_port()
+        process = start_server(port, data_path)
+        try:
+            results = [('CustomerClient', sync_load(port, args)),
+                       ('AsyncCustomerClient', asyncio.run(
+                           async_load(port, args)))]
+        finally:
+            stop_server(process)
+
+    print('{:<24}{:>22}'.format('client', 'adds + finds/s'))
+    for (label, rate) in results:
+        print('{:<24}{:>22.0f}'.format(label, rate))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# ----- Program Details -----
+# Benchmark of the encodings a client can negotiate with the handshake
+# choice. For every encoding asked it measures, with the encoding the
+# server actually negotiated, the requests per second and the bytes on
+# the wire (requests and responses, frame headers included) of pipelined
+# lookups (choice 1), of report pages (choice 7 with page_size) and of
+# full reports (choice 7, rows and columns), against a server on a
+# loopback port.
+#
+# Usage (from the repository root):
+#     python -m benchmarks.bench_codecs --rows 10000 --lookups 20000
+#     python -m benchmarks.bench_codecs --encodings json binary msgpack
+
+import argparse
+import os
+import socket
+import tempfile
+import time
+
+from benchmarks.common import (customer_name, free_port, generate_data,
+                               start_server, stop_server)
+from protocol import (CODECS, HANDSHAKE_CHOICE, JSON_CODEC, FrameReader,
+                      encode_message, recv_frame)
+
+PIPELINE_DEPTH = 64
+
+
+class CountingConnection:
+    """
+    A class used to send framed requests and count the bytes on the wire
+    """
+
+    def __init__(self, port, encoding):
+        self.sock = socket.create_connection(('localhost', port))
+        self.reader = FrameReader()
+        self.codec = JSON_CODEC
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        if encoding != 'json':
+            res_data_dict = self.request(
+                [{'choice': HANDSHAKE_CHOICE, 'encodings': [encoding]}])[0]
+            # the server falls back to JSON for an encoding it lacks
+            self.codec = CODECS.get(res_data_dict['encoding'], JSON_CODEC)
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def request(self, req_dicts):
+        data = b''.join(encode_message(req_dict, self.codec)
+                        for req_dict in req_dicts)
+        self.sock.sendall(data)
+        self.bytes_sent += len(data)
+        responses = []
+        for _ in req_dicts:
+            payload = recv_frame(self.sock, self.reader)
+            self.bytes_received += len(payload) + 4
+            responses.append(self.codec.decode(payload))
+        return responses
+
+    def close(self):
+        self.sock.close()
+
+
+def lookups(port, encoding, args):
+    connection = CountingConnection(port, encoding)
+    req_dicts = [{'choice': '1', 'name': customer_name(index % args.rows)}
+                 for index in range(args.lookups)]
+    start = time.perf_counter()
+    for offset in range(0, len(req_dicts), PIPELINE_DEPTH):
+        connection.request(req_dicts[offset:offset + PIPELINE_DEPTH])
+    elapsed = time.perf_counter() - start
+    connection.close()
+    return (args.lookups / elapsed,
+            (connection.bytes_sent + connection.bytes_received)
+            / args.lookups)
+
+
+def pages(port, encoding, args):
+    connection = CountingConnection(port, encoding)
+    req_dict = {'choice': '7', 'page_size': args.page_size}
+    count = 0
+    start = time.perf_counter()
+    while count < args.pages:
+        res_data_dict = connection.request([req_dict])[0]
+        count += 1
+        req_dict['cursor'] = res_data_dict['cursor']
+        if not req_dict['cursor']:
+            del req_dict['cursor']
+    elapsed = time.perf_counter() - start
+    connection.close()
+    return (count / elapsed,
+            (connection.bytes_sent + connection.bytes_received) / count)
+
+
+def reports(port, encoding, args, layout):
+    connection = CountingConnection(port, encoding)
+    start = time.perf_counter()
+    for _ in range(args.reports):
+        connection.request([{'choice': '7', 'layout': layout}])
+    elapsed = time.perf_counter() - start
+    connection.close()
+    return (args.reports / elapsed,
+            (connection.bytes_sent + connection.bytes_received)
+            / args.reports)
+
+
+def negotiated(port, encoding):
+    connection = CountingConnection(port, encoding)
+    connection.close()
+    return connection.codec.name
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark of the negotiated encodings')
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--lookups', type=int, default=20000)
+    parser.add_argument('--reports', type=int, default=20)
+    parser.add_argument('--pages', type=int, default=500)
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--encodings', nargs='+',
+                        default=sorted(CODECS),
+                        help='encodings asked to the server')
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_path = os.path.join(tmp_dir, 'data.txt')
+        generate_data(data_path, args.rows)
+        port = free_port()
+        process = start_server(port, data_path)
+        try:
+            for encoding in args.encodings:
+                name = negotiated(port, encoding)
+                if name != encoding:
+                    print('{} was not negotiated, the server chose {}'
+                          .format(encoding, name))
+                    continue
+                results.append(('choice 1, ' + name,
+                                lookups(port, encoding, args)))
+                results.append(('choice 7 pages, ' + name,
+                                pages(port, encoding, args)))
+                for layout in ('rows', 'columns'):
+                    results.append(('choice 7 {}, {}'.format(layout, name),
+                                    reports(port, encoding, args, layout)))
+        finally:
+            stop_server(process)
+
+    print('{:<30}{:>14}{:>18}'.format('requests', 'requests/s',
+                                       'bytes/request'))
+    for (label, (rate, size)) in sorted(results):
+        print('{:<30}{:>14.1f}{:>18.0f}'.format(label, rate, size))
+
+
+if __name__ == '__main__':
+    main()
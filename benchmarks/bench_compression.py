@@ -0,0 +1,133 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# ----- Program Details -----
+# Benchmark of the compressed responses and of the columnar report. For
+# every encoding, report layout and compression it measures the bytes of
+# the full report on the wire and its end-to-end time (request sent to
+# report decoded) against a server on a loopback port, then estimates the
+# time over a slower link by adding the transfer time of those bytes at
+# --link-mbit. The bytes of a get_customer reply show that the small
+# replies are not compressed.
+#
+# Usage (from the repository root):
+#     python -m benchmarks.bench_compression --rows 100000 --link-mbit 20
+
+import argparse
+import os
+import socket
+import tempfile
+import time
+
+from benchmarks.common import (customer_name, free_port, generate_data,
+                               start_server, stop_server)
+from client import handshake
+from protocol import (BUFF_SIZE, CODECS, JSON_CODEC, FrameReader,
+                      encode_message)
+
+
+class CountingConnection:
+    """
+    A class used to send framed requests and count the bytes received
+    from the socket, before the frames are decompressed
+    """
+
+    def __init__(self, port, encoding, compression):
+        self.sock = socket.create_connection(('localhost', port))
+        self.reader = FrameReader()
+        self.codec = JSON_CODEC
+        self.bytes_received = 0
+        if encoding != 'json' or compression:
+            res_data_dict = self.request(handshake(encoding, compression))
+            self.codec = CODECS[res_data_dict['encoding']]
+            if compression and res_data_dict['compression'] != compression:
+                raise SystemExit('The server refused {}'.format(compression))
+            self.reader.compressed = compression is not None
+        self.bytes_received = 0
+
+    def request(self, req_dict):
+        self.sock.sendall(encode_message(req_dict, self.codec))
+        while True:
+            payload = self.reader.next_frame()
+            if payload is not None:
+                return self.codec.decode(payload)
+            data = self.sock.recv(BUFF_SIZE)
+            if not data:
+                raise ConnectionError('Connection closed by server')
+            self.bytes_received += len(data)
+            self.reader.feed(data)
+
+    def close(self):
+        self.sock.close()
+
+
+def measure(port, encoding, layout, compression, args):
+    """It returns the bytes and the best end-to-end time of the report,
+    and the bytes of a get_customer reply"""
+    connection = CountingConnection(port, encoding, compression)
+    req_dict = {'choice': '7'}
+    if layout != 'rows':
+        req_dict['layout'] = layout
+    # the first report fills the cache of the server
+    connection.request(req_dict)
+    best = None
+    report_bytes = 0
+    for _ in range(args.reports):
+        connection.bytes_received = 0
+        start = time.perf_counter()
+        connection.request(req_dict)
+        elapsed = time.perf_counter() - start
+        report_bytes = connection.bytes_received
+        best = elapsed if best is None else min(best, elapsed)
+    connection.bytes_received = 0
+    connection.request({'choice': '1', 'name': customer_name(0)})
+    get_bytes = connection.bytes_received
+    connection.close()
+    return (report_bytes, best, get_bytes)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark of the compressed and columnar reports')
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--reports', type=int, default=5)
+    parser.add_argument('--link-mbit', type=float, default=20.0,
+                        help='bandwidth of the slow link in Mbit/s')
+    parser.add_argument('--encodings', nargs='+', default=sorted(CODECS),
+                        choices=sorted(CODECS))
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_path = os.path.join(tmp_dir, 'data.txt')
+        generate_data(data_path, args.rows)
+        port = free_port()
+        process = start_server(port, data_path)
+        try:
+            for encoding in args.encodings:
+                for layout in ('rows', 'columns'):
+                    for compression in (None, 'zlib'):
+                        results.append(
+                            (encoding, layout, compression or 'none',
+                             measure(port, encoding, layout, compression,
+                                     args)))
+        finally:
+            stop_server(process)
+
+    print('{:<9}{:<9}{:<6}{:>14}{:>10}{:>14}{:>16}'.format(
+        'encoding', 'layout', 'zlib', 'report bytes', 'vs plain',
+        'loopback ms', 'at {:g} Mbit ms'.format(args.link_mbit)))
+    plain = {}
+    for (encoding, layout, compression, (size, elapsed, get_bytes)) \
+            in results:
+        plain.setdefault(encoding, size)
+        link = elapsed + size * 8 / (args.link_mbit * 1e6)
+        print('{:<9}{:<9}{:<6}{:>14}{:>9.0%}{:>14.1f}{:>16.1f}'.format(
+            encoding, layout, compression, size, size / plain[encoding],
+            1000 * elapsed, 1000 * link))
+    print('get_customer reply bytes: {}'.format(
+        sorted({result[3][2] for result in results})))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# ----- Program Details -----
+# Micro-benchmark of updating the age, address and phone of a customer
+# with three per-field requests (choices 4, 5 and 6) against a single
+# update fields request (choice 13). It measures the in-process cost of
+# Server.process_payload (decode, dispatch, update, encode) and the
+# round trips to a server on a loopback port.
+#
+# Usage (from the repository root):
+#     python -m benchmarks.bench_dispatch --updates 20000
+
+import argparse
+import os
+import socket
+import tempfile
+import time
+
+from benchmarks.common import (customer_name, free_port, generate_data,
+                               start_server, stop_server)
+from protocol import FrameReader, encode_message, recv_message
+from server import Server, ServerOperations, Session
+
+
+def per_field_requests(name, index):
+    return [{'choice': '4', 'name': name, 'age': str(20 + index % 50)},
+            {'choice': '5', 'name': name, 'address': '{} Rue Guy'.format(index)},
+            {'choice': '6', 'name': name, 'phone': '514 555-{:04d}'.format(
+                index % 10000)}]
+
+
+def update_fields_request(name, index):
+    return [{'choice': '13', 'name': name, 'age': str(20 + index % 50),
+             'address': '{} Rue Guy'.format(index),
+             'phone': '514 555-{:04d}'.format(index % 10000)}]
+
+
+def in_process(build, args, server_operation_obj):
+    payloads = []
+    for index in range(args.updates):
+        payloads.extend(encode_message(req_dict)[4:] for req_dict in
+                        build(customer_name(index % args.rows), index))
+    session = Session()
+    start = time.perf_counter()
+    for payload in payloads:
+        Server.process_payload(server_operation_obj, payload, session)
+    return args.updates / (time.perf_counter() - start)
+
+
+def over_socket(build, args, port):
+    reader = FrameReader()
+    with socket.create_connection(('localhost', port)) as sock:
+        start = time.perf_counter()
+        for index in range(args.updates):
+            for req_dict in build(customer_name(index % args.rows), index):
+                sock.sendall(encode_message(req_dict))
+                recv_message(sock, reader)
+        return args.updates / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Micro-benchmark of the update dispatch')
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--updates', type=int, default=20000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_path = os.path.join(tmp_dir, 'data.txt')
+        generate_data(data_path, args.rows)
+        server_operation_obj = ServerOperations(data_path)
+
+        results = [
+            ('choices 4+5+6, in process',
+             in_process(per_field_requests, args, server_operation_obj)),
+            ('choice 13, in process',
+             in_process(update_fields_request, args, server_operation_obj)),
+        ]
+        port = free_port()
+        process = start_server(port, data_path)
+        try:
+            results.append(('choices 4+5+6, loopback',
+                            over_socket(per_field_requests, args, port)))
+            results.append(('choice 13, loopback',
+                            over_socket(update_fields_request, args, port)))
+        finally:
+            stop_server(process)
+
+    print('{:<30}{:>22}'.format('requests', 'customer updates/s'))
+    for (label, rate) in results:
+        print('{:<30}{:>22.0f}'.format(label, rate))
+
+
+if __name__ == '__main__':
+    main()
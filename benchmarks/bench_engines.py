@@ -0,0 +1,119 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# ----- Program Details -----
+# Compares the server engines with many mostly idle client connections.
+# For every engine and connection count it opens the idle connections,
+# then measures the latency of find customer requests sent by a few
+# active clients, and reports p50/p99 latency and the server memory.
+#
+# Usage (from the repository root):
+#     python -m benchmarks.bench_engines --connections 100 1000 5000
+#
+# The 'single' engine is not measured: it serves one connection at a time,
+# so a single idle connection blocks every other client.
+
+import argparse
+import os
+import random
+import socket
+import tempfile
+import threading
+import time
+
+from benchmarks.common import (customer_name, free_port, generate_data,
+                               percentile, process_rss_kb, start_server,
+                               stop_server)
+from protocol import FrameReader, encode_message, recv_message
+
+
+def open_idle_connections(port, count):
+    """It opens count connections and sends one request on each, so the
+    server has accepted and is serving all of them"""
+    connections = []
+    for _ in range(count):
+        sock = socket.create_connection(('localhost', port))
+        sock.sendall(encode_message({'choice': '1', 'name': 'nobody'}))
+        connections.append(sock)
+    for sock in connections:
+        recv_message(sock, FrameReader())
+    return connections
+
+
+def active_client(port, rows, requests, latencies):
+    """It sends find customer requests one by one and records latencies"""
+    rnd = random.Random()
+    reader = FrameReader()
+    with socket.create_connection(('localhost', port)) as sock:
+        for _ in range(requests):
+            req_dict = {'choice': '1',
+                        'name': customer_name(rnd.randrange(rows))}
+            start = time.perf_counter()
+            sock.sendall(encode_message(req_dict))
+            recv_message(sock, reader)
+            latencies.append(time.perf_counter() - start)
+
+
+def run(engine, connections, args, data_path):
+    port = free_port()
+    process = start_server(port, data_path,
+                           ['--mode', engine, '--workers',
+                            str(connections + args.clients + 1)])
+    idle = []
+    try:
+        idle = open_idle_connections(port, connections)
+        latencies = []
+        threads = [threading.Thread(target=active_client,
+                                    args=(port, args.rows, args.requests,
+                                          latencies))
+                   for _ in range(args.clients)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        rss_kb = process_rss_kb(process.pid)
+    finally:
+        for sock in idle:
+            sock.close()
+        stop_server(process)
+    return {
+        'engine': engine,
+        'connections': connections,
+        'requests_per_sec': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'server_rss_mb': rss_kb / 1024.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark of the server engines')
+    parser.add_argument('--engines', nargs='+',
+                        default=['threaded', 'pool', 'asyncio'])
+    parser.add_argument('--connections', nargs='+', type=int,
+                        default=[100, 1000])
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_path = os.path.join(tmp_dir, 'data.txt')
+        generate_data(data_path, args.rows)
+
+        print('{:<10}{:>12}{:>12}{:>10}{:>10}{:>10}'.format(
+            'engine', 'idle conns', 'req/s', 'p50 ms', 'p99 ms', 'RSS MB'))
+        for connections in args.connections:
+            for engine in args.engines:
+                res = run(engine, connections, args, data_path)
+                print('{:<10}{:>12}{:>12.0f}{:>10.3f}{:>10.3f}{:>10.1f}'
+                      .format(res['engine'], res['connections'],
+                              res['requests_per_sec'], res['p50_ms'],
+                              res['p99_ms'], res['server_rss_mb']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# ----- Program Details -----
+# Load generator for server.py. It starts the server on a loopback port
+# with a generated dataset, drives a weighted mix of choices from many
+# concurrent client connections for a fixed duration, and reports the
+# throughput and the p50/p95/p99 latency of every choice. The results can
+# be saved as JSON and compared with the results of an earlier run.
+#
+# Usage (from the repository root):
+#     python -m benchmarks.bench_load --rows 100000 --clients 16 \
+#         --mix 1=90 13=8 7=2 --duration 30 --output after.json \
+#         --compare before.json
+#
+# --port runs the workload against a server that is already running
+# (its data must contain the generated customer names).
+
+import argparse
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+
+from benchmarks.common import (ROOT_DIR, customer_name, free_port,
+                               generate_data, percentile, start_server,
+                               stop_server)
+from protocol import FrameReader, encode_message, recv_message
+
+DEFAULT_MIX = ['1=90', '13=8', '7=2']
+STREETS = ['Rue Guy', 'Rue Peel', 'Avenue Parc']
+
+
+def find_request(rnd, rows, state):
+    return {'choice': '1', 'name': customer_name(rnd.randrange(rows))}
+
+
+def add_request(rnd, rows, state):
+    # new names only, so every add is a real insert
+    return {'choice': '2', 'name': 'Load{}-{}'.format(state['client'],
+                                                      next(state['added'])),
+            'age': str(rnd.randint(18, 90)), 'address': 'Rue Guy',
+            'phone': '514 555-1234'}
+
+
+def update_age_request(rnd, rows, state):
+    return {'choice': '4', 'name': customer_name(rnd.randrange(rows)),
+            'age': str(rnd.randint(18, 90))}
+
+
+def report_request(rnd, rows, state):
+    return {'choice': '7'}
+
+
+def batch_find_request(rnd, rows, state):
+    return {'choice': '10', 'names': [customer_name(rnd.randrange(rows))
+                                      for _ in range(10)]}
+
+
+def update_request(rnd, rows, state):
+    return {'choice': '13', 'name': customer_name(rnd.randrange(rows)),
+            'age': str(rnd.randint(18, 90)),
+            'address': '{} {}'.format(rnd.randint(1, 9999),
+                                      rnd.choice(STREETS))}
+
+
+def search_request(rnd, rows, state):
+    return {'choice': '14',
+            'prefix': customer_name(rnd.randrange(rows))[:-2]}
+
+
+# The choices the load generator knows how to build requests for
+REQUEST_BUILDERS = {
+    '1': find_request,
+    '2': add_request,
+    '4': update_age_request,
+    '7': report_request,
+    '10': batch_find_request,
+    '13': update_request,
+    '14': search_request,
+}
+
+
+def parse_mix(items):
+    """It takes the choice=weight items and return a dict of the weight of
+    every choice"""
+    mix = {}
+    for item in items:
+        (choice, _, weight) = item.partition('=')
+        if choice not in REQUEST_BUILDERS:
+            raise SystemExit('Unsupported choice in --mix: {}'.format(choice))
+        mix[choice] = float(weight or 1)
+    return mix
+
+
+def client_loop(client, port, args, mix, deadline, results):
+    """It sends requests of the mix one at a time until the deadline and
+    records the latency of every response per choice"""
+    rnd = random.Random(args.seed + client)
+    state = {'client': client, 'added': iter(range(1 << 62))}
+    choices = list(mix)
+    weights = [mix[choice] for choice in choices]
+    latencies = {choice: [] for choice in choices}
+    errors = {choice: 0 for choice in choices}
+    reader = FrameReader()
+    try:
+        sock = socket.create_connection(('localhost', port))
+    except OSError:
+        results.append((latencies, {'connect': 1}))
+        return
+    with sock:
+        while time.perf_counter() < deadline:
+            choice = rnd.choices(choices, weights)[0]
+            req_dict = REQUEST_BUILDERS[choice](rnd, args.rows, state)
+            start = time.perf_counter()
+            try:
+                sock.sendall(encode_message(req_dict))
+                recv_message(sock, reader)
+            except (OSError, ValueError):
+                errors[choice] += 1
+                break
+            latencies[choice].append(time.perf_counter() - start)
+    results.append((latencies, errors))
+
+
+def summarize(latencies, errors, elapsed):
+    summary = {}
+    for choice in sorted(latencies, key=int):
+        values = latencies[choice]
+        summary[choice] = {
+            'requests': len(values),
+            'errors': errors.get(choice, 0),
+            'throughput': len(values) / elapsed,
+            'mean_ms': 1000 * sum(values) / len(values) if values else 0.0,
+            'p50_ms': 1000 * percentile(values, 50),
+            'p95_ms': 1000 * percentile(values, 95),
+            'p99_ms': 1000 * percentile(values, 99),
+            'max_ms': 1000 * max(values) if values else 0.0,
+        }
+    return summary
+
+
+def run_load(port, args, mix):
+    """It runs the clients against the server on the port and returns the
+    summary of every choice and of all the requests"""
+    results = []
+    deadline = time.perf_counter() + args.duration
+    threads = [threading.Thread(target=client_loop,
+                                args=(client, port, args, mix, deadline,
+                                      results))
+               for client in range(args.clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies = {choice: [] for choice in mix}
+    errors = {}
+    for (client_latencies, client_errors) in results:
+        for (choice, values) in client_latencies.items():
+            latencies[choice].extend(values)
+        for (choice, count) in client_errors.items():
+            errors[choice] = errors.get(choice, 0) + count
+    summary = summarize(latencies, errors, elapsed)
+    total = summarize({'0': [value for values in latencies.values()
+                             for value in values]},
+                      {'0': sum(errors.values())}, elapsed)['0']
+    return (summary, total, elapsed)
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                              cwd=ROOT_DIR, capture_output=True, text=True,
+                              timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ''
+
+
+def print_summary(summary, total, previous=None):
+    header = '{:<8}{:>10}{:>8}{:>12}{:>10}{:>10}{:>10}'.format(
+        'choice', 'requests', 'errors', 'req/s', 'p50 ms', 'p95 ms',
+        'p99 ms')
+    if previous:
+        header += '{:>12}{:>12}'.format('req/s diff', 'p99 diff')
+    print(header)
+    rows = list(summary.items()) + [('all', total)]
+    for (choice, stats) in rows:
+        line = '{:<8}{:>10}{:>8}{:>12.1f}{:>10.2f}{:>10.2f}{:>10.2f}'.format(
+            choice, stats['requests'], stats['errors'], stats['throughput'],
+            stats['p50_ms'], stats['p95_ms'], stats['p99_ms'])
+        if previous:
+            old = previous['total'] if choice == 'all' \
+                else previous['choices'].get(choice)
+            if old:
+                line += '{:>+11.1f}%{:>+11.1f}%'.format(
+                    change(old['throughput'], stats['throughput']),
+                    change(old['p99_ms'], stats['p99_ms']))
+        print(line)
+
+
+def change(old, new):
+    return 100.0 * (new - old) / old if old else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Load generator for server.py')
+    parser.add_argument('--rows', type=int, default=100000,
+                        help='customers in the generated dataset')
+    parser.add_argument('--clients', type=int, default=16,
+                        help='concurrent client connections')
+    parser.add_argument('--duration', type=float, default=10.0,
+                        help='seconds of load')
+    parser.add_argument('--mix', nargs='+', default=DEFAULT_MIX,
+                        help='choice=weight items, choices: {}'.format(
+                            ' '.join(sorted(REQUEST_BUILDERS, key=int))))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--port', type=int, default=None,
+                        help='use a server already running on this port')
+    parser.add_argument('--server-args', nargs=argparse.REMAINDER,
+                        default=[],
+                        help='more options for server.py (must be last)')
+    parser.add_argument('--output', help='save the results as JSON')
+    parser.add_argument('--compare', help='JSON results of an earlier run')
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+
+    if args.port is not None:
+        (summary, total, elapsed) = run_load(args.port, args, mix)
+    else:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            data_path = os.path.join(tmp_dir, 'data.txt')
+            generate_data(data_path, args.rows, args.seed)
+            port = free_port()
+            process = start_server(port, data_path, args.server_args)
+            try:
+                (summary, total, elapsed) = run_load(port, args, mix)
+            finally:
+                stop_server(process)
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as compare_file:
+            previous = json.load(compare_file)
+    print_summary(summary, total, previous)
+
+    if args.output:
+        report = {
+            'revision': git_revision(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'cpus': os.cpu_count(),
+            'rows': args.rows,
+            'clients': args.clients,
+            'duration': elapsed,
+            'mix': mix,
+            'server_args': args.server_args,
+            'choices': summary,
+            'total': total,
+        }
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+        print('Results saved to {}'.format(args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# ----- Program Details -----
+# Measures the load time of large data files with read_file and with the
+# parallel chunked loader (read_file_parallel), and shows the loader the
+# server picks for the file with --load-workers 0 (load_workers_for).
+#
+# Usage (from the repository root):
+#     python -m benchmarks.bench_loader --rows 1000000 10000000 --workers 4
+
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.common import generate_data
+from server import ServerOperations, load_workers_for
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark of the data file loaders')
+    parser.add_argument('--rows', nargs='+', type=int, default=[1000000])
+    parser.add_argument('--workers', nargs='+', type=int,
+                        default=[os.cpu_count() or 1],
+                        help='process counts tried for the parallel loader')
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory(dir='.') as tmp_dir:
+        for rows in args.rows:
+            data_path = os.path.join(tmp_dir, 'data_{}.txt'.format(rows))
+            generate_data(data_path, rows)
+            chosen = load_workers_for(data_path, 0)
+            for workers in [1] + args.workers:
+                start = time.perf_counter()
+                server_operation_obj = ServerOperations(
+                    data_path, load_workers=workers)
+                elapsed = time.perf_counter() - start
+                results.append((rows, 'read_file' if workers == 1 else
+                                'parallel x{}'.format(workers), elapsed,
+                                len(server_operation_obj.database_dict),
+                                '*' if workers == chosen else ''))
+                del server_operation_obj
+            os.remove(data_path)
+
+    print('{:>10}  {:<14}{:>10}{:>12}  {}'.format(
+        'rows', 'loader', 'seconds', 'customers', 'server default'))
+    for (rows, loader, elapsed, customers, chosen) in results:
+        print('{:>10}  {:<14}{:>10.2f}{:>12}  {}'.format(
+            rows, loader, elapsed, customers, chosen))
+    print('{} CPU(s)'.format(os.cpu_count()))
+
+
+if __name__ == '__main__':
+    main()
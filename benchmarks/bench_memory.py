@@ -0,0 +1,73 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# ----- Program Details -----
+# Measures the memory used per customer with tracemalloc: the former
+# layout (one four-key dict per customer) against the Customer records
+# now stored by ServerOperations, and the whole ServerOperations object
+# including its sorted name index.
+#
+# Usage (from the repository root):
+#     python -m benchmarks.bench_memory --rows 200000
+
+import argparse
+import gc
+import os
+import tempfile
+import tracemalloc
+
+from benchmarks.common import generate_data
+from server import ServerOperations
+from storage import Customer, parse_line
+
+
+def load_records(path_name):
+    with open(path_name, 'r') as data_file:
+        return [parse_line(line) for line in data_file]
+
+
+def measure(build):
+    """It returns the bytes still allocated by the object build returns"""
+    gc.collect()
+    tracemalloc.start()
+    obj = build()
+    gc.collect()
+    (current, _) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del obj
+    return current
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark of the memory used per customer')
+    parser.add_argument('--rows', type=int, default=200000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir='.') as tmp_dir:
+        data_path = os.path.join(tmp_dir, 'data.txt')
+        generate_data(data_path, args.rows)
+        records = load_records(data_path)
+
+        # the field strings are shared by both layouts, only the
+        # containers are measured
+        dict_layout = measure(lambda: {
+            record[0]: {'name': record[0], 'age': record[1],
+                        'address': record[2], 'phone': record[3]}
+            for record in records})
+        slots_layout = measure(lambda: {
+            record[0]: Customer(*record) for record in records})
+        del records
+        server_total = measure(lambda: ServerOperations(data_path))
+
+    print('{:<40}{:>16}'.format('layout', 'bytes/customer'))
+    print('{:<40}{:>16.1f}'.format('dict per customer (before)',
+                                   dict_layout / args.rows))
+    print('{:<40}{:>16.1f}'.format('Customer __slots__ record (after)',
+                                   slots_layout / args.rows))
+    print('{:<40}{:>16.1f}'.format('ServerOperations total (after)',
+                                   server_total / args.rows))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# ----- Program Details -----
+# Compares the write throughput of the mutation log fsync policies.
+# Several writer threads add customers to one ServerOperations object
+# whose changes are logged with the 'always' (fsync per change), 'group'
+# (group commit) and 'os' (no fsync) policies.
+# Then it starts server.py with every engine and group commit, and
+# several clients add customers over the socket: an engine which blocks
+# while a write waits for its fsync serializes the clients and gets no
+# benefit from group commit.
+#
+# Usage (from the repository root):
+#     python -m benchmarks.bench_wal --threads 16 --writes 500
+#     python -m benchmarks.bench_wal --policies --engines threaded asyncio
+
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from benchmarks.common import (free_port, generate_data, start_server,
+                               stop_server)
+from client import Connection
+from server import ServerOperations
+from storage import MutationLog
+
+
+def run(policy, args, tmp_dir, data_path):
+    log_path = os.path.join(tmp_dir, '{}.log'.format(policy))
+    log = MutationLog(log_path, policy, args.group_commit_ms)
+    server_operation_obj = ServerOperations(data_path, log)
+
+    def writer(thread_no):
+        for index in range(args.writes):
+            server_operation_obj.add_customer(
+                'Writer{}-{}'.format(thread_no, index), 30, 'Rue Guy',
+                '514 555-0000')
+
+    threads = [threading.Thread(target=writer, args=(thread_no, ))
+               for thread_no in range(args.threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    log.close()
+    return args.threads * args.writes / elapsed
+
+
+def run_engine(engine, args, tmp_dir, data_path):
+    log_path = os.path.join(tmp_dir, '{}.log'.format(engine))
+    port = free_port()
+    process = start_server(port, data_path,
+                           ['--mode', engine, '--log', log_path,
+                            '--fsync', 'group', '--group-commit-ms',
+                            str(args.group_commit_ms)])
+    try:
+        connections = [Connection('localhost', port)
+                       for _ in range(args.clients)]
+
+        def client(client_no):
+            for index in range(args.client_writes):
+                connections[client_no].request(
+                    {'choice': '2', 'name': 'Client{}-{}'.format(
+                        client_no, index), 'age': '30',
+                     'address': 'Rue Guy', 'phone': '514 555-0000'})
+
+        threads = [threading.Thread(target=client, args=(client_no, ))
+                   for client_no in range(args.clients)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        for connection in connections:
+            connection.close()
+    finally:
+        stop_server(process)
+    return args.clients * args.client_writes / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark of the mutation log fsync policies')
+    parser.add_argument('--policies', nargs='*',
+                        default=['always', 'group', 'os'])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--writes', type=int, default=500,
+                        help='writes per thread')
+    parser.add_argument('--group-commit-ms', type=float, default=2)
+    parser.add_argument('--engines', nargs='*',
+                        default=['threaded', 'pool', 'asyncio'],
+                        choices=['threaded', 'pool', 'asyncio'],
+                        help='server engines measured with group commit')
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--client-writes', type=int, default=200,
+                        help='writes per client')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir='.') as tmp_dir:
+        data_path = os.path.join(tmp_dir, 'data.txt')
+        generate_data(data_path, 1000)
+        if args.policies:
+            print('{:<10}{:>14}'.format('policy', 'writes/s'))
+        for policy in args.policies:
+            print('{:<10}{:>14.0f}'.format(
+                policy, run(policy, args, tmp_dir, data_path)))
+        if args.engines:
+            print('{:<10}{:>14}  ({} clients, group commit {:g} ms)'.format(
+                'engine', 'writes/s', args.clients, args.group_commit_ms))
+        for engine in args.engines:
+            print('{:<10}{:>14.0f}'.format(
+                engine, run_engine(engine, args, tmp_dir, data_path)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# ----- Program Details -----
+# Helpers shared by the benchmark scripts: dataset generation, starting a
+# server process on a loopback port and latency percentiles.
+
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STREETS = ['Avenue Parc', 'Rue Sherbrooke', 'Blvd Rene Levesque',
+           'St Mathieu', 'Avenue Iberville', 'Rue Guy', 'Rue Peel']
+
+
+def customer_name(index):
+    """It returns the generated customer name for an index"""
+    return 'Customer{:08d}'.format(index)
+
+
+def generate_data(path_name, rows, seed=0):
+    """It writes a pipe-delimited customer file in the data.txt format
+
+    Parameters
+    ----------
+    path_name : str
+        The path of the generated file
+    rows : int
+        The number of customers
+    seed : int
+        The seed of the random generator
+    """
+    rnd = random.Random(seed)
+    with open(path_name, 'w') as data_file:
+        for index in range(rows):
+            data_file.write('{}|{}|{} {}|{} {}-{}\n'.format(
+                customer_name(index), rnd.randint(18, 90),
+                rnd.randint(1, 9999), rnd.choice(STREETS),
+                rnd.randint(100, 999), rnd.randint(100, 999),
+                rnd.randint(1000, 9999)))
+
+
+def free_port():
+    """It returns a free TCP port on the loopback interface"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('localhost', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=120.0):
+    """It waits until a server accepts connections on the port"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('localhost', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError('Server did not start on port {}'.format(port))
+
+
+def start_server(port, data_path, extra_args=()):
+    """It starts server.py in a child process and waits until it listens
+
+    Parameters
+    ----------
+    port : int
+        The port of the server
+    data_path : str
+        The data file loaded by the server
+    extra_args : list
+        More command line options for server.py
+
+    Returns
+    -------
+    subprocess.Popen
+        the server process
+    """
+    cmd = [sys.executable, os.path.join(ROOT_DIR, 'server.py'),
+           '--port', str(port), '--data', data_path] + list(extra_args)
+    process = subprocess.Popen(cmd, cwd=ROOT_DIR, stdout=subprocess.DEVNULL)
+    try:
+        wait_for_port(port)
+    except Exception:
+        process.kill()
+        raise
+    return process
+
+
+def stop_server(process):
+    """It stops a server process started by start_server"""
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def percentile(values, pct):
+    """It returns the pct percentile of the values (nearest rank)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1,
+                       int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def process_rss_kb(pid):
+    """It returns the resident memory of a process in kB (Linux only)"""
+    try:
+        with open('/proc/{}/status'.format(pid)) as status_file:
+            for line in status_file:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
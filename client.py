@@ -4,17 +4,36 @@
 # ----- Program Details -----
 # Age is always integer and phone number is in XXX XXX-XXXX format is accepted.
 # Further options are given when entering wrong data/info to help the client user.
+# Run it to get the interactive menu, or import CustomerClient to call the
+# server from another program with a pool of shared connections.
 
 # The socket module is a framework for creating network servers.
 # It defines classes for handling synchronous network requests
 import socket
-# The JSON module is mainly used to convert the python dictionary above
-# into a JSON string that can be transmitted over the network
-import json
+# The threading module protects the connection pool shared by threads
+import threading
+# The argparse module reads the command line options of the menu
+import argparse
+# The contextmanager decorator lends pooled connections in a with block
+from contextlib import contextmanager
+# The deque keeps the import chunks waiting for their response
+from collections import deque
+# Messages are sent as length-prefixed frames (see protocol.py)
+from protocol import (CODECS, COMPRESSION_THRESHOLD, COMPRESSIONS,
+                      HANDSHAKE_CHOICE, JSON_CODEC, FrameReader,
+                      encode_message, recv_message)
 
 HOST_NAME = 'localhost'
 PORT = 9999
-BUFF_SIZE = 65536
+REPORT_PAGE_SIZE = 100
+# The encoding asked to the server at connection, 'json' needs no handshake
+ENCODING = 'json'
+# An import sends chunks of lines, a few of them at once
+IMPORT_CHUNK_LINES = 5000
+IMPORT_WINDOW = 4
+EXPORT_PAGE_SIZE = 5000
+MAX_REJECTED_LINES = 100
+RELOAD_BATCH_SIZE = 1000
 
 
 class ClientOperations:
@@ -32,13 +51,21 @@ class ClientOperations:
         based on parameter
     print_report(res_data_dict)
         It display customer data based on response from the server
+    print_report_header()
+        It display the header of the customer report
+    print_report_rows(customers)
+        It display the customer rows of one report page
+    print_report_footer()
+        It display the footer of the customer report
     print_response(data_dict)
         It takes response from the server and display to client accordingly
-    validate_age(age)
+    print_invalid(verbose, message)
+        It display why an input is not valid when verbose is True
+    validate_age(age, verbose=True)
         It takes age and return True or False based on validation
-    validate_name(name)
+    validate_name(name, verbose=True)
         It takes name and return True or False based on validation
-    validate_phone(phone)
+    validate_phone(phone, verbose=True)
         It takes phone and return True or False based on validation
     """
 
@@ -124,19 +151,40 @@ class ClientOperations:
         res_data_dict : dict
             The dictionary containing customer data
         """
+        ClientOperations.print_report_header()
+        ClientOperations.print_report_rows(res_data_dict.values())
+        ClientOperations.print_report_footer()
+
+    @staticmethod
+    def print_report_header():
+        """It display the header of the customer report
+        """
         print('---------------------------------------------------------------------------------------------------')
         print('{:<25}{:<10}{:<50}{:<}'.format('name', 'age', 'address',
                                              'phone'))
         print('---------------------------------------------------------------------------------------------------')
 
-        for (key, value_dict) in res_data_dict.items():
-            name = key
+    @staticmethod
+    def print_report_rows(customers):
+        """It display the customer rows of one report page
+
+        Parameters
+        ----------
+        customers : list
+            The list of customer records
+        """
+        for value_dict in customers:
+            name = value_dict.get('name', '')
             age = value_dict.get('age', '')
             address = value_dict.get('address', '')
             phone = value_dict.get('phone', '')
             print('{:<25}{:<10}{:<50}{:<}'.format(name, age, address,
                                                  phone))
 
+    @staticmethod
+    def print_report_footer():
+        """It display the footer of the customer report
+        """
         print('---------------------------------------------------------------------------------------------------')
 
     @staticmethod
@@ -165,13 +213,29 @@ class ClientOperations:
             print('---------------------------------------------------------------------------------------------------')
 
     @staticmethod
-    def validate_age(age):
+    def print_invalid(verbose, message):
+        """It display why an input is not valid when verbose is True
+
+        Parameters
+        ----------
+        verbose : bool
+            Display the message or not
+        message : str
+            The reason the input is not valid
+        """
+        if verbose:
+            ClientOperations.general_print_fun(message)
+
+    @staticmethod
+    def validate_age(age, verbose=True):
         """It takes age and return True or False based on validation
 
         Parameters
         ----------
         age : str
             The age of customer
+        verbose : bool
+            Display the reason when the age is not valid
 
         Returns
         -------
@@ -181,21 +245,23 @@ class ClientOperations:
             try:
                 age = int(age)
                 if age <= 0:
-                    ClientOperations().general_print_fun("Age can't be 0, Please enter valid age")
+                    ClientOperations.print_invalid(verbose, "Age can't be 0, Please enter valid age")
                     return False
             except Exception:
-                ClientOperations().general_print_fun("Please enter valid age")
+                ClientOperations.print_invalid(verbose, "Please enter valid age")
                 return False
         return True
 
     @staticmethod
-    def validate_name(name):
+    def validate_name(name, verbose=True):
         """It takes name and return True or False based on validation
 
         Parameters
         ----------
         name : str
             The name of customer
+        verbose : bool
+            Display the reason when the name is not valid
 
         Returns
         -------
@@ -203,17 +269,19 @@ class ClientOperations:
         """
         if name:
             return True
-        ClientOperations().general_print_fun("Please provide Customer name")
+        ClientOperations.print_invalid(verbose, "Please provide Customer name")
         return False
 
     @staticmethod
-    def validate_phone(phone):
+    def validate_phone(phone, verbose=True):
         """It takes phone and return True or False based on validation
 
         Parameters
         ----------
         phone : str
             The phone of customer
+        verbose : bool
+            Display the reason when the phone is not valid
 
         Returns
         -------
@@ -225,56 +293,693 @@ class ClientOperations:
                 if len(phone_list[0]) == 3:
                     phone_list[0] = int(phone_list[0])
                 else:
-                    ClientOperations().general_print_fun(
+                    ClientOperations.print_invalid(verbose,
                         "Please enter valid phone in XXX XXX-XXXX format or press Enter to leave it empty")
                     return False
                 phone_list = phone_list[1].split("-")
                 if len(phone_list[0]) == 3:
                     phone_list[0] = int(phone_list[0])
                 else:
-                    ClientOperations().general_print_fun(
+                    ClientOperations.print_invalid(verbose,
                         "Please enter valid phone in XXX XXX-XXXX format or press Enter to leave it empty")
                     return False
                 if len(phone_list[1]) == 4:
                     phone_list[1] = int(phone_list[1])
                 else:
-                    ClientOperations().general_print_fun(
+                    ClientOperations.print_invalid(verbose,
                         "Please enter valid phone in XXX XXX-XXXX format or press Enter to leave it empty")
                     return False
             except Exception:
-                ClientOperations().general_print_fun(
+                ClientOperations.print_invalid(verbose,
                     "Please enter valid phone in XXX XXX-XXXX format or press Enter to leave it empty")
                 return False
         return True
 
 
-with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-    sock.connect((HOST_NAME, PORT))
 
-    clientOperations = ClientOperations()
+class ClientError(Exception):
+    """
+    A class used to report a request that can not be sent, because an
+    argument is not valid or the server can not be reached, or whose
+    response is not a valid frame
+    """
+
+
+class Connection:
+    """
+    A class used to send framed requests on one socket
+
+    ...
+    Attributes
+    ----------
+    sock : socket
+        the connected socket
+    reader : FrameReader
+        the frame reader of the socket
+    codec : codec
+        the encoding negotiated with the server
+    compression : str
+        the compression of the large responses negotiated with the
+        server, None when they are not compressed
+
+    Methods
+    -------
+    request(req_dict)
+        It sends one request and returns the response
+    send(req_dict)
+        It sends one request without waiting for the response
+    receive()
+        It returns the response of the oldest request sent
+    request_many(req_dicts)
+        It sends many requests at once and returns the responses in order
+    close()
+        It closes the socket
+    """
+
+    def __init__(self, host=HOST_NAME, port=PORT, encoding=ENCODING,
+                 timeout=None, compression=None):
+        self.sock = socket.create_connection((host, port), timeout)
+        # let the kernel notice a dead server on an idle pooled connection
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = FrameReader()
+        self.codec = JSON_CODEC
+        self.compression = None
+        if encoding != 'json' or compression:
+            # the answer is still JSON, the server switches after sending it
+            res_data_dict = self.request(handshake(encoding, compression))
+            self.codec = CODECS.get(res_data_dict.get('encoding'), JSON_CODEC)
+            self.compression = res_data_dict.get('compression')
+            self.reader.compressed = self.compression is not None
+
+    def request(self, req_dict):
+        """It takes a request, sends it as one frame and returns the
+        response sent by server
+
+        Parameters
+        ----------
+        req_dict : dict
+            The request for the server
+
+        Returns
+        -------
+        dict
+            a dict containing the response from the server
+        """
+        self.send(req_dict)
+        return self.receive()
+
+    def send(self, req_dict):
+        """It takes a request and sends it as one frame, the response is
+        read later with receive
+
+        Parameters
+        ----------
+        req_dict : dict
+            The request for the server
+        """
+        self.sock.sendall(encode_message(req_dict, self.codec))
+
+    def receive(self):
+        """It returns the response of the oldest request whose response
+        was not read yet
+
+        Returns
+        -------
+        dict
+            a dict containing the response from the server
+
+        Raises
+        ------
+        ClientError
+            when the response is too large, compressed without being
+            negotiated or can not be decoded
+        """
+        try:
+            return recv_message(self.sock, self.reader, self.codec)
+        except ValueError as e:
+            raise ClientError('Invalid response: {}'.format(e))
+
+    def request_many(self, req_dicts):
+        """It takes requests, sends them in one write and returns the
+        responses in the order of the requests
+
+        Parameters
+        ----------
+        req_dicts : list
+            The requests for the server
+
+        Returns
+        -------
+        list
+            a list of dicts containing the responses from the server
+        """
+        self.sock.sendall(b''.join(encode_message(req_dict, self.codec)
+                                   for req_dict in req_dicts))
+        return [self.receive() for _ in req_dicts]
+
+    def close(self):
+        """It closes the socket
+        """
+        self.sock.close()
+
+
+def handshake(encoding=ENCODING, compression=None,
+              compress_min=COMPRESSION_THRESHOLD):
+    """It returns the handshake request asking for an encoding and, when
+    compression is given, for compressed responses of at least
+    compress_min bytes"""
+    req_dict = {'choice': HANDSHAKE_CHOICE, 'encodings': [encoding]}
+    if compression:
+        req_dict['compression'] = [compression]
+        req_dict['compress_min'] = compress_min
+    return req_dict
+
+
+def read_chunks(path_name, chunk_lines=IMPORT_CHUNK_LINES):
+    """It reads a data file one chunk of lines at a time, so a file of
+    any size is imported with the memory of one chunk
+
+    Parameters
+    ----------
+    path_name : str
+        The path of the data file
+    chunk_lines : int
+        The number of lines of a chunk
+
+    Returns
+    -------
+    generator
+        a generator of (number of the first line, lines) tuples
+    """
+    with open(path_name, 'r') as data_file:
+        (first_line, lines) = (1, [])
+        for (number, line) in enumerate(data_file, 1):
+            lines.append(line)
+            if len(lines) >= chunk_lines:
+                yield (first_line, lines)
+                (first_line, lines) = (number + 1, [])
+        if lines:
+            yield (first_line, lines)
+
+
+def add_import_result(totals, first_line, res_data_dict):
+    """It adds the response to an import chunk to the totals of the
+    import, the rejected lines are numbered in the whole file"""
+    if not res_data_dict.get('success'):
+        raise ClientError('Import failed: {}'.format(
+            res_data_dict.get('message')))
+    for key in ('accepted', 'duplicates', 'rejected'):
+        totals[key] += res_data_dict.get(key, 0)
+    rejected_lines = totals['rejected_lines']
+    for position in res_data_dict.get('rejected_lines', []):
+        if len(rejected_lines) >= MAX_REJECTED_LINES:
+            break
+        rejected_lines.append(first_line + position)
+
+
+def import_totals():
+    """It returns the empty totals of an import, rejected_lines keeps the
+    numbers of the first MAX_REJECTED_LINES rejected lines"""
+    return {'accepted': 0, 'duplicates': 0, 'rejected': 0,
+            'rejected_lines': []}
+
+
+def export_file(request, path_name, page_size=EXPORT_PAGE_SIZE):
+    """It writes the customer data of the server to a file in the format
+    of the data file, one page at a time
+
+    Parameters
+    ----------
+    request : function
+        The function sending a request and returning the response
+    path_name : str
+        The path of the file written
+    page_size : int
+        The number of customers of one page
+
+    Returns
+    -------
+    int
+        the number of customers written
+    """
+    count = 0
+    req_dict = {'choice': '23', 'page_size': page_size}
+    with open(path_name, 'w') as output_file:
+        while True:
+            res_data_dict = request(req_dict)
+            if 'lines' not in res_data_dict:
+                raise ClientError('Export failed: {}'.format(
+                    res_data_dict.get('message')))
+            output_file.write(res_data_dict['lines'])
+            count += res_data_dict['lines'].count('\n')
+            if not res_data_dict['cursor']:
+                break
+            req_dict['cursor'] = res_data_dict['cursor']
+    return count
+
+
+class ConnectionPool:
+    """
+    A class used to share warm connections between threads. A connection
+    is taken from the pool for one request and given back afterwards, a
+    new one is opened when all of them are busy
+
+    ...
+    Attributes
+    ----------
+    host : str
+        the host of the server
+    port : int
+        the port of the server
+    size : int
+        the largest number of idle connections kept open
+    encoding : str
+        the encoding asked to the server for every connection
+    timeout : float
+        the socket timeout in seconds, None to wait forever
+    compression : str
+        the compression of the large responses asked to the server for
+        every connection, None for none
+
+    Methods
+    -------
+    connection()
+        It lends a connection for the duration of a with block
+    close()
+        It closes all the idle connections
+    """
+
+    def __init__(self, host=HOST_NAME, port=PORT, size=4, encoding=ENCODING,
+                 timeout=None, compression=None):
+        self.host = host
+        self.port = port
+        self.size = size
+        self.encoding = encoding
+        self.timeout = timeout
+        self.compression = compression
+        self.idle = []
+        self.lock = threading.Lock()
+        self.closed = False
+
+    @contextmanager
+    def connection(self):
+        """It lends a connection, from the idle ones when possible, and
+        gives it back to the pool unless the request failed
+
+        Returns
+        -------
+        tuple
+            the connection and True when it was reused from the pool
+        """
+        with self.lock:
+            connection = self.idle.pop() if self.idle else None
+        reused = connection is not None
+        if connection is None:
+            try:
+                connection = Connection(self.host, self.port, self.encoding,
+                                        self.timeout, self.compression)
+            except OSError as e:
+                raise ClientError('Can not connect to {}:{}: {}'.format(
+                    self.host, self.port, e))
+        try:
+            yield (connection, reused)
+        except BaseException:
+            # the state of the stream is unknown, do not reuse it
+            connection.close()
+            raise
+        with self.lock:
+            if not self.closed and len(self.idle) < self.size:
+                self.idle.append(connection)
+                connection = None
+        if connection is not None:
+            connection.close()
+
+    def close(self):
+        """It closes all the idle connections
+        """
+        with self.lock:
+            self.closed = True
+            (idle, self.idle) = (self.idle, [])
+        for connection in idle:
+            connection.close()
+
+
+class CustomerClient:
+    """
+    A class used by applications to call the server without the menu.
+    Every method matches a choice of the server and returns its response.
+    The names, ages and phones are checked with the validators of
+    ClientOperations before anything is sent
+
+    ...
+    Attributes
+    ----------
+    pool : ConnectionPool
+        the connections shared by the threads using the client
+
+    Methods
+    -------
+    request(req_dict)
+        It sends a request on a pooled connection and returns the response
+    get_customer(name)
+        It returns the detail of a customer
+    add_customer(name, age='', address='', phone='')
+        It adds a customer
+    delete_customer(name)
+        It deletes a customer
+    update_customer_age(name, age)
+        It updates the age of a customer
+    update_customer_address(name, address)
+        It updates the address of a customer
+    update_customer_phone(name, phone)
+        It updates the phone of a customer
+    update_customer(name, age=None, address=None, phone=None)
+        It updates any of age, address and phone of a customer at once
+    report(layout='rows')
+        It returns the whole report ordered by customer name, as a dict of
+        the records or ('columns') as one list of values per field
+    report_pages(page_size=REPORT_PAGE_SIZE)
+        It yields the customers of the report one page at a time
+    import_file(path_name, chunk_lines=IMPORT_CHUNK_LINES, window=...)
+        It adds the customers of a data file to the server
+    export_file(path_name, page_size=EXPORT_PAGE_SIZE)
+        It writes the customer data of the server to a data file
+    reload(mode='diff', batch_size=RELOAD_BATCH_SIZE)
+        It asks the server to read its data file again and apply it
+    reload_status()
+        It returns the progress of the last reload of the server
+    write_snapshot()
+        It asks the server to save a snapshot of the customer data
+    get_customers(names)
+        It returns the detail of many customers
+    add_customers(customers)
+        It adds many customers
+    delete_customers(names)
+        It deletes many customers
+    search_customers(prefix, limit=None, case_sensitive=False)
+        It returns the customers whose name starts with a prefix
+    find_by_phone(phone, limit=None)
+        It returns the customers with a phone
+    find_by_age(min_age, max_age, limit=None)
+        It returns the customers in an age range
+    find_by_address(words, limit=None)
+        It returns the customers whose address has all the words
+    stats()
+        It returns the metrics of the server
+    profile(action='dump', sample_every=100, keep=20)
+        It switches the request profiler of the server on/off or returns
+        its results
+    close()
+        It closes the connections of the pool
+    """
+
+    # the choices that give the same result when they are sent twice, they
+    # are sent again on a new connection when a pooled one turns out dead
+    RETRY_CHOICES = {'1', '4', '5', '6', '7', '10', '13', '14', '15', '16',
+                     '17', '19', '23'}
+
+    def __init__(self, host=HOST_NAME, port=PORT, pool_size=4,
+                 encoding=ENCODING, timeout=None, compression=None):
+        self.pool = ConnectionPool(host, port, pool_size, encoding, timeout,
+                                   compression)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def request(self, req_dict):
+        """It takes a request, sends it on a pooled connection and returns
+        the response sent by server
+
+        Parameters
+        ----------
+        req_dict : dict
+            The request for the server
+
+        Returns
+        -------
+        dict
+            a dict containing the response from the server
+        """
+        try:
+            with self.pool.connection() as (connection, reused):
+                return connection.request(req_dict)
+        except OSError as e:
+            # the server may have closed an idle connection, reconnect once
+            if not reused or req_dict.get('choice') not in self.RETRY_CHOICES:
+                raise ClientError('Request failed: {}'.format(e))
+        try:
+            with self.pool.connection() as (connection, reused):
+                return connection.request(req_dict)
+        except OSError as e:
+            raise ClientError('Request failed: {}'.format(e))
+
+    @staticmethod
+    def check(name=None, age='', phone=''):
+        if name is not None and not ClientOperations.validate_name(
+                name, verbose=False):
+            raise ClientError('Please provide Customer name')
+        if not ClientOperations.validate_age(age, verbose=False):
+            raise ClientError('Invalid age: {}'.format(age))
+        if not ClientOperations.validate_phone(phone, verbose=False):
+            raise ClientError('Invalid phone, expected XXX XXX-XXXX: {}'.format(
+                phone))
+
+    def get_customer(self, name):
+        self.check(name)
+        return self.request({'choice': '1', 'name': name})
+
+    def add_customer(self, name, age='', address='', phone=''):
+        self.check(name, age, phone)
+        return self.request({'choice': '2', 'name': name, 'age': age,
+                             'address': address, 'phone': phone})
+
+    def delete_customer(self, name):
+        self.check(name)
+        return self.request({'choice': '3', 'name': name})
+
+    def update_customer_age(self, name, age):
+        self.check(name, age)
+        return self.request({'choice': '4', 'name': name, 'age': age})
+
+    def update_customer_address(self, name, address):
+        self.check(name)
+        return self.request({'choice': '5', 'name': name,
+                             'address': address})
+
+    def update_customer_phone(self, name, phone):
+        self.check(name, phone=phone)
+        return self.request({'choice': '6', 'name': name, 'phone': phone})
+
+    def update_customer(self, name, age=None, address=None, phone=None):
+        self.check(name, age or '', phone or '')
+        req_dict = {'choice': '13', 'name': name}
+        for (field, value) in (('age', age), ('address', address),
+                               ('phone', phone)):
+            if value is not None:
+                req_dict[field] = value
+        return self.request(req_dict)
 
-    def fetch_data(sock):
-        """It takes socket object and returns the data sent by server
-        this method is in use when data/package length is more than BUFF_SIZE
+    def report(self, layout='rows'):
+        req_dict = {'choice': '7'}
+        if layout != 'rows':
+            req_dict['layout'] = layout
+        return self.request(req_dict)
+
+    def report_pages(self, page_size=REPORT_PAGE_SIZE):
+        """It yields the customers of the report one page at a time, in
+        the order of the customer names
 
         Parameters
         ----------
-        sock : socket
-            The socket class object
+        page_size : int
+            The number of customers of one page
 
         Returns
         -------
-        bytes
-            a byte string containing the response from the server
+        generator
+            a generator of lists of customer records
         """
-        data_dict = b''
+        req_dict = {'choice': '7', 'page_size': page_size}
         while True:
-            packet = sock.recv(BUFF_SIZE)
-            data_dict += packet
-            if BUFF_SIZE > len(packet):
+            res_data_dict = self.request(req_dict)
+            if res_data_dict.get('message'):
+                raise ClientError(res_data_dict['message'])
+            yield res_data_dict.get('customers', [])
+            if not res_data_dict.get('cursor'):
                 break
-        return data_dict
+            req_dict['cursor'] = res_data_dict['cursor']
+
+    def import_file(self, path_name, chunk_lines=IMPORT_CHUNK_LINES,
+                    window=IMPORT_WINDOW):
+        """It sends the lines of a data file to the server in chunks, a
+        few chunks are sent before waiting for their responses. The
+        server parses them like its data file at startup
+
+        Parameters
+        ----------
+        path_name : str
+            The path of the data file
+        chunk_lines : int
+            The number of lines of a chunk
+        window : int
+            The number of chunks sent before waiting for a response
+
+        Returns
+        -------
+        dict
+            a dict containing the number of customers accepted, of
+            duplicates and of lines rejected, with the numbers of the
+            first rejected lines
+        """
+        totals = import_totals()
+        try:
+            with self.pool.connection() as (connection, reused):
+                pending = deque()
+                for (first_line, lines) in read_chunks(path_name,
+                                                       chunk_lines):
+                    connection.send({'choice': '22', 'lines': lines})
+                    pending.append(first_line)
+                    if len(pending) >= window:
+                        add_import_result(totals, pending.popleft(),
+                                          connection.receive())
+                while pending:
+                    add_import_result(totals, pending.popleft(),
+                                      connection.receive())
+        except OSError as e:
+            raise ClientError('Import failed: {}'.format(e))
+        return totals
+
+    def export_file(self, path_name, page_size=EXPORT_PAGE_SIZE):
+        return export_file(self.request, path_name, page_size)
+
+    def reload(self, mode='diff', batch_size=RELOAD_BATCH_SIZE):
+        return self.request({'choice': '24', 'action': 'start',
+                             'mode': mode, 'batch_size': batch_size})
+
+    def reload_status(self):
+        return self.request({'choice': '24', 'action': 'status'})
+
+    def write_snapshot(self):
+        return self.request({'choice': '9'})
+
+    def get_customers(self, names):
+        return self.request({'choice': '10', 'names': list(names)})
+
+    def add_customers(self, customers):
+        customers = list(customers)
+        for customer in customers:
+            self.check(customer.get('name', ''), customer.get('age', ''),
+                       customer.get('phone', ''))
+        return self.request({'choice': '11', 'customers': customers})
+
+    def delete_customers(self, names):
+        return self.request({'choice': '12', 'names': list(names)})
+
+    def search_customers(self, prefix, limit=None, case_sensitive=False):
+        req_dict = {'choice': '14', 'prefix': prefix,
+                    'case_sensitive': case_sensitive}
+        if limit is not None:
+            req_dict['limit'] = limit
+        return self.request(req_dict)
+
+    def find_by_phone(self, phone, limit=None):
+        req_dict = {'choice': '15', 'phone': phone}
+        if limit is not None:
+            req_dict['limit'] = limit
+        return self.request(req_dict)
+
+    def find_by_age(self, min_age, max_age, limit=None):
+        req_dict = {'choice': '16', 'min_age': min_age, 'max_age': max_age}
+        if limit is not None:
+            req_dict['limit'] = limit
+        return self.request(req_dict)
+
+    def find_by_address(self, words, limit=None):
+        req_dict = {'choice': '17', 'address': words}
+        if limit is not None:
+            req_dict['limit'] = limit
+        return self.request(req_dict)
+
+    def stats(self):
+        return self.request({'choice': '19'})
 
+    def profile(self, action='dump', sample_every=100, keep=20):
+        return self.request({'choice': '20', 'action': action,
+                             'sample_every': sample_every, 'keep': keep})
+
+    def close(self):
+        """It closes the connections of the pool
+        """
+        self.pool.close()
+
+
+def parse_args(argv=None):
+    """It takes the command line arguments and return the client options
+
+    Parameters
+    ----------
+    argv : list
+        The command line arguments, sys.argv when None
+
+    Returns
+    -------
+    argparse.Namespace
+        the options of the client
+    """
+    parser = argparse.ArgumentParser(description='Customer database client')
+    parser.add_argument('--host', default=HOST_NAME)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--encoding', default=ENCODING,
+                        choices=sorted(CODECS),
+                        help='encoding negotiated with the server')
+    parser.add_argument('--compression', choices=COMPRESSIONS,
+                        help='ask the server to compress the large '
+                             'responses (the report)')
+    parser.add_argument('--import', dest='import_path', metavar='FILE',
+                        help='add the customers of a data file to the '
+                             'server and exit')
+    parser.add_argument('--export', dest='export_path', metavar='FILE',
+                        help='write the customer data of the server to a '
+                             'data file and exit')
+    return parser.parse_args(argv)
+
+
+def run_transfer(args):
+    """It runs the import and/or export asked on the command line
+    """
+    with CustomerClient(args.host, args.port, 1, args.encoding,
+                        compression=args.compression) as customer_client:
+        try:
+            if args.import_path:
+                totals = customer_client.import_file(args.import_path)
+                print('{accepted} customers imported, {duplicates} already '
+                      'existed, {rejected} lines rejected'.format(**totals))
+                if totals['rejected_lines']:
+                    print('Rejected lines: {}'.format(', '.join(
+                        str(number) for number in totals['rejected_lines'])))
+            if args.export_path:
+                count = customer_client.export_file(args.export_path)
+                print('{} customers exported to {}'.format(
+                    count, args.export_path))
+        except (ClientError, OSError) as e:
+            print(e)
+
+
+def main(argv=None):
+    """It runs the interactive menu of the client
+    """
+    args = parse_args(argv)
+    if args.import_path or args.export_path:
+        run_transfer(args)
+        return
+    connection = Connection(args.host, args.port, args.encoding,
+                            compression=args.compression)
+
+    clientOperations = ClientOperations()
 
     isExit = False
 
@@ -295,8 +1000,7 @@ with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
                 name = clientOperations.get_input('name').strip()
             if is_sendto:
                 req_dict = {'choice': choice, 'name': name}
-                sock.sendall(json.dumps(req_dict).encode('utf-8'))
-                res_data_dict = json.loads(sock.recv(BUFF_SIZE).decode('utf-8'))
+                res_data_dict = connection.request(req_dict)
                 clientOperations.print_response(res_data_dict)
 
         elif choice in ['2', 2]:
@@ -336,8 +1040,7 @@ with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
                     'address': address,
                     'phone': phone,
                 }
-                sock.sendall(json.dumps(req_dict).encode('utf-8'))
-                res_data_dict = json.loads(sock.recv(BUFF_SIZE).decode('utf-8'))
+                res_data_dict = connection.request(req_dict)
                 clientOperations.print_response(res_data_dict)
 
         elif choice in ['3', 3]:
@@ -352,8 +1055,7 @@ with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
                 name = clientOperations.get_input('name').strip()
             if is_sendto:
                 req_dict = {'choice': choice, 'name': name}
-                sock.sendall(json.dumps(req_dict).encode('utf-8'))
-                res_data_dict = json.loads(sock.recv(BUFF_SIZE).decode('utf-8'))
+                res_data_dict = connection.request(req_dict)
                 clientOperations.print_response(res_data_dict)
 
         elif choice in ['4', 4]:
@@ -376,8 +1078,7 @@ with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
                     age = clientOperations.get_input('age or press Enter to leave it empty').strip()
             if is_sendto:
                 req_dict = {'choice': choice, 'name': name, 'age': age}
-                sock.sendall(json.dumps(req_dict).encode('utf-8'))
-                res_data_dict = json.loads(sock.recv(BUFF_SIZE).decode('utf-8'))
+                res_data_dict = connection.request(req_dict)
                 clientOperations.print_response(res_data_dict)
 
         elif choice in ['5', 5]:
@@ -393,8 +1094,7 @@ with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
             address = clientOperations.get_input('address or press Enter to leave it empty').strip()
             req_dict = {'choice': choice, 'name': name,
                         'address': address}
-            sock.sendall(json.dumps(req_dict).encode('utf-8'))
-            res_data_dict = json.loads(sock.recv(BUFF_SIZE).decode('utf-8'))
+            res_data_dict = connection.request(req_dict)
             clientOperations.print_response(res_data_dict)
 
         elif choice in ['6', 6]:
@@ -419,16 +1119,25 @@ with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
                         'phone in XXX XXX-XXXX format or press Enter to leave it empty').strip()
             if is_sendto:
                 req_dict = {'choice': choice, 'name': name, 'phone': phone}
-                sock.sendall(json.dumps(req_dict).encode('utf-8'))
-                res_data_dict = json.loads(sock.recv(BUFF_SIZE).decode('utf-8'))
+                res_data_dict = connection.request(req_dict)
                 clientOperations.print_response(res_data_dict)
 
         elif choice in ['7', 7]:
-            # To sort and return customer data
-            req_dict = {'choice': choice}
-            sock.sendall(json.dumps(req_dict).encode('utf-8'))
-            res_data_dict = json.loads(fetch_data(sock).decode('utf-8'))
-            clientOperations.print_report(res_data_dict)
+            # To sort and return customer data, rows are displayed page
+            # by page as they arrive from the server
+            req_dict = {'choice': choice, 'page_size': REPORT_PAGE_SIZE}
+            clientOperations.print_report_header()
+            while True:
+                res_data_dict = connection.request(req_dict)
+                if res_data_dict.get('message'):
+                    clientOperations.general_print_fun(res_data_dict['message'])
+                    break
+                clientOperations.print_report_rows(
+                    res_data_dict.get('customers', []))
+                if not res_data_dict.get('cursor'):
+                    break
+                req_dict['cursor'] = res_data_dict['cursor']
+            clientOperations.print_report_footer()
 
         elif choice in ['8', 8]:
             # To exit the client app
@@ -439,4 +1148,8 @@ with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
             clientOperations.general_print_fun('Select valid option')
 
     if isExit:
-        sock.close()
+        connection.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,243 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# ----- Program Details -----
+# Secondary indexes used by the server to find customers by something else
+# than their name. They are opt-in and are kept up to date by the methods
+# of ServerOperations that add, delete and update customers.
+
+# The bisect module keeps the age index ordered on insert/delete
+import bisect
+# The re module splits the addresses into words
+import re
+
+INDEX_FIELDS = ('phone', 'age', 'address')
+WORD_PATTERN = re.compile(r'\w+')
+
+
+def index_age(age):
+    """It takes an age and return it as an integer for the age index, or
+    None when it is not an integer
+
+    Parameters
+    ----------
+    age : int or str
+        The age of the customer
+
+    Returns
+    -------
+    int
+        the integer age or None
+    """
+    if isinstance(age, bool):
+        return None
+    if isinstance(age, int):
+        return age
+    try:
+        return int(str(age).strip())
+    except ValueError:
+        return None
+
+
+def address_words(address):
+    """It takes an address and return its distinct lower case words
+
+    Parameters
+    ----------
+    address : str
+        The address of the customer
+
+    Returns
+    -------
+    set
+        a set of words
+    """
+    return set(WORD_PATTERN.findall(str(address).lower()))
+
+
+class SecondaryIndexes:
+    """
+    A class used to index the customers by phone, age and address words
+
+    ...
+    Attributes
+    ----------
+    fields : tuple
+        the indexed fields, any of 'phone', 'age' and 'address'
+    phone_index : dict
+        a hash index of phone to the set of customer names
+    age_index : list
+        a sorted list of (age, lower case name, name) tuples for the
+        integer ages, the customers of an age come in the order of the
+        sorted name index
+    address_index : dict
+        a token index of lower case address word to the set of names
+
+    Methods
+    -------
+    add(record)
+        It adds a customer record to the indexes
+    remove(record)
+        It removes a customer record from the indexes
+    rebuild(records)
+        It builds the indexes again from all the customer records
+    find_phone(phone)
+        It returns the names of the customers with the phone
+    find_age_range(min_age, max_age, limit)
+        It returns the names of the customers with an age in the range
+    find_address(words)
+        It returns the names of the customers whose address has all words
+    """
+
+    def __init__(self, fields=INDEX_FIELDS):
+        for field in fields:
+            if field not in INDEX_FIELDS:
+                raise ValueError('Unknown index: {}'.format(field))
+        self.fields = tuple(fields)
+        self.phone_index = {}
+        self.age_index = []
+        self.address_index = {}
+
+    def add(self, record):
+        """It adds a customer record to the indexes
+
+        Parameters
+        ----------
+        record : Customer
+            The customer record
+        """
+        name = record.name
+        if 'phone' in self.fields and record.phone:
+            self.phone_index.setdefault(record.phone, set()).add(name)
+        if 'age' in self.fields:
+            age = index_age(record.age)
+            if age is not None:
+                bisect.insort(self.age_index, (age, name.lower(), name))
+        if 'address' in self.fields:
+            for word in address_words(record.address):
+                self.address_index.setdefault(word, set()).add(name)
+
+    def remove(self, record):
+        """It removes a customer record from the indexes, values that are
+        not indexed are ignored
+
+        Parameters
+        ----------
+        record : Customer
+            The customer record
+        """
+        name = record.name
+        if 'phone' in self.fields and record.phone:
+            self.discard(self.phone_index, record.phone, name)
+        if 'age' in self.fields:
+            age = index_age(record.age)
+            if age is not None:
+                key = (age, name.lower(), name)
+                position = bisect.bisect_left(self.age_index, key)
+                if position < len(self.age_index) \
+                        and self.age_index[position] == key:
+                    del self.age_index[position]
+        if 'address' in self.fields:
+            for word in address_words(record.address):
+                self.discard(self.address_index, word, name)
+
+    @staticmethod
+    def discard(index, key, name):
+        names = index.get(key)
+        if names is not None:
+            names.discard(name)
+            if not names:
+                del index[key]
+
+    def rebuild(self, records):
+        """It builds the indexes again from all the customer records
+
+        Parameters
+        ----------
+        records : iterable
+            The customer records
+        """
+        self.phone_index = {}
+        self.address_index = {}
+        age_index = []
+        for record in records:
+            name = record.name
+            if 'phone' in self.fields and record.phone:
+                self.phone_index.setdefault(record.phone, set()).add(name)
+            if 'age' in self.fields:
+                age = index_age(record.age)
+                if age is not None:
+                    age_index.append((age, name.lower(), name))
+            if 'address' in self.fields:
+                for word in address_words(record.address):
+                    self.address_index.setdefault(word, set()).add(name)
+        age_index.sort()
+        self.age_index = age_index
+
+    def find_phone(self, phone):
+        """It returns the names of the customers with the phone
+
+        Parameters
+        ----------
+        phone : str
+            The phone of the customer
+
+        Returns
+        -------
+        set
+            a set of customer names
+        """
+        return set(self.phone_index.get(phone, ()))
+
+    def find_age_range(self, min_age, max_age, limit):
+        """It returns the names of the customers with an age between
+        min_age and max_age (both included), ordered by age and name
+        (case insensitive)
+
+        Parameters
+        ----------
+        min_age : int
+            The lowest age
+        max_age : int
+            The highest age
+        limit : int
+            The largest number of names returned
+
+        Returns
+        -------
+        list
+            a list of customer names
+        """
+        start = bisect.bisect_left(self.age_index, (min_age, ))
+        names = []
+        for (age, _, name) in self.age_index[start:start + limit]:
+            if age > max_age:
+                break
+            names.append(name)
+        return names
+
+    def find_address(self, words):
+        """It returns the names of the customers whose address contains
+        all the words (case insensitive)
+
+        Parameters
+        ----------
+        words : str
+            The words to look for
+
+        Returns
+        -------
+        set
+            a set of customer names
+        """
+        words = sorted(address_words(words),
+                       key=lambda word: len(self.address_index.get(word, ())))
+        if not words:
+            return set()
+        # intersect starting with the rarest word
+        names = set(self.address_index.get(words[0], ()))
+        for word in words[1:]:
+            if not names:
+                break
+            names &= self.address_index.get(word, set())
+        return names
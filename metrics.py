@@ -0,0 +1,334 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# ----- Program Details -----
+# Request metrics of the server: request and error counts and a latency
+# histogram per choice, the open connections and the bytes received and
+# sent. They are returned by the stats choice and can be dumped as plain
+# text (Prometheus text format) on a local port.
+
+# The bisect module finds the histogram bucket of a latency
+import bisect
+# The threading module protects the counters shared by the serving threads
+import threading
+# The socketserver module serves the plain-text metrics dump
+import socketserver
+import time
+
+# upper bounds of the latency buckets in seconds, the last bucket is +Inf
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """
+    A class used to count latencies in fixed buckets
+
+    ...
+    Attributes
+    ----------
+    counts : list
+        the number of latencies of every bucket, the last one is +Inf
+    total : float
+        the sum of all the latencies in seconds
+
+    Methods
+    -------
+    add(seconds)
+        It counts one latency
+    count()
+        It returns the number of latencies
+    percentile(pct)
+        It returns the upper bound of the bucket holding the percentile
+    """
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0.0
+
+    def add(self, seconds):
+        """It counts one latency
+
+        Parameters
+        ----------
+        seconds : float
+            The latency in seconds
+        """
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.total += seconds
+
+    def count(self):
+        """It returns the number of latencies
+
+        Returns
+        -------
+        int
+            the number of latencies counted
+        """
+        return sum(self.counts)
+
+    def percentile(self, pct):
+        """It returns the upper bound of the bucket holding the pct
+        percentile, an estimate never lower than the real value
+
+        Parameters
+        ----------
+        pct : float
+            The percentile, between 0 and 100
+
+        Returns
+        -------
+        float
+            the latency in seconds, None when nothing was counted
+        """
+        count = self.count()
+        if not count:
+            return None
+        rank = pct / 100.0 * count
+        seen = 0
+        for (position, bucket_count) in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank and bucket_count:
+                if position < len(LATENCY_BUCKETS):
+                    return LATENCY_BUCKETS[position]
+                return float('inf')
+        return float('inf')
+
+
+class ServerMetrics:
+    """
+    A class used to count what the server is doing
+
+    ...
+    Attributes
+    ----------
+    started : float
+        the time the metrics were created
+    requests : dict
+        the number of requests per choice
+    errors : dict
+        the number of requests per choice that failed (invalid request,
+        invalid choice or an error raised while serving it)
+    latencies : dict
+        the latency Histogram per choice
+    active_connections : int
+        the number of client connections open now
+    connections_total : int
+        the number of client connections accepted
+    connection_errors : int
+        the number of connections closed by an unexpected error
+    bytes_received : int
+        the number of request bytes received, frame headers included
+    bytes_sent : int
+        the number of response bytes sent, frame headers included
+
+    Methods
+    -------
+    connection_opened()
+        It counts a new client connection
+    connection_closed(error=False)
+        It counts a closed client connection
+    record(choice, seconds, bytes_received, bytes_sent, error=False)
+        It counts one request
+    stats(extra)
+        It returns the metrics as a dict
+    render_text(extra)
+        It returns the metrics in the Prometheus text format
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.requests = {}
+        self.errors = {}
+        self.latencies = {}
+        self.active_connections = 0
+        self.connections_total = 0
+        self.connection_errors = 0
+        self.bytes_received = 0
+        self.bytes_sent = 0
+
+    def connection_opened(self):
+        """It counts a new client connection
+        """
+        with self.lock:
+            self.active_connections += 1
+            self.connections_total += 1
+
+    def connection_closed(self, error=False):
+        """It counts a closed client connection
+
+        Parameters
+        ----------
+        error : bool
+            True when the connection was closed by an unexpected error
+        """
+        with self.lock:
+            self.active_connections -= 1
+            if error:
+                self.connection_errors += 1
+
+    def record(self, choice, seconds, bytes_received, bytes_sent,
+               error=False):
+        """It counts one request
+
+        Parameters
+        ----------
+        choice : str
+            The choice of the request, 'invalid' when there is none
+        seconds : float
+            The time spent serving the request
+        bytes_received : int
+            The size of the request frame
+        bytes_sent : int
+            The size of the response frame
+        error : bool
+            True when the request failed
+        """
+        with self.lock:
+            self.requests[choice] = self.requests.get(choice, 0) + 1
+            if error:
+                self.errors[choice] = self.errors.get(choice, 0) + 1
+            histogram = self.latencies.get(choice)
+            if histogram is None:
+                histogram = self.latencies[choice] = Histogram()
+            histogram.add(seconds)
+            self.bytes_received += bytes_received
+            self.bytes_sent += bytes_sent
+
+    def stats(self, extra=None):
+        """It returns the metrics as a dict, with the latency percentiles
+        of every choice in milliseconds
+
+        Parameters
+        ----------
+        extra : dict
+            More values to return, like the number of customers
+
+        Returns
+        -------
+        dict
+            a dict containing the metrics
+        """
+        with self.lock:
+            choices = {}
+            for (choice, count) in self.requests.items():
+                histogram = self.latencies[choice]
+                choices[choice] = {
+                    'requests': count,
+                    'errors': self.errors.get(choice, 0),
+                    'mean_ms': 1000 * histogram.total / count,
+                    'p50_ms': milliseconds(histogram.percentile(50)),
+                    'p95_ms': milliseconds(histogram.percentile(95)),
+                    'p99_ms': milliseconds(histogram.percentile(99)),
+                }
+            stats_dict = {
+                'uptime': time.time() - self.started,
+                'active_connections': self.active_connections,
+                'connections_total': self.connections_total,
+                'connection_errors': self.connection_errors,
+                'bytes_received': self.bytes_received,
+                'bytes_sent': self.bytes_sent,
+                'choices': choices,
+            }
+        stats_dict.update(extra or {})
+        return stats_dict
+
+    def render_text(self, extra=None):
+        """It returns the metrics in the Prometheus text format
+
+        Parameters
+        ----------
+        extra : dict
+            More gauges to dump, name to number
+
+        Returns
+        -------
+        str
+            the metrics, one per line
+        """
+        lines = []
+        with self.lock:
+            lines.append('server_uptime_seconds {:.3f}'.format(
+                time.time() - self.started))
+            lines.append('server_active_connections {}'.format(
+                self.active_connections))
+            lines.append('server_connections_total {}'.format(
+                self.connections_total))
+            lines.append('server_connection_errors_total {}'.format(
+                self.connection_errors))
+            lines.append('server_bytes_received_total {}'.format(
+                self.bytes_received))
+            lines.append('server_bytes_sent_total {}'.format(self.bytes_sent))
+            for choice in sorted(self.requests):
+                label = '{{choice="{}"}}'.format(choice)
+                lines.append('server_requests_total{} {}'.format(
+                    label, self.requests[choice]))
+                lines.append('server_request_errors_total{} {}'.format(
+                    label, self.errors.get(choice, 0)))
+                histogram = self.latencies[choice]
+                seen = 0
+                for (bound, count) in zip(LATENCY_BUCKETS + ('+Inf', ),
+                                          histogram.counts):
+                    seen += count
+                    lines.append(
+                        'server_request_seconds_bucket{{choice="{}",'
+                        'le="{}"}} {}'.format(choice, bound, seen))
+                lines.append('server_request_seconds_sum{} {:.6f}'.format(
+                    label, histogram.total))
+                lines.append('server_request_seconds_count{} {}'.format(
+                    label, seen))
+        for (name, value) in sorted((extra or {}).items()):
+            lines.append('server_{} {}'.format(name, value))
+        return '\n'.join(lines) + '\n'
+
+
+def milliseconds(seconds):
+    if seconds is None:
+        return None
+    return 1000 * seconds
+
+
+class MetricsHandler(socketserver.BaseRequestHandler):
+    """
+    A class used to send the plain-text metrics dump to one connection.
+    A plain TCP client (nc) gets the text only, an HTTP GET (curl or a
+    Prometheus scraper) gets it with an HTTP response header
+    """
+
+    def handle(self):
+        self.request.settimeout(0.5)
+        try:
+            first = self.request.recv(4096)
+        except OSError:
+            first = b''
+        body = self.server.render().encode('utf-8')
+        if first.startswith(b'GET'):
+            body = ('HTTP/1.0 200 OK\r\n'
+                    'Content-Type: text/plain; version=0.0.4\r\n'
+                    'Content-Length: {}\r\n\r\n'.format(len(body))
+                    ).encode('ascii') + body
+        self.request.sendall(body)
+
+
+class MetricsServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """
+    A class used to serve the plain-text metrics dump on a local port
+
+    ...
+    Attributes
+    ----------
+    render : function
+        the function returning the metrics text
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, server_address, render):
+        socketserver.TCPServer.__init__(self, server_address, MetricsHandler)
+        self.render = render
+
+    def start(self):
+        """It serves the metrics dump from a background thread
+        """
+        threading.Thread(target=self.serve_forever, daemon=True).start()
@@ -0,0 +1,186 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# ----- Program Details -----
+# Opt-in request profiler of the server. When it is switched on (profile
+# choice or --profile option) every request is timed phase by phase:
+# decode of the request, dispatch to ServerOperations, encode of the
+# response and send of the batch of responses it was part of. The slowest
+# requests are kept with their breakdown and every Nth request is also
+# run under cProfile. When it is off the server only checks one flag.
+
+# The cProfile and pstats modules profile the sampled requests
+import cProfile
+import pstats
+# The heapq module keeps the slowest requests
+import heapq
+import io
+import itertools
+# The threading module protects the profiler shared by the serving threads
+import threading
+import time
+
+PHASES = ('decode', 'dispatch', 'encode', 'send')
+PROFILE_LINES = 15
+
+
+class RequestProfiler:
+    """
+    A class used to time the phases of the requests
+
+    ...
+    Attributes
+    ----------
+    enabled : bool
+        True while the requests are profiled
+    sample_every : int
+        every how many profiled requests one runs under cProfile, 0 for
+        none
+    keep : int
+        the number of slowest requests kept
+    slowest : list
+        a heap of the (total seconds, sequence, request record) of the
+        slowest requests
+    phase_totals : dict
+        the request count and the seconds spent in every phase, per choice
+
+    Methods
+    -------
+    start(sample_every=100, keep=20)
+        It switches the profiler on, with empty results
+    stop()
+        It switches the profiler off, the results are kept
+    run(function)
+        It runs the dispatch of a request, under cProfile when sampled
+    finish(records, send_seconds)
+        It adds the send time to the records of a batch and keeps them
+    report()
+        It returns the results as a dict
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.sample_every = 0
+        self.keep = 0
+        self.lock = threading.Lock()
+        # only one cProfile can run at a time
+        self.cprofile_lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.slowest = []
+        self.phase_totals = {}
+        self.sequence = 0
+        self.finished = itertools.count()
+        self.started = time.time()
+
+    def start(self, sample_every=100, keep=20):
+        """It switches the profiler on, with empty results
+
+        Parameters
+        ----------
+        sample_every : int
+            Every how many requests one runs under cProfile, 0 for none
+        keep : int
+            The number of slowest requests kept
+        """
+        with self.lock:
+            self.sample_every = max(0, int(sample_every))
+            self.keep = max(1, int(keep))
+            self.reset()
+            self.enabled = True
+
+    def stop(self):
+        """It switches the profiler off, the results are kept
+        """
+        self.enabled = False
+
+    def run(self, function):
+        """It runs the dispatch of a request and return its result with
+        the cProfile statistics when the request is sampled
+
+        Parameters
+        ----------
+        function : function
+            The function dispatching the request
+
+        Returns
+        -------
+        tuple
+            the result of the function and the profile text or None
+        """
+        with self.lock:
+            self.sequence += 1
+            sampled = self.sample_every \
+                and self.sequence % self.sample_every == 0
+        if not sampled or not self.cprofile_lock.acquire(blocking=False):
+            return (function(), None)
+        try:
+            profile = cProfile.Profile()
+            result = profile.runcall(function)
+        finally:
+            self.cprofile_lock.release()
+        text = io.StringIO()
+        pstats.Stats(profile, stream=text).sort_stats(
+            'cumulative').print_stats(PROFILE_LINES)
+        return (result, text.getvalue())
+
+    def finish(self, records, send_seconds):
+        """It adds the send time of a batch of responses to the records of
+        its requests and keeps the slowest ones
+
+        Parameters
+        ----------
+        records : list
+            The records of the requests of the batch, emptied
+        send_seconds : float
+            The time spent sending the batch
+        """
+        with self.lock:
+            for record in records:
+                record['send'] = send_seconds
+                total = sum(record[phase] for phase in PHASES)
+                totals = self.phase_totals.setdefault(
+                    record['choice'], dict.fromkeys(('requests', ) + PHASES,
+                                                    0))
+                totals['requests'] += 1
+                for phase in PHASES:
+                    totals[phase] += record[phase]
+                entry = (total, next(self.finished), record)
+                if len(self.slowest) < self.keep:
+                    heapq.heappush(self.slowest, entry)
+                elif total > self.slowest[0][0]:
+                    heapq.heapreplace(self.slowest, entry)
+        del records[:]
+
+    def report(self):
+        """It returns the slowest requests with their phase breakdown in
+        milliseconds, and the time spent in every phase per choice
+
+        Returns
+        -------
+        dict
+            a dict containing the profiler results
+        """
+        with self.lock:
+            slowest = sorted(self.slowest, key=lambda entry: -entry[0])
+            requests = []
+            for (total, _, record) in slowest:
+                request = {'choice': record['choice'],
+                           'time': record['time'],
+                           'total_ms': 1000 * total}
+                for phase in PHASES:
+                    request[phase + '_ms'] = 1000 * record[phase]
+                request['profile'] = record['profile']
+                requests.append(request)
+            phases = {}
+            for (choice, totals) in self.phase_totals.items():
+                phases[choice] = {'requests': totals['requests']}
+                for phase in PHASES:
+                    phases[choice][phase + '_ms'] = 1000 * totals[phase] \
+                        / totals['requests']
+            return {'enabled': self.enabled,
+                    'since': self.started,
+                    'sample_every': self.sample_every,
+                    'mean_by_choice': phases,
+                    'slowest': requests}
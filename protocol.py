@@ -0,0 +1,695 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# ----- Program Details -----
+# Wire protocol shared by the server and the client.
+# Every message is sent as a frame: a 4 byte big-endian payload length
+# followed by the payload. Framing lets a client pipeline many requests on
+# one connection and makes the receiver independent of how TCP splits or
+# coalesces the segments.
+# The payload is UTF-8 encoded JSON unless the client negotiated another
+# encoding with the handshake choice: 'binary' is a compact format built
+# with struct, 'msgpack' is offered when the msgpack package is installed.
+# The handshake can also ask for compressed responses: a payload of at
+# least compress_min bytes is then sent zlib-compressed, flagged by the
+# high bit of the frame length. Small replies are sent as they are.
+
+# The struct module is used to pack/unpack the fixed size frame header
+import struct
+# The JSON module is mainly used to convert the python dictionary above
+# into a JSON string that can be transmitted over the network
+import json
+# The zlib module compresses the large payloads
+import zlib
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+BUFF_SIZE = 65536
+HEADER = struct.Struct('!I')
+# the largest payload accepted, a bigger length in a header is an error
+# rather than a reason to buffer gigabytes
+MAX_FRAME_SIZE = 1 << 28
+# the high bit of the frame length marks a zlib-compressed payload
+COMPRESSED = 0x80000000
+COMPRESSIONS = ('zlib', )
+COMPRESSION_THRESHOLD = 1024
+COMPRESSION_LEVEL = 6
+HANDSHAKE_CHOICE = '18'
+RECORD_KEYS = ('name', 'age', 'address', 'phone')
+
+
+class JsonCodec:
+    """
+    A class used to encode the messages as UTF-8 encoded JSON
+    """
+    name = 'json'
+
+    @staticmethod
+    def encode(data):
+        return json.dumps(data).encode('utf-8')
+
+    @staticmethod
+    def decode(payload):
+        return json.loads(payload.decode('utf-8'))
+
+
+class MsgpackCodec:
+    """
+    A class used to encode the messages with the msgpack package
+    """
+    name = 'msgpack'
+
+    @staticmethod
+    def encode(data):
+        return msgpack.packb(data, use_bin_type=True)
+
+    @staticmethod
+    def decode(payload):
+        try:
+            return msgpack.unpackb(payload, raw=False)
+        except Exception as e:
+            raise ValueError('Invalid msgpack payload: {}'.format(e))
+
+
+class BinaryCodec:
+    """
+    A class used to encode the messages in a compact binary format
+
+    A payload holds a table of all its strings, then the structure of the
+    message. The strings are joined by NUL characters and UTF-8 encoded,
+    so the whole table is decoded and split by two C calls (a table of
+    lengths is used when a string holds a NUL). The structure is a stream
+    of 1 byte tags: None, booleans, 4/8 byte integers, larger integers,
+    8 byte floats, strings (the next one of the table), lists and maps.
+    The work per value is kept in C for the bulky parts:
+    - a list of strings takes its strings of the table at once;
+    - a list of 4 byte integers is packed as one array;
+    - a list of customer records (maps with exactly the name, age,
+      address and phone keys) is sent as one list per field, and a map of
+      them keyed by their names as these lists only;
+    - a map is its list of keys and its list of values.
+    """
+    name = 'binary'
+
+    # the kinds of string table: joined by NUL (then its size), with the
+    # lengths (then the number of strings and the size) or empty
+    JOINED = 0
+    LENGTHS = 1
+    EMPTY = 2
+    COUNT = struct.Struct('<I')
+    INT32 = struct.Struct('<i')
+    INT64 = struct.Struct('<q')
+    FLOAT = struct.Struct('<d')
+
+    @classmethod
+    def encode(cls, data):
+        strings = []
+        parts = []
+        if type(data) is dict:
+            cls.encode_map(data, strings, parts.append)
+        else:
+            cls.encode_value(data, strings, parts.append)
+        if not strings:
+            return bytes((cls.EMPTY, )) + b''.join(parts)
+        text = '\0'.join(strings)
+        if text.count('\0') == len(strings) - 1:
+            table = text.encode('utf-8', 'surrogatepass')
+            header = bytes((cls.JOINED, )) + cls.COUNT.pack(len(table))
+        else:
+            encoded = [string.encode('utf-8', 'surrogatepass')
+                       for string in strings]
+            table = struct.pack('<{}I'.format(len(encoded)),
+                                *map(len, encoded)) + b''.join(encoded)
+            header = bytes((cls.LENGTHS, )) + cls.COUNT.pack(
+                len(strings)) + cls.COUNT.pack(len(table))
+        return b''.join([header, table] + parts)
+
+    @classmethod
+    def encode_value(cls, value, strings, write):
+        kind = type(value)
+        if kind is str:
+            strings.append(value)
+            write(b's')
+        elif kind is int:
+            if -2 ** 31 <= value < 2 ** 31:
+                write(b'i' + cls.INT32.pack(value))
+            elif -2 ** 63 <= value < 2 ** 63:
+                write(b'q' + cls.INT64.pack(value))
+            else:
+                strings.append(str(value))
+                write(b'n')
+        elif kind is dict:
+            cls.encode_map(value, strings, write)
+        elif kind is list or kind is tuple:
+            cls.encode_list(value, strings, write)
+        elif value is None:
+            write(b'N')
+        elif value is True:
+            write(b'T')
+        elif value is False:
+            write(b'F')
+        elif kind is float:
+            write(b'd' + cls.FLOAT.pack(value))
+        else:
+            raise TypeError('Can not encode {!r}'.format(value))
+
+    @classmethod
+    def encode_list(cls, items, strings, write):
+        count = len(items)
+        kinds = set(map(type, items))
+        if kinds == {str}:
+            strings.extend(items)
+            write(b'S' + cls.COUNT.pack(count))
+        elif kinds == {int} and -2 ** 31 <= min(items) \
+                and max(items) < 2 ** 31:
+            write(b'I' + cls.COUNT.pack(count)
+                  + struct.pack('<{}i'.format(count), *items))
+        elif kinds == {dict} and set(map(tuple, items)) == {RECORD_KEYS}:
+            write(b'U' + cls.COUNT.pack(count))
+            cls.encode_columns(items, strings, write)
+        else:
+            write(b'L' + cls.COUNT.pack(count))
+            for item in items:
+                cls.encode_value(item, strings, write)
+
+    @classmethod
+    def encode_map(cls, data, strings, write):
+        keys = list(data)
+        values = list(data.values())
+        kinds = set(map(type, values))
+        if kinds == {str} and not set(map(type, keys)) - {str}:
+            # most requests: the keys then the values in the table
+            write(b'M' + cls.COUNT.pack(len(keys)))
+            strings.extend(keys)
+            strings.extend(values)
+            return
+        if len(keys) == 4 and tuple(keys) == RECORD_KEYS \
+                and kinds - {int} == {str} and type(data['age']) is not str:
+            # one customer record: its strings then its age
+            strings.extend((data['name'], data['address'], data['phone']))
+            write(b'r')
+            cls.encode_value(data['age'], strings, write)
+            return
+        if kinds == {dict} \
+                and set(map(tuple, values)) == {RECORD_KEYS} \
+                and keys == [value['name'] for value in values]:
+            # the report: the keys are the names of the records
+            write(b'R' + cls.COUNT.pack(len(values)))
+            cls.encode_columns(values, strings, write)
+            return
+        if set(map(type, keys)) - {str}:
+            # like JSON, the keys are sent as strings
+            keys = [str(key) for key in keys]
+        write(b'm')
+        cls.encode_list(keys, strings, write)
+        cls.encode_list(values, strings, write)
+
+    @classmethod
+    def encode_columns(cls, records, strings, write):
+        for key in RECORD_KEYS:
+            cls.encode_list([record[key] for record in records], strings,
+                            write)
+
+    @classmethod
+    def decode(cls, payload):
+        if payload[:1] == b'\0' and len(payload) > 10:
+            # the requests and most responses are one flat map, or one
+            # record: decoded without the reader
+            (size, ) = cls.COUNT.unpack_from(payload, 1)
+            end = 5 + size
+            tag = payload[end:end + 1]
+            if tag == b'M' and len(payload) == end + 5:
+                (count, ) = cls.COUNT.unpack_from(payload, end + 1)
+                strings = payload[5:end].decode('utf-8',
+                                                'surrogatepass').split('\0')
+                if len(strings) == 2 * count:
+                    return dict(zip(strings[:count], strings[count:]))
+            elif tag == b'r' and len(payload) == end + 6 \
+                    and payload[end + 1] == 105:
+                strings = payload[5:end].decode('utf-8',
+                                                'surrogatepass').split('\0')
+                if len(strings) == 3:
+                    return {'name': strings[0],
+                            'age': cls.INT32.unpack_from(payload, end + 2)[0],
+                            'address': strings[1], 'phone': strings[2]}
+        try:
+            reader = BinaryReader(payload, cls)
+            value = reader.read_value()
+        except ValueError:
+            raise
+        except Exception as e:
+            raise ValueError('Invalid binary payload: {!r}'.format(e))
+        if reader.offset != len(payload):
+            raise ValueError('Invalid binary payload: trailing bytes')
+        return value
+
+
+class BinaryReader:
+    """
+    A class used to decode one payload of the BinaryCodec
+
+    ...
+    Attributes
+    ----------
+    payload : bytes
+        the encoded message
+    offset : int
+        the position of the next tag in the payload
+    strings : list
+        the strings of the table
+    position : int
+        the position of the next string in the table
+    """
+
+    def __init__(self, payload, codec):
+        self.codec = codec
+        kind = payload[0]
+        if kind == codec.EMPTY:
+            (strings, end) = ([], 1)
+        elif kind == codec.JOINED:
+            (size, ) = codec.COUNT.unpack_from(payload, 1)
+            end = 5 + size
+            strings = payload[5:end].decode('utf-8',
+                                            'surrogatepass').split('\0')
+        elif kind == codec.LENGTHS:
+            (count, ) = codec.COUNT.unpack_from(payload, 1)
+            (size, ) = codec.COUNT.unpack_from(payload, 5)
+            end = 9 + size
+            if 4 * count > size:
+                raise ValueError('Invalid binary payload: bad table')
+            lengths = struct.unpack_from('<{}I'.format(count), payload, 9)
+            strings = []
+            position = 9 + 4 * count
+            for length in lengths:
+                strings.append(payload[position:position + length].decode(
+                    'utf-8', 'surrogatepass'))
+                position += length
+            if position != end:
+                raise ValueError('Invalid binary payload: bad lengths')
+        else:
+            raise ValueError('Invalid binary payload: bad table')
+        if end > len(payload):
+            raise ValueError('Invalid binary payload: short table')
+        self.payload = payload
+        self.offset = end
+        self.strings = strings
+        self.position = 0
+
+    def read_count(self):
+        (count, ) = self.codec.COUNT.unpack_from(self.payload, self.offset)
+        self.offset += 4
+        return count
+
+    def read_strings(self, count):
+        strings = self.strings[self.position:self.position + count]
+        if len(strings) != count:
+            raise ValueError('Invalid binary payload: missing strings')
+        self.position += count
+        return strings
+
+    def read_list(self, count):
+        items = self.read_value()
+        if type(items) is not list or len(items) != count:
+            raise ValueError('Invalid binary payload: bad column')
+        return items
+
+    def read_records(self, count):
+        # the keys are those of RECORD_KEYS, a dict display is the
+        # fastest way to build them
+        columns = [self.read_list(count) for _ in RECORD_KEYS]
+        return [{'name': name, 'age': age, 'address': address,
+                 'phone': phone}
+                for (name, age, address, phone) in zip(*columns)]
+
+    def read_value(self):
+        payload = self.payload
+        tag = payload[self.offset]
+        self.offset += 1
+        if tag == 115:  # 's'
+            string = self.strings[self.position]
+            self.position += 1
+            return string
+        if tag == 105:  # 'i'
+            value = self.codec.INT32.unpack_from(payload, self.offset)[0]
+            self.offset += 4
+            return value
+        if tag == 77:  # 'M'
+            count = self.read_count()
+            strings = self.read_strings(2 * count)
+            return dict(zip(strings[:count], strings[count:]))
+        if tag == 114:  # 'r'
+            (name, address, phone) = self.read_strings(3)
+            return {'name': name, 'age': self.read_value(),
+                    'address': address, 'phone': phone}
+        if tag == 83:  # 'S'
+            return self.read_strings(self.read_count())
+        if tag == 109:  # 'm'
+            keys = self.read_value()
+            values = self.read_value()
+            if type(keys) is not list or type(values) is not list \
+                    or len(keys) != len(values):
+                raise ValueError('Invalid binary payload: bad map')
+            return dict(zip(keys, values))
+        if tag == 76:  # 'L'
+            return [self.read_value() for _ in range(self.read_count())]
+        if tag == 73:  # 'I'
+            count = self.read_count()
+            if self.offset + 4 * count > len(payload):
+                raise ValueError('Invalid binary payload: short array')
+            values = struct.unpack_from('<{}i'.format(count), payload,
+                                        self.offset)
+            self.offset += 4 * count
+            return list(values)
+        if tag == 85:  # 'U'
+            return self.read_records(self.read_count())
+        if tag == 82:  # 'R'
+            records = self.read_records(self.read_count())
+            return {record['name']: record for record in records}
+        if tag == 78:  # 'N'
+            return None
+        if tag == 84:  # 'T'
+            return True
+        if tag == 70:  # 'F'
+            return False
+        if tag == 113:  # 'q'
+            value = self.codec.INT64.unpack_from(payload, self.offset)[0]
+            self.offset += 8
+            return value
+        if tag == 100:  # 'd'
+            value = self.codec.FLOAT.unpack_from(payload, self.offset)[0]
+            self.offset += 8
+            return value
+        if tag == 110:  # 'n'
+            return int(self.read_strings(1)[0])
+        raise ValueError('Invalid binary payload: unknown tag {}'.format(tag))
+
+
+JSON_CODEC = JsonCodec()
+CODECS = {'json': JSON_CODEC, 'binary': BinaryCodec()}
+if msgpack is not None:
+    CODECS['msgpack'] = MsgpackCodec()
+
+
+def negotiate_codec(encodings):
+    """It takes the encodings offered by a client, in order of preference,
+    and return the first one supported here (JSON when none is)
+
+    Parameters
+    ----------
+    encodings : list
+        The names of the encodings offered by the client
+
+    Returns
+    -------
+    codec
+        the codec object of the chosen encoding
+    """
+    if isinstance(encodings, list):
+        for encoding in encodings:
+            if isinstance(encoding, str) and encoding in CODECS:
+                return CODECS[encoding]
+    return JSON_CODEC
+
+
+def negotiate_compression(compressions):
+    """It takes the compressions offered by a client and return the first
+    one supported here, None when none is
+
+    Parameters
+    ----------
+    compressions : list
+        The names of the compressions offered by the client
+
+    Returns
+    -------
+    str
+        the name of the chosen compression or None
+    """
+    if isinstance(compressions, list):
+        for compression in compressions:
+            if compression in COMPRESSIONS:
+                return compression
+    return None
+
+
+def encode_frame(payload, compress_min=None):
+    """It takes payload bytes and return the framed bytes, the payload is
+    compressed when it has at least compress_min bytes and shrinks
+
+    Parameters
+    ----------
+    payload : bytes
+        The payload of the message
+    compress_min : int
+        The size from which the payload is compressed, None to never
+        compress it
+
+    Returns
+    -------
+    bytes
+        a byte string containing the length header and the payload
+
+    Raises
+    ------
+    ValueError
+        when the payload is larger than MAX_FRAME_SIZE, which the peer
+        would refuse and the length header can not always express
+    """
+    if len(payload) > MAX_FRAME_SIZE:
+        raise ValueError('Payload of {} bytes is larger than {}'.format(
+            len(payload), MAX_FRAME_SIZE))
+    if compress_min is not None and len(payload) >= compress_min:
+        compressed = zlib.compress(payload, COMPRESSION_LEVEL)
+        if len(compressed) < len(payload):
+            return HEADER.pack(len(compressed) | COMPRESSED) + compressed
+    return HEADER.pack(len(payload)) + payload
+
+
+def encode_message(data_dict, codec=JSON_CODEC, compress_min=None):
+    """It takes a dictionary and return it as a frame
+
+    Parameters
+    ----------
+    data_dict : dict
+        The message to send
+    codec : codec
+        The encoding of the connection, JSON by default
+    compress_min : int
+        The size from which the payload is compressed, None to never
+        compress it
+
+    Returns
+    -------
+    bytes
+        a byte string containing the framed message
+    """
+    return encode_frame(codec.encode(data_dict), compress_min)
+
+
+def decode_message(payload, codec=JSON_CODEC):
+    """It takes a frame payload and return the decoded dictionary
+
+    Parameters
+    ----------
+    payload : bytes
+        The payload of the frame
+    codec : codec
+        The encoding of the connection, JSON by default
+
+    Returns
+    -------
+    dict
+        a dict containing the message
+    """
+    return codec.decode(payload)
+
+
+def to_columns(customers):
+    """It takes customer records and return them in the columnar layout:
+    one list of values per field, the field names are sent once
+
+    Parameters
+    ----------
+    customers : iterable
+        The customer dicts with name, age, address and phone
+
+    Returns
+    -------
+    dict
+        a dict containing the list of values of every field
+    """
+    columns = {key: [] for key in RECORD_KEYS}
+    appends = [columns[key].append for key in RECORD_KEYS]
+    for customer in customers:
+        for (key, append) in zip(RECORD_KEYS, appends):
+            append(customer[key])
+    return columns
+
+
+def from_columns(columns):
+    """It takes a report in the columnar layout and return the report
+    ordered by customer name, like the default layout
+
+    Parameters
+    ----------
+    columns : dict
+        The list of values of every field
+
+    Returns
+    -------
+    dict
+        a dict containing customers data
+    """
+    return {values[0]: dict(zip(RECORD_KEYS, values))
+            for values in zip(*[columns[key] for key in RECORD_KEYS])}
+
+
+class FrameReader:
+    """
+    A class used to split a byte stream into frames
+
+    ...
+    Attributes
+    ----------
+    buffer : bytearray
+        bytes received but not yet returned as a frame
+    max_size : int
+        the largest payload accepted, also after decompression
+    compressed : bool
+        True when compressed frames are accepted, only for the direction
+        in which the handshake negotiated a compression
+
+    Methods
+    -------
+    feed(data)
+        It appends the received bytes to the buffer
+    next_frame()
+        It returns the next complete frame payload or None
+    frames()
+        It yields every complete frame payload in the buffer
+    """
+
+    def __init__(self, max_size=MAX_FRAME_SIZE, compressed=False):
+        self.buffer = bytearray()
+        self.max_size = max_size
+        self.compressed = compressed
+
+    def feed(self, data):
+        """It appends the received bytes to the buffer
+
+        Parameters
+        ----------
+        data : bytes
+            The bytes received from the socket
+        """
+        self.buffer.extend(data)
+
+    def next_frame(self):
+        """It returns the next complete frame payload or None when
+        the buffer does not hold a complete frame yet
+
+        Returns
+        -------
+        bytes
+            a byte string containing the payload of the frame, already
+            decompressed
+
+        Raises
+        ------
+        ValueError
+            when the header announces a payload larger than max_size, or
+            a compressed payload that is not accepted, invalid or larger
+            than max_size once decompressed
+        """
+        if len(self.buffer) < HEADER.size:
+            return None
+        (length, ) = HEADER.unpack_from(self.buffer)
+        size = length & ~COMPRESSED
+        if size > self.max_size:
+            raise ValueError('Frame of {} bytes is larger than {}'.format(
+                size, self.max_size))
+        end = HEADER.size + size
+        if len(self.buffer) < end:
+            return None
+        payload = bytes(self.buffer[HEADER.size:end])
+        del self.buffer[:end]
+        if length & COMPRESSED:
+            if not self.compressed:
+                raise ValueError('Compressed frame was not negotiated')
+            # the output is capped so a small frame can not inflate to
+            # gigabytes
+            decompressor = zlib.decompressobj()
+            try:
+                payload = decompressor.decompress(payload, self.max_size)
+            except zlib.error as e:
+                raise ValueError('Invalid compressed frame: {}'.format(e))
+            if decompressor.unconsumed_tail:
+                raise ValueError('Compressed frame is larger than {}'.format(
+                    self.max_size))
+            if not decompressor.eof:
+                raise ValueError('Invalid compressed frame: truncated')
+        return payload
+
+    def frames(self):
+        """It yields every complete frame payload in the buffer
+
+        Returns
+        -------
+        generator
+            a generator of frame payloads
+        """
+        while True:
+            payload = self.next_frame()
+            if payload is None:
+                break
+            yield payload
+
+
+def recv_frame(sock, reader):
+    """It takes socket object and frame reader and returns the next
+    frame payload sent by the peer, reading from the socket as needed
+
+    Parameters
+    ----------
+    sock : socket
+        The socket class object
+    reader : FrameReader
+        The frame reader that belongs to the socket
+
+    Returns
+    -------
+    bytes
+        a byte string containing the payload of the frame
+    """
+    while True:
+        payload = reader.next_frame()
+        if payload is not None:
+            return payload
+        data = sock.recv(BUFF_SIZE)
+        if not data:
+            raise ConnectionError('Connection closed by peer')
+        reader.feed(data)
+
+
+def recv_message(sock, reader, codec=JSON_CODEC):
+    """It takes socket object and frame reader and returns the next
+    decoded message sent by the peer
+
+    Parameters
+    ----------
+    sock : socket
+        The socket class object
+    reader : FrameReader
+        The frame reader that belongs to the socket
+    codec : codec
+        The encoding of the connection, JSON by default
+
+    Returns
+    -------
+    dict
+        a dict containing the message
+    """
+    return decode_message(recv_frame(sock, reader), codec)
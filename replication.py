@@ -0,0 +1,440 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# ----- Program Details -----
+# Read replicas of the server. The primary numbers every change of the
+# customer data (add, delete and update) in the order it was made and
+# keeps the latest ones in a MutationStream. Replicas load the same data
+# file, connect to the replication port of the primary and receive the
+# changes they miss, then every new change as it is made. A replica that
+# reconnects asks for the changes after the last one it applied; when they
+# are not kept any more (or the primary restarted) it gets a full copy of
+# the customer data instead. Replicas only answer the read-only choices.
+#
+# Usage:
+#     python server.py --port 9999 --replication-port 9990
+#     python server.py --port 9998 --replica-of localhost:9990
+
+# The collections module keeps the latest changes in a bounded deque
+import collections
+import os
+import socket
+# The socketserver module serves the replicas of the primary
+import socketserver
+import threading
+import time
+
+from protocol import FrameReader, encode_message, recv_message
+
+STREAM_BUFFER = 100000
+STREAM_BATCH = 1000
+RESYNC_BATCH = 10000
+HEARTBEAT_SECONDS = 1.0
+RECONNECT_SECONDS = 1.0
+# the primary builds the full copy before answering, which takes much
+# longer than a heartbeat on a large customer data
+RESYNC_SECONDS = 600.0
+
+
+class MutationStream:
+    """
+    A class used to number the changes of the customer data of the
+    primary and keep the latest ones for the replicas
+
+    ...
+    Attributes
+    ----------
+    stream_id : str
+        a random id of this stream, the sequence numbers of a stream mean
+        nothing to the stream of another run of the primary
+    seq : int
+        the sequence number of the last change
+    changes : deque
+        the (sequence number, time, change) of the latest changes
+    file_base : bool
+        True while the changes since the start of the stream are what
+        separates the customer data from the data file
+    replicas : dict
+        the address and last sequence number sent, per connected replica
+
+    Methods
+    -------
+    publish(op_dict)
+        It numbers a change and wakes up the replicas
+    can_follow(stream_id, seq)
+        It returns True when the changes after seq are all kept
+    changes_after(seq, timeout)
+        It waits for the changes after seq and returns them
+    reset()
+        It drops the kept changes so the replicas get a full copy
+    status()
+        It returns the state of the stream as a dict
+    """
+
+    def __init__(self, buffer_size=STREAM_BUFFER):
+        self.stream_id = os.urandom(8).hex()
+        self.seq = 0
+        self.changes = collections.deque(maxlen=buffer_size)
+        self.file_base = True
+        self.replicas = {}
+        self.condition = threading.Condition()
+
+    def publish(self, op_dict):
+        """It numbers a change and wakes up the replicas, the caller must
+        hold the lock of the customer data for writing so the sequence
+        numbers follow the order of the changes
+
+        Parameters
+        ----------
+        op_dict : dict
+            The change of the customer data
+
+        Returns
+        -------
+        int
+            the sequence number of the change
+        """
+        with self.condition:
+            self.seq += 1
+            self.changes.append((self.seq, time.time(), op_dict))
+            self.condition.notify_all()
+            return self.seq
+
+    def can_follow(self, stream_id, seq):
+        """It returns True when a replica that applied the changes up to
+        seq of the stream can be sent the following changes, a replica
+        that only loaded the data file has no stream id and seq 0
+
+        Parameters
+        ----------
+        stream_id : str
+            The id of the stream the replica follows, empty for none
+        seq : int
+            The sequence number of the last change applied by the replica
+        """
+        if stream_id == '':
+            if not self.file_base or seq != 0:
+                return False
+        elif stream_id != self.stream_id:
+            return False
+        with self.condition:
+            if not isinstance(seq, int) or not 0 <= seq <= self.seq:
+                return False
+            oldest = self.changes[0][0] if self.changes else self.seq + 1
+            return seq + 1 >= oldest
+
+    def changes_after(self, seq, timeout=HEARTBEAT_SECONDS,
+                      limit=STREAM_BATCH):
+        """It waits until there are changes after seq, at most timeout
+        seconds, and returns them
+
+        Parameters
+        ----------
+        seq : int
+            The sequence number of the last change already sent
+        timeout : float
+            The longest wait in seconds
+        limit : int
+            The largest number of changes returned
+
+        Returns
+        -------
+        list
+            the (sequence number, time, change) of the changes, None when
+            some of them are not kept any more
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.seq > seq, timeout)
+            if self.seq == seq:
+                return []
+            oldest = self.changes[0][0] if self.changes else self.seq + 1
+            if seq + 1 < oldest:
+                return None
+            start = seq + 1 - oldest
+            return [self.changes[position] for position in
+                    range(start, min(start + limit, len(self.changes)))]
+
+    def reset(self):
+        """It drops the kept changes and starts a new stream, for a change
+        of the customer data that is not a list of changes (a reload
+        swapping all of it). The caller must hold the lock of the customer
+        data for writing; the connected replicas stop following and get a
+        full copy when they reconnect
+        """
+        with self.condition:
+            self.stream_id = os.urandom(8).hex()
+            self.changes.clear()
+            self.file_base = False
+            # a sequence number never sent tells the replicas they missed
+            # changes
+            self.seq += 1
+            self.condition.notify_all()
+
+    def status(self):
+        """It returns the state of the stream and of its replicas
+
+        Returns
+        -------
+        dict
+            a dict containing the sequence number and the replicas
+        """
+        with self.condition:
+            replicas = [{'address': address, 'sent_seq': sent_seq,
+                         'lag_ops': self.seq - sent_seq}
+                        for (address, sent_seq) in self.replicas.values()]
+            return {'role': 'primary', 'stream': self.stream_id,
+                    'seq': self.seq, 'kept': len(self.changes),
+                    'replicas': replicas}
+
+
+class ReplicationHandler(socketserver.BaseRequestHandler):
+    """
+    A class used to send the changes of the primary to one replica
+
+    The replica starts with {'stream': id, 'seq': n}, the last change it
+    applied. The answer tells the stream to follow and the number of
+    frames of the full copy of the customer data sent first (0 when the
+    replica can go on from seq). Then every frame carries the following
+    changes and the last sequence number of the primary, an empty frame is
+    sent every HEARTBEAT_SECONDS when nothing changes.
+    """
+
+    def handle(self):
+        server_operation_obj = self.server.server_operation_obj
+        stream = server_operation_obj.stream
+        sock = self.request
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        key = object()
+        try:
+            hello = recv_message(sock, FrameReader())
+            if not isinstance(hello, dict):
+                return
+            (seq, batches) = self.start(server_operation_obj, stream,
+                                        hello.get('stream', ''),
+                                        hello.get('seq', 0))
+            for batch in batches:
+                sock.sendall(encode_message({'customers': batch}))
+            while True:
+                with stream.condition:
+                    stream.replicas[key] = (
+                        '{}:{}'.format(*self.client_address[:2]), seq)
+                changes = stream.changes_after(seq)
+                if changes is None:
+                    # the replica fell behind the kept changes, it
+                    # reconnects and gets a full copy
+                    break
+                if changes:
+                    seq = changes[-1][0]
+                sock.sendall(encode_message(
+                    {'ops': [list(change) for change in changes],
+                     'seq': stream.seq, 'time': time.time()}))
+        except (OSError, ValueError) as e:
+            # the replica went away
+            pass
+        finally:
+            with stream.condition:
+                stream.replicas.pop(key, None)
+
+    def start(self, server_operation_obj, stream, stream_id, seq):
+        """It answers the first message of a replica and returns the
+        sequence number it goes on from with the batches of the full copy
+        of the customer data (none when it can follow the stream)"""
+        if stream.can_follow(stream_id, seq):
+            self.request.sendall(encode_message(
+                {'stream': stream.stream_id, 'seq': seq, 'resync': 0}))
+            return (seq, [])
+        (seq, customers) = server_operation_obj.replication_copy()
+        # an empty copy is still one batch, the replica has to be emptied
+        batches = [customers[start:start + RESYNC_BATCH]
+                   for start in range(0, len(customers), RESYNC_BATCH)] \
+            or [[]]
+        self.request.sendall(encode_message(
+            {'stream': stream.stream_id, 'seq': seq,
+             'resync': len(batches)}))
+        return (seq, batches)
+
+
+class ReplicationServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """
+    A class used to serve the mutation stream of the primary to the
+    replicas, one thread per replica
+
+    ...
+    Attributes
+    ----------
+    server_operation_obj : ServerOperations
+        the object holding the customer data and the stream
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, server_address, server_operation_obj):
+        socketserver.TCPServer.__init__(self, server_address,
+                                        ReplicationHandler)
+        self.server_operation_obj = server_operation_obj
+
+    def start(self):
+        """It serves the replicas from a background thread
+        """
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+
+class ReplicaFollower:
+    """
+    A class used to keep the customer data of a replica up to date with
+    the changes of the primary, reconnecting when the connection is lost
+
+    ...
+    Attributes
+    ----------
+    primary_address : tuple
+        the host and replication port of the primary
+    stream_id : str
+        the id of the stream followed, empty until the first connection
+    applied_seq : int
+        the sequence number of the last change applied
+    primary_seq : int
+        the last sequence number of the primary known to the replica
+    applied_time : float
+        the time the last applied change was made on the primary
+    apply_delay : float
+        the seconds between the last change made on the primary and
+        applied on the replica
+    last_contact : float
+        the time of the last message of the primary
+    connected : bool
+        True while the replica is connected to the primary
+    reconnects : int
+        the number of connections lost
+    resyncs : int
+        the number of full copies of the customer data received
+    errors : int
+        the number of unexpected errors (malformed message, failing
+        change) which made the replica reconnect
+    last_error : str
+        the last of those errors, None when there was none
+    resync_needed : bool
+        True after an unexpected error, the customer data may then miss a
+        change so the next connection asks for a full copy
+
+    Methods
+    -------
+    start()
+        It follows the primary from a background thread
+    follow()
+        It applies the changes of the primary until the connection is lost
+    status()
+        It returns the replication lag as a dict
+    """
+
+    def __init__(self, server_operation_obj, primary_address):
+        self.server_operation_obj = server_operation_obj
+        self.primary_address = primary_address
+        self.stream_id = ''
+        self.applied_seq = 0
+        self.primary_seq = 0
+        self.applied_time = 0.0
+        self.apply_delay = 0.0
+        self.last_contact = 0.0
+        self.connected = False
+        self.reconnects = 0
+        self.resyncs = 0
+        self.errors = 0
+        self.last_error = None
+        self.resync_needed = False
+
+    def start(self):
+        """It follows the primary from a background thread, forever
+        """
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+        while True:
+            try:
+                self.follow()
+            except (OSError, ValueError) as e:
+                # the connection was lost or a frame was broken
+                pass
+            except Exception as e:
+                # anything else must not end the thread, the replica would
+                # stop following without anyone noticing
+                self.errors += 1
+                self.last_error = '{}: {}'.format(type(e).__name__, e)
+                self.resync_needed = True
+                print('Replication error: {}'.format(self.last_error))
+            if self.connected:
+                self.connected = False
+                self.reconnects += 1
+            time.sleep(RECONNECT_SECONDS)
+
+    def follow(self):
+        """It connects to the primary, catches up with the changes made
+        since the last one applied and applies the new ones until the
+        connection is lost
+        """
+        reader = FrameReader()
+        with socket.create_connection(self.primary_address) as sock:
+            sock.settimeout(RESYNC_SECONDS)
+            # a sequence number no stream has asks for a full copy
+            sock.sendall(encode_message(
+                {'stream': self.stream_id,
+                 'seq': -1 if self.resync_needed else self.applied_seq}))
+            hello = recv_message(sock, reader)
+            self.connected = True
+            self.last_contact = time.time()
+            if hello['resync']:
+                customers = []
+                for _ in range(hello['resync']):
+                    customers.extend(recv_message(sock, reader)['customers'])
+                self.server_operation_obj.replace_data(customers)
+                self.resyncs += 1
+                self.resync_needed = False
+            (self.stream_id, self.applied_seq) = (hello['stream'],
+                                                  hello['seq'])
+            self.primary_seq = max(self.primary_seq, self.applied_seq)
+            # a silent primary is a lost primary
+            sock.settimeout(10 * HEARTBEAT_SECONDS)
+            while True:
+                message = recv_message(sock, reader)
+                self.last_contact = time.time()
+                for (seq, op_time, op_dict) in message['ops']:
+                    self.server_operation_obj.apply_mutation(op_dict)
+                    self.applied_seq = seq
+                    self.applied_time = op_time
+                    self.apply_delay = time.time() - op_time
+                self.primary_seq = message['seq']
+
+    def status(self):
+        """It returns the state of the replica, lag_seconds is never lower
+        than the real lag: it is the age of the last change applied while
+        changes of the primary are still missing
+
+        Returns
+        -------
+        dict
+            a dict containing the replication lag
+        """
+        now = time.time()
+        lag_ops = max(0, self.primary_seq - self.applied_seq)
+        return {'role': 'replica',
+                'primary': '{}:{}'.format(*self.primary_address),
+                'connected': self.connected,
+                'stream': self.stream_id,
+                'applied_seq': self.applied_seq,
+                'primary_seq': self.primary_seq,
+                'lag_ops': lag_ops,
+                'lag_seconds': now - self.applied_time
+                if lag_ops and self.applied_time else 0.0,
+                'apply_delay_ms': 1000 * self.apply_delay,
+                'last_contact_seconds': now - self.last_contact
+                if self.last_contact else None,
+                'reconnects': self.reconnects,
+                'resyncs': self.resyncs,
+                'errors': self.errors,
+                'last_error': self.last_error}
+
+
+def parse_address(value):
+    """It takes a HOST:PORT option and return the (host, port) address"""
+    (host, _, port) = value.rpartition(':')
+    return (host or 'localhost', int(port))
@@ -12,7 +12,129 @@ import socketserver
 # The JSON module is mainly used to convert the python dictionary above
 # into a JSON string that can be transmitted over the network
 import json
-import socket
+import os
+# The threading module provides the locks used to share the customer data
+# between the threads serving the clients
+import threading
+# The bisect module keeps the sorted name index ordered on insert/delete
+import bisect
+# The heapq module picks the first customers of an index lookup in order
+import heapq
+# The base64 module is used to make the report cursors opaque
+import base64
+# The asyncio module is used by the single event loop server engine
+import asyncio
+# The argparse module is used to read the server options from command line
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from indexes import INDEX_FIELDS, SecondaryIndexes, index_age
+from metrics import MetricsServer, ServerMetrics
+from profiling import RequestProfiler
+from protocol import (BUFF_SIZE, COMPRESSION_THRESHOLD, HANDSHAKE_CHOICE,
+                      HEADER, JSON_CODEC, MAX_FRAME_SIZE, RECORD_KEYS,
+                      FrameReader, decode_message, encode_frame,
+                      encode_message, negotiate_codec, negotiate_compression)
+from replication import (STREAM_BUFFER, MutationStream, ReplicaFollower,
+                         ReplicationServer, parse_address)
+from storage import (FSYNC_POLICIES, Customer, MutationLog, Snapshot,
+                     format_line, is_field_text, load_chunks, parse_line,
+                     shard_of)
+
+
+class ReadWriteLock:
+    """
+    A class used to share data between many readers and one writer
+
+    Readers run concurrently, a writer runs alone. Waiting writers block
+    new readers so a steady stream of reads can not starve the writers.
+    The lock is not reentrant.
+
+    Methods
+    -------
+    read_locked()
+        It returns a context manager holding the lock for reading
+    write_locked()
+        It returns a context manager holding the lock for writing
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition(threading.Lock())
+        self.readers = 0
+        self.writer = False
+        self.waiting_writers = 0
+
+    def acquire_read(self):
+        with self.condition:
+            while self.writer or self.waiting_writers:
+                self.condition.wait()
+            self.readers += 1
+
+    def release_read(self):
+        with self.condition:
+            self.readers -= 1
+            if not self.readers:
+                self.condition.notify_all()
+
+    def acquire_write(self):
+        with self.condition:
+            self.waiting_writers += 1
+            while self.writer or self.readers:
+                self.condition.wait()
+            self.waiting_writers -= 1
+            self.writer = True
+
+    def release_write(self):
+        with self.condition:
+            self.writer = False
+            self.condition.notify_all()
+
+    @contextmanager
+    def read_locked(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write_locked(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+# below this size (1.3M customers) the process pool and the pickling of
+# the parsed chunks cost more than the parsing they spread
+PARALLEL_LOAD_MIN_BYTES = 64 << 20
+REPORT_PAGE_SIZE = 100
+MAX_REPORT_PAGE_SIZE = 10000
+MAX_BATCH_SIZE = 10000
+UPDATABLE_FIELDS = {'age', 'address', 'phone'}
+SEARCH_LIMIT = 20
+# rows: a dict of the customer records by name, columns: one list of values
+# per field so the field names are sent once
+REPORT_LAYOUTS = ('rows', 'columns')
+EXPORT_PAGE_SIZE = 5000
+RELOAD_MODES = ('diff', 'swap')
+RELOAD_BATCH_SIZE = 1000
+# the pause between two reload batches lets the waiting requests run
+RELOAD_PAUSE = 0.001
+# the change logged by a reload in swap mode: the changes logged before it
+# belong to the replaced data, a restart loads the data file again there
+RELOAD_MARKER = {'op': 'reload'}
+# the answer to a response too large for one frame, like the whole report
+# of a few million customers
+TOO_LARGE_MESSAGE = ('Response is larger than {} bytes, ask for it in pages '
+                     'with page_size (choice 7) or export it (choice 23)'
+                     ).format(MAX_FRAME_SIZE)
+# The choices changing the customer data (or its files), refused by replicas
+WRITE_CHOICES = {'2', '3', '4', '5', '6', '9', '11', '12', '13', '22', '24'}
+
 
 class ServerOperations:
     """
@@ -22,7 +144,55 @@ class ServerOperations:
     Attributes
     ----------
     database_dict : dict
-        a dictionary which contains the customer data
+        a dictionary which maps the customer names to Customer records
+    sorted_index : list
+        a list of (lower case name, name) tuples kept in sorted order, it
+        is updated by add_customer/delete_customer in O(log n) comparisons
+        so the report never has to sort the customer data again, and it
+        serves the case insensitive name prefix search
+    version : int
+        a counter increased by every change of the customer data
+    report_cache : dict
+        the [version, report frame, compressed report frame] of the last
+        report per encoding and layout, it is served again as long as the
+        version did not change
+    report_cache_hits : int
+        the number of reports served from the cache
+    report_cache_misses : int
+        the number of reports that had to be encoded
+    lock : ReadWriteLock
+        a lock that lets lookups run concurrently while the methods
+        changing the customer data run alone
+    log : MutationLog
+        the log every change of the customer data is appended to, the
+        changes are replayed on top of the data file at startup
+    snapshot : Snapshot
+        the memory-mapped snapshot the data is loaded from, None once
+        the data is loaded
+    deleted : set
+        the names deleted while the snapshot is loading
+    loaded : threading.Event
+        it is set once all the customer data is in database_dict
+    indexes : SecondaryIndexes
+        the opt-in indexes on phone, age and address words, None when
+        no index is enabled
+    metrics : ServerMetrics
+        the request counts, latencies, connections and bytes of the server
+    profiler : RequestProfiler
+        the opt-in profiler timing the phases of the requests
+    shard : tuple
+        the (index, count) of the hash partition of names owned by this
+        server in the sharded mode, None when it owns all of them
+    stream : MutationStream
+        the numbered changes sent to the replicas, None when the server
+        is not a primary
+    replica : ReplicaFollower
+        the follower applying the changes of the primary, None when the
+        server is not a replica (replicas refuse the changing choices)
+    path_name : str
+        the data file, read again by a reload
+    reload_state : dict
+        the progress of the last reload of the data file
 
     Methods
     -------
@@ -37,6 +207,18 @@ class ServerOperations:
         It takes customer name to remove the customer data from the 
         server if name is already exists and return the success message
         Otherwise return error message
+    get_customers(self, names=None)
+        It takes a list of customer names and return the detail or error
+        message of every name in one lock acquisition
+    add_customers(self, customers=None)
+        It takes a list of customer records and add every customer in one
+        lock acquisition
+    delete_customers(self, names=None)
+        It takes a list of customer names and delete every customer in
+        one lock acquisition
+    import_lines(self, lines=None)
+        It takes lines of a data file and add their customers like
+        read_file, in one lock acquisition
     update_customer_age(self, name='', age='')
         It takes customer name and age to update the customer age if 
         customer name is already exists and return the success message
@@ -49,18 +231,120 @@ class ServerOperations:
         It takes customer name and phone to update the customer phone if 
         customer name is already exists and return the success message
         Otherwise return error message
+    update_customer(self, name='', fields=None, message=...)
+        It takes customer name and any of age, address and phone and
+        update them at once if customer name is already exists
+        Otherwise return error message
+    search_customers(self, prefix='', limit=SEARCH_LIMIT, case_sensitive=False)
+        It takes the beginning of a name and return the matching customers
+    find_by_phone(self, phone='', limit=REPORT_PAGE_SIZE)
+        It takes a phone and return the customers with that phone
+    find_by_age(self, min_age='', max_age='', limit=REPORT_PAGE_SIZE)
+        It takes an age range and return the customers in it
+    find_by_address(self, words='', limit=REPORT_PAGE_SIZE)
+        It takes words and return the customers whose address has them
     sort_database(self)
-        It sorts the customer data based on customer name
+        It returns the customer data ordered by customer name
+    ordered_columns(self)
+        It returns the customer data ordered by customer name, one list
+        per field
+    report_frame(self, codec=JSON_CODEC, layout='rows', compress_min=None)
+        It returns the whole report framed for the connection, from the
+        cache when the customer data did not change
+    report_cache_stats(self)
+        It returns the cache hit/miss counters of the report
+    stats(self)
+        It returns the metrics of the server and the size of the data
+    metrics_text(self)
+        It returns the metrics of the server as plain text
+    report_page(self, page_size=REPORT_PAGE_SIZE, cursor='')
+        It returns one page of the customer data ordered by customer name
+        and the cursor of the next page
+    export_page(self, page_size=EXPORT_PAGE_SIZE, cursor='')
+        It returns one page of the customer data as lines of a data file
+        and the cursor of the next page
+    owns(self, name)
+        It returns True when the name belongs to the shard of the server
     read_file(self, path_name='data.txt')
         It takes file path and load the customer data into the server
+    read_file_parallel(self, path_name='data.txt', workers=None)
+        It takes file path and load the customer data into the server
+        with a pool of processes
+    replay_log(self, path_name)
+        It applies the changes stored in a mutation log file
+    apply_mutation(self, op_dict)
+        It applies one logged or replicated change
+    replication_copy(self)
+        It returns the customer data with the stream sequence number
+    replace_data(self, customers)
+        It replaces all the customer data with a copy from the primary
+    log_mutation(self, op_dict)
+        It appends a change to the mutation log
+    wait_durable(self, seq)
+        It waits until a logged change is on disk
+    materialize(self, name)
+        It copies a customer that is only in the snapshot into the data
+    load_snapshot(self, batch_size=10000)
+        It loads the customer data from the snapshot in the background
+    write_snapshot(self, path_name=None)
+        It writes the customer data to a binary snapshot file
+    start_reload(self, mode='diff', batch_size=RELOAD_BATCH_SIZE)
+        It reads the data file again in the background and applies it
+    reload_diff(self, batch_size=RELOAD_BATCH_SIZE)
+        It applies the added, removed and changed customers of the data
+        file in small batches
+    reload_swap(self)
+        It builds the customer data of the data file aside and swaps it in
     """
 
     database_dict = {}
 
-    def __init__(self):
+    def __init__(self, path_name='data.txt', log=None, snapshot_path=None,
+                 load_workers=1, index_fields=(), shard=None, stream=None):
         self.database_dict = {}
-        self.read_file()
-        print("Data successfully loaded into server !")
+        self.sorted_index = []
+        self.version = 0
+        self.report_cache = {}
+        self.report_cache_hits = 0
+        self.report_cache_misses = 0
+        self.cache_lock = threading.Lock()
+        self.lock = ReadWriteLock()
+        self.log = None
+        self.snapshot_path = snapshot_path
+        self.snapshot = None
+        self.deleted = set()
+        self.loaded = threading.Event()
+        self.indexes = None
+        self.metrics = ServerMetrics()
+        self.profiler = RequestProfiler()
+        self.shard = shard
+        self.stream = stream
+        self.replica = None
+        self.path_name = path_name
+        self.reload_state = {'state': 'idle'}
+        self.reload_lock = threading.Lock()
+        if index_fields:
+            self.indexes = SecondaryIndexes(index_fields)
+        if snapshot_path and os.path.exists(snapshot_path):
+            # lookups are served from the memory-mapped snapshot while the
+            # customer data is loaded from it in the background
+            self.snapshot = Snapshot(snapshot_path)
+            if stream is not None:
+                # replicas loading the data file need a full copy
+                stream.file_base = False
+        elif load_workers != 1:
+            self.read_file_parallel(path_name, load_workers)
+        else:
+            self.read_file(path_name)
+        if log is not None:
+            self.replay_log(log.path_name)
+            self.log = log
+        if self.snapshot is not None:
+            threading.Thread(target=self.load_snapshot, daemon=True).start()
+            print("Snapshot mapped, data is loading in background !")
+        else:
+            self.loaded.set()
+            print("Data successfully loaded into server !")
 
     def get_customer(self, name=''):
         """It takes customer name and return customer detail if exists
@@ -77,9 +361,32 @@ class ServerOperations:
             a dict of customer record if customer name is exists
             Otherwise return error message
         """
+        with self.lock.read_locked():
+            return self.lookup_customer(name)
+
+    def lookup_customer(self, name=''):
+        """It takes customer name and return customer detail if exists,
+        the caller must hold the lock
+
+        Parameters
+        ----------
+        name : str
+            The name of the customer
+
+        Returns
+        -------
+        dict
+            a dict of customer record if customer name is exists
+            Otherwise return error message
+        """
+        name = self.batch_name(name)
         if name:
-            if self.database_dict.get(name):
-                ans_dict = self.database_dict[name]
+            record = self.database_dict.get(name)
+            if not record and self.snapshot is not None \
+                    and name not in self.deleted:
+                record = self.snapshot.find(name)
+            if record:
+                ans_dict = record.to_dict()
             else:
                 ans_dict = {'message': 'Customer not found'}
         else:
@@ -107,22 +414,64 @@ class ServerOperations:
         dict
             a dict containing success/error message
         """
-        if name:
+        with self.lock.write_locked():
+            (ans_dict, seq) = \
+                self.insert_customer(name, age, address, phone)
+        self.wait_durable(seq)
+        return ans_dict
+
+    def insert_customer(self, name='', age='', address='', phone=''):
+        """It takes customer details to store the data into server if
+        name is not already exists, the caller must hold the lock for
+        writing
+
+        Parameters
+        ----------
+        name : str
+            The name of the customer
+        age : str
+            The age of the customer
+        address : str
+            The address of the customer
+        phone : str
+            The phone of the customer
+
+        Returns
+        -------
+        tuple
+            a tuple of the dict containing success/error message and the
+            sequence number of the logged change (0 when nothing changed)
+        """
+        seq = 0
+        # checked before any change: a name which is not a string, or
+        # values of another type, could not be indexed, logged or removed
+        # again
+        name = self.batch_name(name)
+        error = self.check_fields({'name': name, 'age': age,
+                                   'address': address, 'phone': phone})
+        if not name:
+            ans_dict = {'message': 'Please provide Customer name'}
+        elif error:
+            ans_dict = error
+        elif not self.owns(name):
+            ans_dict = {'message': 'Customer belongs to shard {}'.format(
+                shard_of(name, self.shard[1]))}
+        else:
+            self.materialize(name)
             if not self.database_dict.get(name):
-                self.database_dict.update({name: {
-                    'name': name,
-                    'age': age,
-                    'address': address,
-                    'phone': phone,
-                }})
+                record = Customer(name, age, address, phone)
+                self.database_dict[name] = record
+                self.index_customer(record)
+                self.version += 1
+                seq = self.log_mutation(
+                    {'op': 'add', 'name': name, 'age': age,
+                     'address': address, 'phone': phone})
 
                 ans_dict = {'message': 'Customer has been added',
                             'success': True}
             else:
                 ans_dict = {'message': 'Customer already exists'}
-        else:
-            ans_dict = {'message': 'Please provide Customer name'}
-        return ans_dict
+        return (ans_dict, seq)
 
     def delete_customer(self, name=''):
         """It takes customer name to remove the customer data from the 
@@ -139,16 +488,244 @@ class ServerOperations:
         dict
             a dict containing success/error message
         """
+        with self.lock.write_locked():
+            (ans_dict, seq) = self.remove_customer(name)
+        self.wait_durable(seq)
+        return ans_dict
+
+    def remove_customer(self, name=''):
+        """It takes customer name to remove the customer data from the
+        server if name is already exists, the caller must hold the lock
+        for writing
+
+        Parameters
+        ----------
+        name : str
+            The name of the customer
+
+        Returns
+        -------
+        tuple
+            a tuple of the dict containing success/error message and the
+            sequence number of the logged change (0 when nothing changed)
+        """
+        seq = 0
+        name = self.batch_name(name)
         if name:
+            self.materialize(name)
             if self.database_dict.get(name):
-                del self.database_dict[name]
+                self.unindex_customer(self.database_dict.pop(name))
+                if self.snapshot is not None:
+                    self.deleted.add(name)
+                self.version += 1
+                seq = self.log_mutation(
+                    {'op': 'delete', 'name': name})
                 ans_dict = {'message': 'Customer has been deleted',
                             'success': True}
             else:
                 ans_dict = {'message': 'Customer does not exists'}
         else:
             ans_dict = {'message': 'Please provide Customer name'}
-        return ans_dict
+        return (ans_dict, seq)
+
+    def get_customers(self, names=None):
+        """It takes a list of customer names and return the customer
+        detail or error message of every name, all the lookups run under
+        one acquisition of the lock
+
+        Parameters
+        ----------
+        names : list
+            The names of the customers
+
+        Returns
+        -------
+        dict
+            a dict containing the list of results in the order of names
+            Otherwise return error message
+        """
+        error = self.check_batch(names)
+        if error:
+            return error
+        with self.lock.read_locked():
+            results = [self.lookup_customer(self.batch_name(name))
+                       for name in names]
+        return {'results': results}
+
+    def add_customers(self, customers=None):
+        """It takes a list of customer records and add every customer
+        like add_customer, all the changes are made under one acquisition
+        of the lock and wait for a single log sync
+
+        Parameters
+        ----------
+        customers : list
+            The customer records, dicts with name, age, address and phone
+
+        Returns
+        -------
+        dict
+            a dict containing the list of results in the order of customers
+            Otherwise return error message
+        """
+        error = self.check_batch(customers)
+        if error:
+            return error
+        results = []
+        last_seq = 0
+        with self.lock.write_locked():
+            for customer in customers:
+                if not isinstance(customer, dict):
+                    results.append({'message': 'Invalid customer'})
+                    continue
+                (ans_dict, seq) = self.insert_customer(
+                    self.batch_name(customer.get('name')),
+                    customer.get('age', ''), customer.get('address', ''),
+                    customer.get('phone', ''))
+                results.append(ans_dict)
+                last_seq = max(last_seq, seq)
+        self.wait_durable(last_seq)
+        return {'results': results}
+
+    def delete_customers(self, names=None):
+        """It takes a list of customer names and delete every customer
+        like delete_customer, all the changes are made under one
+        acquisition of the lock and wait for a single log sync
+
+        Parameters
+        ----------
+        names : list
+            The names of the customers
+
+        Returns
+        -------
+        dict
+            a dict containing the list of results in the order of names
+            Otherwise return error message
+        """
+        error = self.check_batch(names)
+        if error:
+            return error
+        results = []
+        last_seq = 0
+        with self.lock.write_locked():
+            for name in names:
+                (ans_dict, seq) = self.remove_customer(self.batch_name(name))
+                results.append(ans_dict)
+                last_seq = max(last_seq, seq)
+        self.wait_durable(last_seq)
+        return {'results': results}
+
+    def import_lines(self, lines=None):
+        """It takes lines of a data file and add the customers they hold
+        with the parsing rules of read_file: a line without a name is
+        rejected, a name that already exists keeps its record. All the
+        lines are added under one acquisition of the lock and wait for a
+        single log sync, a large file is sent as many of these chunks
+
+        Parameters
+        ----------
+        lines : list
+            The lines of the data file
+
+        Returns
+        -------
+        dict
+            a dict containing the number of customers accepted, of
+            duplicates and of lines rejected, with the positions of the
+            rejected lines in the chunk
+            Otherwise return error message
+        """
+        error = self.check_batch(lines)
+        if error:
+            return error
+        accepted = 0
+        duplicates = 0
+        rejected_lines = []
+        last_seq = 0
+        with self.lock.write_locked():
+            for (position, line) in enumerate(lines):
+                if isinstance(line, str) and not line.strip():
+                    # empty lines are skipped like in read_file
+                    continue
+                record = parse_line(line) if isinstance(line, str) else None
+                if record is None or not self.owns(record[0]) \
+                        or self.check_fields(dict(zip(RECORD_KEYS,
+                                                      record))):
+                    rejected_lines.append(position)
+                    continue
+                (ans_dict, seq) = self.insert_customer(*record)
+                if ans_dict.get('success'):
+                    accepted += 1
+                else:
+                    duplicates += 1
+                last_seq = max(last_seq, seq)
+        self.wait_durable(last_seq)
+        return {'accepted': accepted, 'duplicates': duplicates,
+                'rejected': len(rejected_lines),
+                'rejected_lines': rejected_lines, 'success': True}
+
+    @staticmethod
+    def check_batch(items):
+        """It takes the items of a batch request and return an error
+        message when they are not a list of an accepted size
+
+        Parameters
+        ----------
+        items : list
+            The items of the batch
+
+        Returns
+        -------
+        dict
+            a dict containing the error message, None when valid
+        """
+        if not isinstance(items, list):
+            return {'message': 'Please provide a list'}
+        if len(items) > MAX_BATCH_SIZE:
+            return {'message': 'Batch size must not exceed {}'
+                    .format(MAX_BATCH_SIZE)}
+        return None
+
+    @staticmethod
+    def check_fields(fields):
+        """It takes the name, age, address and phone of a customer, or some
+        of them, and return an error message when one of them has a type
+        that can not be indexed, logged and written back to the snapshot
+        and the data file, or holds a '|' or a line break which would end
+        its field in the data file
+
+        Parameters
+        ----------
+        fields : dict
+            The values of the fields
+
+        Returns
+        -------
+        dict
+            a dict containing the error message, None when valid
+        """
+        age = fields.get('age', '')
+        if isinstance(age, bool) or not isinstance(age, (int, str)):
+            return {'message': 'Age must be an integer or a string'}
+        if isinstance(age, int) and not -2 ** 63 <= age < 2 ** 63:
+            return {'message': 'Age must fit in 64 bits'}
+        for field in ('address', 'phone'):
+            if not isinstance(fields.get(field, ''), str):
+                return {'message': '{} must be a string'.format(
+                    field.capitalize())}
+        for field in ('name', 'age', 'address', 'phone'):
+            value = fields.get(field, '')
+            if isinstance(value, str) and not is_field_text(value):
+                return {'message': '{} must not contain | or a line break'
+                        .format(field.capitalize())}
+        return None
+
+    @staticmethod
+    def batch_name(name):
+        """It returns the name of a request or of a batch item, a name
+        which is not a string is treated as missing"""
+        return name if isinstance(name, str) else ''
 
     def update_customer_age(self, name='', age=''):
         """It takes customer name and age to update the customer age if 
@@ -167,18 +744,8 @@ class ServerOperations:
         dict
             a dict containing success/error message
         """
-        if name:
-            if self.database_dict.get(name):
-                data_dict = self.database_dict.get(name)
-                data_dict.update({'age': age})
-                self.database_dict.update({name: data_dict})
-                ans_dict = {'message': 'Customer age has been updated',
-                            'success': True}
-            else:
-                ans_dict = {'message': 'Customer not found'}
-        else:
-            ans_dict = {'message': 'Please provide Customer name'}
-        return ans_dict
+        return self.update_customer(name, {'age': age},
+                                    'Customer age has been updated')
 
     def update_customer_address(self, name='', address=''):
         """It takes customer name and address to update the customer address if 
@@ -197,19 +764,8 @@ class ServerOperations:
         dict
             a dict containing success/error message
         """
-        if name:
-            if self.database_dict.get(name):
-                data_dict = self.database_dict.get(name)
-                data_dict.update({'address': address})
-                self.database_dict.update({name: data_dict})
-                ans_dict = \
-                    {'message': 'Customer address has been updated',
-                     'success': True}
-            else:
-                ans_dict = {'message': 'Customer not found'}
-        else:
-            ans_dict = {'message': 'Please provide Customer name'}
-        return ans_dict
+        return self.update_customer(name, {'address': address},
+                                    'Customer address has been updated')
 
     def update_customer_phone(self, name='', phone=''):
         """It takes customer name and phone to update the customer phone if 
@@ -228,185 +784,1713 @@ class ServerOperations:
         dict
             a dict containing success/error message
         """
-        if name:
-            if self.database_dict.get(name):
-                data_dict = self.database_dict.get(name)
-                data_dict.update({'phone': phone})
-                self.database_dict.update({name: data_dict})
-                ans_dict = \
-                    {'message': 'Customer phone has been updated',
-                     'success': True}
+        return self.update_customer(name, {'phone': phone},
+                                    'Customer phone has been updated')
+
+    def update_customer(self, name='', fields=None,
+                        message='Customer has been updated'):
+        """It takes customer name and the fields to change and update all
+        of them at once if customer name is already exists and return the
+        success message
+        Otherwise return error message
+
+        Parameters
+        ----------
+        name : str
+            The name of the customer
+        fields : dict
+            The new values, any of 'age', 'address' and 'phone'
+        message : str
+            The success message
+
+        Returns
+        -------
+        dict
+            a dict containing success/error message
+        """
+        with self.lock.write_locked():
+            (ans_dict, seq) = self.modify_customer(name, fields, message)
+        self.wait_durable(seq)
+        return ans_dict
+
+    def modify_customer(self, name='', fields=None,
+                        message='Customer has been updated'):
+        """It takes customer name and the fields to change and update all
+        of them if customer name is already exists, the caller must hold
+        the lock for writing
+
+        Parameters
+        ----------
+        name : str
+            The name of the customer
+        fields : dict
+            The new values, any of 'age', 'address' and 'phone'
+        message : str
+            The success message
+
+        Returns
+        -------
+        tuple
+            a tuple of the dict containing success/error message and the
+            sequence number of the logged change (0 when nothing changed)
+        """
+        seq = 0
+        name = self.batch_name(name)
+        if not name:
+            ans_dict = {'message': 'Please provide Customer name'}
+        elif not isinstance(fields, dict) or not fields:
+            ans_dict = {'message': 'Please provide the fields to update'}
+        elif not set(fields) <= UPDATABLE_FIELDS:
+            ans_dict = {'message': 'Only age, address and phone can be '
+                                   'updated'}
+        else:
+            # checked before any change, like in insert_customer
+            ans_dict = self.check_fields(fields)
+        if ans_dict is None:
+            self.materialize(name)
+            record = self.database_dict.get(name)
+            if record:
+                if self.indexes is not None:
+                    self.indexes.remove(record)
+                for (field, value) in fields.items():
+                    setattr(record, field, value)
+                if self.indexes is not None:
+                    self.indexes.add(record)
+                self.version += 1
+                seq = self.log_mutation(
+                    {'op': 'update', 'name': name, 'fields': fields})
+                ans_dict = {'message': message, 'success': True}
             else:
                 ans_dict = {'message': 'Customer not found'}
-        else:
-            ans_dict = {'message': 'Please provide Customer name'}
-        return ans_dict
+        return (ans_dict, seq)
 
-    def sort_database(self):
-        """It sorts the customer data based on customer name
+    def search_customers(self, prefix='', limit=SEARCH_LIMIT,
+                         case_sensitive=False):
+        """It takes the beginning of a name and return the customers whose
+        name starts with it, in name order. The sorted index is ordered by
+        lower case name so the matches are contiguous: a bisect finds the
+        first one and the walk stops after the last one or at the limit
+
+        Parameters
+        ----------
+        prefix : str
+            The beginning of the customer name
+        limit : int
+            The largest number of customers returned
+        case_sensitive : bool
+            Whether the case of the prefix must match, the strings 'true',
+            'false', '1' and '0' are accepted too
 
         Returns
         -------
         dict
-            a dict containing customers data
+            a dict containing the list of matching customers
+            Otherwise return error message
+        """
+        if not prefix or not isinstance(prefix, str):
+            return {'message': 'Please provide the beginning of the name'}
+        try:
+            limit = int(limit)
+        except (TypeError, ValueError):
+            limit = 0
+        if not 0 < limit <= MAX_REPORT_PAGE_SIZE:
+            return {'message': 'Limit must be between 1 and {}'
+                    .format(MAX_REPORT_PAGE_SIZE)}
+        # the string 'false' must not be taken as true
+        if case_sensitive in (True, 'true', '1'):
+            case_sensitive = True
+        elif case_sensitive in (False, 'false', '0', None):
+            case_sensitive = False
+        else:
+            return {'message': 'Case sensitive must be true or false'}
+
+        lower_prefix = prefix.lower()
+        customers = []
+        self.loaded.wait()
+        with self.lock.read_locked():
+            sorted_index = self.sorted_index
+            position = bisect.bisect_left(sorted_index, (lower_prefix, ))
+            while position < len(sorted_index) and len(customers) < limit:
+                (lower_name, name) = sorted_index[position]
+                if not lower_name.startswith(lower_prefix):
+                    break
+                if not case_sensitive or name.startswith(prefix):
+                    customers.append(self.database_dict[name].to_dict())
+                position += 1
+        return {'customers': customers}
+
+    def index_customer(self, record):
+        """It adds a customer record to the sorted name index and to the
+        secondary indexes, the caller must hold the lock for writing
+
+        Parameters
+        ----------
+        record : Customer
+            The customer record
         """
-        keys = sorted(self.database_dict, key=str.lower)
-        res_data_dict = {}
-        for key in keys:
-            res_data_dict.update({key: self.database_dict.get(key)})
-        return res_data_dict
+        bisect.insort(self.sorted_index, (record.name.lower(), record.name))
+        if self.indexes is not None:
+            self.indexes.add(record)
+
+    def unindex_customer(self, record):
+        """It removes a customer record from the sorted name index and
+        from the secondary indexes, the caller must hold the lock for
+        writing. A record loaded from the snapshot is not indexed until
+        the whole snapshot is loaded, it is then ignored
 
-    def read_file(self, path_name='data.txt'):
-        """It takes file path and load the customer data into the server
-    
         Parameters
         ----------
-        path_name : str
-            The path file
+        record : Customer
+            The customer record
         """
-        with open(path_name, 'r') as data_file:
-            for line in data_file:
+        key = (record.name.lower(), record.name)
+        index = bisect.bisect_left(self.sorted_index, key)
+        if index < len(self.sorted_index) and self.sorted_index[index] == key:
+            del self.sorted_index[index]
+        if self.indexes is not None:
+            self.indexes.remove(record)
 
-                value_dict = {
-                    'name': '',
-                    'age':'',
-                    'address':'',
-                    'phone':''
-                }
+    def rebuild_indexes(self):
+        """It builds the sorted name index and the secondary indexes again
+        from the customer data
+        """
+        self.sorted_index = sorted((name.lower(), name)
+                                   for name in self.database_dict)
+        if self.indexes is not None:
+            self.indexes.rebuild(self.database_dict.values())
 
-                line = line.split('|')
-                try:
-                    name = line[0].strip()
-                except Exception:
-                    name = ''
-                    pass
+    def find_by_phone(self, phone='', limit=REPORT_PAGE_SIZE):
+        """It takes a phone and return the customers with that phone
 
-                if not name or self.database_dict.get(name):
-                    continue
+        Parameters
+        ----------
+        phone : str
+            The phone of the customer
+        limit : int
+            The largest number of customers returned
 
-                try:
-                    age = int(line[1].strip())
-                except Exception:
-                    age = ''
-                    pass
+        Returns
+        -------
+        dict
+            a dict containing the list of customers in name order
+            Otherwise return error message
+        """
+        error = self.check_index('phone', limit)
+        if error:
+            return error
+        if not phone or not isinstance(phone, str):
+            return {'message': 'Please provide Customer phone'}
+        self.loaded.wait()
+        with self.lock.read_locked():
+            names = self.indexes.find_phone(phone)
+            return {'customers': self.indexed_customers(names, limit)}
 
-                try:
-                    address = line[2].strip()
-                except Exception:
-                    address = ''
-                    pass
+    def find_by_age(self, min_age='', max_age='', limit=REPORT_PAGE_SIZE):
+        """It takes an age range and return the customers with an age in
+        it (both ends included), ordered by age and name
 
-                try:
-                    phone = line[3].strip()
-                except Exception:
-                    phone = ''
-                    pass
+        Parameters
+        ----------
+        min_age : int
+            The lowest age
+        max_age : int
+            The highest age, same as min_age when empty
+        limit : int
+            The largest number of customers returned
 
-                value_dict.update({'name': name})
-                value_dict.update({'age': age})
-                value_dict.update({'address': address})
-                value_dict.update({'phone': phone})
+        Returns
+        -------
+        dict
+            a dict containing the list of customers
+            Otherwise return error message
+        """
+        error = self.check_index('age', limit)
+        if error:
+            return error
+        if max_age in ('', None):
+            max_age = min_age
+        min_age = index_age(min_age)
+        max_age = index_age(max_age)
+        if min_age is None or max_age is None:
+            return {'message': 'Please enter valid age'}
+        self.loaded.wait()
+        with self.lock.read_locked():
+            names = self.indexes.find_age_range(min_age, max_age,
+                                                int(limit))
+            return {'customers': [self.database_dict[name].to_dict()
+                                  for name in names]}
 
-                self.database_dict.update({name: value_dict})
+    def find_by_address(self, words='', limit=REPORT_PAGE_SIZE):
+        """It takes words and return the customers whose address contains
+        all of them (case insensitive)
 
+        Parameters
+        ----------
+        words : str
+            The words to look for in the address
+        limit : int
+            The largest number of customers returned
 
-class Server(socketserver.BaseRequestHandler):
-    """
-    A class used to communicate with client via socket programming
-    """
-    def handle(self):
+        Returns
+        -------
+        dict
+            a dict containing the list of customers in name order
+            Otherwise return error message
+        """
+        error = self.check_index('address', limit)
+        if error:
+            return error
+        if not words or not isinstance(words, str):
+            return {'message': 'Please provide Customer address'}
+        self.loaded.wait()
+        with self.lock.read_locked():
+            names = self.indexes.find_address(words)
+            return {'customers': self.indexed_customers(names, limit)}
 
-        server_operation_obj = self.server.server_operation_obj
+    def check_index(self, field, limit):
+        """It returns an error message when the index of the field is not
+        enabled or the limit is not valid, None otherwise"""
+        if self.indexes is None or field not in self.indexes.fields:
+            return {'message': 'The {} index is not enabled'.format(field)}
+        try:
+            limit = int(limit)
+        except (TypeError, ValueError):
+            limit = 0
+        if not 0 < limit <= MAX_REPORT_PAGE_SIZE:
+            return {'message': 'Limit must be between 1 and {}'
+                    .format(MAX_REPORT_PAGE_SIZE)}
+        return None
 
-        while True:
-            try:
-                # checking data recieved from client
-                data = self.request.recv(65536)
-                if not data:
-                    break
+    def indexed_customers(self, names, limit):
+        """It returns the records of the names in name order, at most
+        limit of them, the caller must hold the lock"""
+        keys = heapq.nsmallest(int(limit),
+                               ((name.lower(), name) for name in names))
+        return [self.database_dict[name].to_dict() for (_, name) in keys]
 
-                req_dict = json.loads(data.decode('utf-8'))
-                choice = req_dict.get('choice', None)
-
-                if choice == '1':
-                    # To find customer data
-                    res_data_dict = \
-                        server_operation_obj.get_customer(req_dict.get('name'
-                            , ''))
-                    self.request.sendto(json.dumps(res_data_dict).encode('utf-8'
-                            ), self.client_address)
-
-                elif choice == '2':
-                    # To add customer data
-                    name = req_dict.get('name', '')
-                    age = req_dict.get('age', '')
-                    address = req_dict.get('address', '')
-                    phone = req_dict.get('phone', '')
-                    res_data_dict = \
-                        server_operation_obj.add_customer(name, age,
-                            address, phone)
-                    self.request.sendto(json.dumps(res_data_dict).encode('utf-8'
-                            ), self.client_address)
-
-                elif choice == '3':
-                    # To delete specific customer data
-                    res_data_dict = \
-                        server_operation_obj.delete_customer(req_dict.get('name'
-                            , ''))
-                    self.request.sendto(json.dumps(res_data_dict).encode('utf-8'
-                            ), self.client_address)
-
-                elif choice == '4':
-                    # To update customer age
-                    name = req_dict.get('name', '')
-                    age = req_dict.get('age', '')
-                    res_data_dict = \
-                        server_operation_obj.update_customer_age(name,
-                            age)
-                    self.request.sendto(json.dumps(res_data_dict).encode('utf-8'
-                            ), self.client_address)
-
-                elif choice == '5':
-                    # To update customer address
-                    name = req_dict.get('name', '')
-                    address = req_dict.get('address', '')
-                    res_data_dict = \
-                        server_operation_obj.update_customer_address(name,
-                            address)
-                    self.request.sendto(json.dumps(res_data_dict).encode('utf-8'
-                            ), self.client_address)
-
-                elif choice == '6':
-                    # To update customer phone
-                    name = req_dict.get('name', '')
-                    phone = req_dict.get('phone', '')
-                    res_data_dict = \
-                        server_operation_obj.update_customer_phone(name,
-                            phone)
-                    self.request.sendto(json.dumps(res_data_dict).encode('utf-8'
-                            ), self.client_address)
-
-                elif choice == '7':
-                    # To sort and return customer data
-                    res_data_dict = server_operation_obj.sort_database()
-                    self.request.sendto(json.dumps(res_data_dict).encode('utf-8'
-                            ), self.client_address)
-
-            except Exception as e:
-                break
+    def sort_database(self):
+        """It returns the customer data ordered by customer name
+        (case insensitive), walking the sorted index without sorting
 
+        Returns
+        -------
+        dict
+            a dict containing customers data
+        """
+        self.loaded.wait()
+        with self.lock.read_locked():
+            return self.ordered_database()
 
-if __name__ == '__main__':
-    
-    HOST_NAME = 'localhost'
-    PORT = 9999
+    def ordered_database(self):
+        """It returns the customer data ordered by customer name, the
+        caller must hold the lock
+
+        Returns
+        -------
+        dict
+            a dict containing customers data
+        """
+        database_dict = self.database_dict
+        return {name: database_dict[name].to_dict()
+                for (_, name) in self.sorted_index}
+
+    def ordered_columns(self):
+        """It returns the customer data ordered by customer name in the
+        columnar layout, the caller must hold the lock
+
+        Returns
+        -------
+        dict
+            a dict containing the list of values of every field
+        """
+        database_dict = self.database_dict
+        records = [database_dict[name] for (_, name) in self.sorted_index]
+        return {'columns': {
+            'name': [record.name for record in records],
+            'age': [record.age for record in records],
+            'address': [record.address for record in records],
+            'phone': [record.phone for record in records]}}
+
+    def report_frame(self, codec=JSON_CODEC, layout='rows',
+                     compress_min=None):
+        """It returns the whole report framed with the codec and the
+        compression of the connection. The frame is cached per encoding
+        and layout with the version of the customer data and served again
+        until a change increases the version, the compressed frame is
+        cached next to it the first time it is asked
+
+        Parameters
+        ----------
+        codec : codec
+            The encoding of the connection, JSON by default
+        layout : str
+            The layout of the report, one of REPORT_LAYOUTS
+        compress_min : int
+            The size from which the connection compresses the responses,
+            None when it does not
+
+        Returns
+        -------
+        bytes
+            a byte string containing the framed report, None when the
+            report is larger than MAX_FRAME_SIZE
+        """
+        self.loaded.wait()
+        with self.lock.read_locked():
+            report_cache = self.report_cache.get((codec.name, layout))
+            if report_cache is not None and report_cache[0] == self.version:
+                with self.cache_lock:
+                    self.report_cache_hits += 1
+            else:
+                if layout == 'columns':
+                    payload = codec.encode(self.ordered_columns())
+                else:
+                    payload = codec.encode(self.ordered_database())
+                # a report too large for one frame is remembered as None
+                # so it is not encoded again until the data changes
+                try:
+                    frame = encode_frame(payload)
+                except ValueError:
+                    frame = None
+                report_cache = [self.version, frame, None]
+                self.report_cache[(codec.name, layout)] = report_cache
+                with self.cache_lock:
+                    self.report_cache_misses += 1
+            frame = report_cache[1]
+            if frame is None or compress_min is None \
+                    or len(frame) - HEADER.size < compress_min:
+                return frame
+            if report_cache[2] is None:
+                report_cache[2] = encode_frame(frame[HEADER.size:],
+                                               compress_min)
+            return report_cache[2]
+
+    def report_cache_stats(self):
+        """It returns the cache hit/miss counters of the report
+
+        Returns
+        -------
+        dict
+            a dict containing the hits, misses and data version
+        """
+        with self.cache_lock:
+            return {'hits': self.report_cache_hits,
+                    'misses': self.report_cache_misses,
+                    'version': self.version}
+
+    def stats(self):
+        """It returns the metrics of the server with the number of
+        customers and the report cache counters
+
+        Returns
+        -------
+        dict
+            a dict containing the metrics
+        """
+        extra = {
+            'customers': len(self.database_dict),
+            'loaded': self.loaded.is_set(),
+            'report_cache': self.report_cache_stats(),
+            'reload': dict(self.reload_state),
+        }
+        replication = self.replication_status()
+        if replication is not None:
+            extra['replication'] = replication
+        return self.metrics.stats(extra)
+
+    def replication_status(self):
+        """It returns the replication state of the primary or the replica,
+        None when the server does not replicate"""
+        if self.replica is not None:
+            return self.replica.status()
+        if self.stream is not None:
+            return self.stream.status()
+        return None
+
+    def metrics_text(self):
+        """It returns the metrics of the server as plain text, for the
+        metrics port
+
+        Returns
+        -------
+        str
+            the metrics in the Prometheus text format
+        """
+        report_cache = self.report_cache_stats()
+        extra = {
+            'customers': len(self.database_dict),
+            'report_cache_hits_total': report_cache['hits'],
+            'report_cache_misses_total': report_cache['misses'],
+            'data_version': report_cache['version'],
+        }
+        replication = self.replication_status()
+        if replication is not None and self.replica is not None:
+            extra['replication_applied_seq'] = replication['applied_seq']
+            extra['replication_lag_ops'] = replication['lag_ops']
+            extra['replication_lag_seconds'] = replication['lag_seconds']
+            extra['replication_connected'] = int(replication['connected'])
+            extra['replication_errors'] = replication['errors']
+        elif replication is not None:
+            extra['replication_seq'] = replication['seq']
+            extra['replication_replicas'] = len(replication['replicas'])
+        return self.metrics.render_text(extra)
+
+    def report_page(self, page_size=REPORT_PAGE_SIZE, cursor=''):
+        """It returns one page of the customer data ordered by customer
+        name and the cursor to pass for the next page
+
+        Parameters
+        ----------
+        page_size : int
+            The number of customers in the page
+        cursor : str
+            The cursor returned with the previous page, empty for the
+            first page
+
+        Returns
+        -------
+        dict
+            a dict containing the list of customers and the cursor of the
+            next page (empty when it was the last page)
+            Otherwise return error message
+        """
+        page = self.page_records(page_size, cursor, Customer.to_dict)
+        if isinstance(page, dict):
+            return page
+        return {'customers': page[0], 'cursor': page[1]}
+
+    def export_page(self, page_size=EXPORT_PAGE_SIZE, cursor=''):
+        """It returns one page of the customer data ordered by customer
+        name, as the lines of a data file, and the cursor to pass for the
+        next page. An export is streamed page by page so neither end holds
+        more than one page
+
+        Parameters
+        ----------
+        page_size : int
+            The number of customers in the page
+        cursor : str
+            The cursor returned with the previous page, empty for the
+            first page
+
+        Returns
+        -------
+        dict
+            a dict containing the lines and the cursor of the next page
+            (empty when it was the last page)
+            Otherwise return error message
+        """
+        try:
+            page = self.page_records(page_size, cursor, format_line)
+        except ValueError as e:
+            return {'message': 'Customer data can not be exported: {}'
+                    .format(e)}
+        if isinstance(page, dict):
+            return page
+        return {'lines': ''.join(page[0]), 'cursor': page[1]}
+
+    def page_records(self, page_size, cursor, convert):
+        """It returns the converted customers of one page and the cursor
+        of the next page, or the error message of invalid arguments"""
+        try:
+            page_size = int(page_size)
+        except (TypeError, ValueError):
+            page_size = 0
+        if not 0 < page_size <= MAX_REPORT_PAGE_SIZE:
+            return {'message': 'Page size must be between 1 and {}'
+                    .format(MAX_REPORT_PAGE_SIZE)}
+        after_key = None
+        if cursor:
+            after_key = self.decode_cursor(cursor)
+            if after_key is None:
+                return {'message': 'Invalid cursor'}
+
+        self.loaded.wait()
+        with self.lock.read_locked():
+            start = 0
+            if after_key:
+                start = bisect.bisect_right(self.sorted_index, after_key)
+            keys = self.sorted_index[start:start + page_size]
+            customers = [convert(self.database_dict[name])
+                         for (_, name) in keys]
+            next_cursor = ''
+            if keys and start + page_size < len(self.sorted_index):
+                next_cursor = self.encode_cursor(keys[-1])
+        return (customers, next_cursor)
+
+    @staticmethod
+    def encode_cursor(key):
+        """It takes a sorted index key and return it as an opaque cursor
+
+        Parameters
+        ----------
+        key : tuple
+            The (lower case name, name) key of the last customer in a page
+
+        Returns
+        -------
+        str
+            a string containing the cursor
+        """
+        return base64.urlsafe_b64encode(
+            json.dumps(list(key)).encode('utf-8')).decode('ascii')
+
+    @staticmethod
+    def decode_cursor(cursor):
+        """It takes a cursor and return the sorted index key it resumes
+        after, or None when the cursor is not valid
+
+        Parameters
+        ----------
+        cursor : str
+            The cursor returned with a report page
+
+        Returns
+        -------
+        tuple
+            a tuple containing the (lower case name, name) key
+        """
+        try:
+            key = json.loads(base64.urlsafe_b64decode(
+                cursor.encode('ascii')).decode('utf-8'))
+            (lower_name, name) = key
+            if isinstance(lower_name, str) and isinstance(name, str):
+                return (lower_name, name)
+        except Exception:
+            pass
+        return None
+
+    def owns(self, name):
+        """It returns True when the customer name belongs to the shard of
+        this server (always True when the server is not sharded)"""
+        return self.shard is None or \
+            shard_of(name, self.shard[1]) == self.shard[0]
+
+    def read_file(self, path_name='data.txt'):
+        """It takes file path and load the customer data into the server
+    
+        Parameters
+        ----------
+        path_name : str
+            The path file
+        """
+        with open(path_name, 'r') as data_file:
+            for line in data_file:
+                record = parse_line(line)
+                if record is None or self.database_dict.get(record[0]) \
+                        or not self.owns(record[0]):
+                    continue
+                self.database_dict[record[0]] = Customer(*record)
+
+        self.rebuild_indexes()
+        self.version += 1
+
+    def read_file_parallel(self, path_name='data.txt', workers=None):
+        """It takes file path and load the customer data into the server,
+        the file is split into byte ranges at line boundaries which are
+        parsed by a pool of processes. The chunks are merged in file order
+        so the first occurrence of a name still wins like in read_file
+
+        Parameters
+        ----------
+        path_name : str
+            The path file
+        workers : int
+            The number of processes, the number of CPUs when None
+        """
+        database_dict = self.database_dict
+        for chunk in load_chunks(path_name, workers):
+            for record in chunk:
+                if database_dict.get(record[0]) or not self.owns(record[0]):
+                    continue
+                database_dict[record[0]] = Customer(*record)
+
+        self.rebuild_indexes()
+        self.version += 1
+
+    def replay_log(self, path_name):
+        """It applies the changes stored in a mutation log file on top of
+        the loaded customer data
+
+        Parameters
+        ----------
+        path_name : str
+            The path of the log file
+
+        Returns
+        -------
+        int
+            the number of changes applied
+        """
+        count = 0
+        for op_dict in MutationLog.replay(path_name):
+            if op_dict == RELOAD_MARKER:
+                self.reset_to_data_file()
+            else:
+                self.apply_mutation(op_dict)
+            count += 1
+        return count
+
+    def reset_to_data_file(self):
+        """It drops the customer data, and the snapshot it was read from,
+        and loads the data file again, for the reload marker of the log
+        """
+        if self.snapshot is not None:
+            self.snapshot.close()
+            self.snapshot = None
+        self.database_dict = {}
+        self.deleted = set()
+        self.read_file(self.path_name)
+        if self.stream is not None:
+            # the changes streamed so far were made to the old data
+            self.stream.reset()
+
+    def apply_mutation(self, op_dict):
+        """It applies one change read from the mutation log or received
+        from the primary
+
+        Parameters
+        ----------
+        op_dict : dict
+            The change of the customer data
+        """
+        name = op_dict.get('name', '')
+        op = op_dict.get('op')
+        if op == 'add':
+            self.add_customer(name, op_dict.get('age', ''),
+                              op_dict.get('address', ''),
+                              op_dict.get('phone', ''))
+        elif op == 'delete':
+            self.delete_customer(name)
+        elif op == 'update':
+            self.update_customer(name, op_dict.get('fields'))
+
+    def replication_copy(self):
+        """It returns the customer data ordered by customer name with the
+        sequence number of the last change it contains, for a replica
+        which can not follow the stream from where it stopped
+
+        Returns
+        -------
+        tuple
+            a tuple of the sequence number and the list of customer dicts
+        """
+        self.loaded.wait()
+        # the changes are numbered under the lock held for writing, so no
+        # change is missing from the copy or counted twice
+        with self.lock.read_locked():
+            database_dict = self.database_dict
+            return (self.stream.seq,
+                    [database_dict[name].to_dict()
+                     for (_, name) in self.sorted_index])
+
+    def replace_data(self, customers):
+        """It replaces all the customer data with the copy sent by the
+        primary, the readers see either the old or the new data
+
+        Parameters
+        ----------
+        customers : list
+            The customer dicts with name, age, address and phone
+        """
+        database_dict = {}
+        for customer in customers:
+            database_dict[customer['name']] = Customer(
+                customer['name'], customer.get('age', ''),
+                customer.get('address', ''), customer.get('phone', ''))
+        with self.lock.write_locked():
+            self.database_dict = database_dict
+            self.rebuild_indexes()
+            self.version += 1
+
+    def log_mutation(self, op_dict):
+        """It appends a change to the mutation log, the caller must hold
+        the lock for writing so the log keeps the order of the changes
+
+        Parameters
+        ----------
+        op_dict : dict
+            The change of the customer data
+
+        Returns
+        -------
+        int
+            the sequence number of the change, 0 without a log
+        """
+        if self.stream is not None:
+            self.stream.publish(op_dict)
+        if self.log is None:
+            return 0
+        return self.log.append(op_dict)
+
+    def wait_durable(self, seq):
+        """It waits until a logged change is on disk, it is called after
+        the lock is released so one group commit covers many writers
+
+        Parameters
+        ----------
+        seq : int
+            The sequence number returned by log_mutation
+        """
+        if seq and self.log is not None:
+            self.log.wait_durable(seq)
+
+    def materialize(self, name):
+        """It copies a customer that is only in the snapshot into the
+        customer data before it is changed, the caller must hold the lock
+        for writing
+
+        Parameters
+        ----------
+        name : str
+            The name of the customer
+        """
+        if self.snapshot is None or name in self.database_dict \
+                or name in self.deleted:
+            return
+        record = self.snapshot.find(name)
+        if record:
+            self.database_dict[name] = record
+            self.index_customer(record)
+
+    def load_snapshot(self, batch_size=10000):
+        """It loads the customer data from the snapshot in batches, the
+        lock is released between the batches so requests keep flowing
+
+        Parameters
+        ----------
+        batch_size : int
+            The number of records loaded per lock acquisition
+        """
+        snapshot = self.snapshot
+        for start in range(0, len(snapshot), batch_size):
+            with self.lock.write_locked():
+                for position in range(start,
+                                      min(start + batch_size, len(snapshot))):
+                    name = snapshot.name_at(position)
+                    if name in self.database_dict or name in self.deleted:
+                        continue
+                    self.database_dict[name] = snapshot.record_at(position)
+        with self.lock.write_locked():
+            # the snapshot is in name order so this sort is mostly merging
+            self.rebuild_indexes()
+            self.snapshot = None
+            self.deleted = set()
+            self.version += 1
+        snapshot.close()
+        self.loaded.set()
+        print("Data successfully loaded into server !")
+
+    def write_snapshot(self, path_name=None):
+        """It writes the customer data to a binary snapshot file, the
+        mutation log is emptied as its changes are now in the snapshot
+
+        Parameters
+        ----------
+        path_name : str
+            The path of the snapshot file, the configured snapshot path
+            when None
+
+        Returns
+        -------
+        dict
+            a dict containing success/error message
+        """
+        path_name = path_name or self.snapshot_path
+        if not path_name:
+            return {'message': 'Snapshot path is not configured'}
+        self.loaded.wait()
+        # no change can happen while the lock is held for reading, so the
+        # snapshot and the emptied log stay consistent
+        with self.lock.read_locked():
+            database_dict = self.database_dict
+            try:
+                Snapshot.write(path_name,
+                               (database_dict[name]
+                                for (_, name) in self.sorted_index),
+                               len(self.sorted_index))
+            except (TypeError, ValueError) as e:
+                # the log is kept, it still holds the changes
+                return {'message': 'Snapshot not saved: {}'.format(e)}
+            if self.log is not None:
+                self.log.truncate()
+            count = len(self.sorted_index)
+        return {'message': 'Snapshot of {} customers saved'.format(count),
+                'success': True}
+
+    def start_reload(self, mode='diff', batch_size=RELOAD_BATCH_SIZE):
+        """It reads the data file again in a background thread and makes
+        the customer data match it, the requests are served meanwhile.
+        Only one reload runs at a time
+
+        Parameters
+        ----------
+        mode : str
+            'diff' applies only the added, removed and changed customers in
+            small batches, 'swap' builds the new customer data aside and
+            swaps it in at once
+        batch_size : int
+            The number of customers changed per lock acquisition in the
+            diff mode
+
+        Returns
+        -------
+        dict
+            a dict containing success/error message
+        """
+        if mode not in RELOAD_MODES:
+            return {'message': 'Reload mode must be one of {}'.format(
+                ', '.join(RELOAD_MODES))}
+        try:
+            batch_size = int(batch_size)
+        except (TypeError, ValueError):
+            batch_size = 0
+        if not 0 < batch_size <= MAX_BATCH_SIZE:
+            return {'message': 'Batch size must be between 1 and {}'
+                    .format(MAX_BATCH_SIZE)}
+        if not os.path.exists(self.path_name):
+            return {'message': 'Data file not found'}
+        with self.reload_lock:
+            if self.reload_state['state'] == 'running':
+                return {'message': 'A reload is already running'}
+            self.reload_state = {'state': 'running', 'mode': mode,
+                                 'path': self.path_name,
+                                 'started': time.time(), 'added': 0,
+                                 'removed': 0}
+            if mode == 'diff':
+                self.reload_state.update(changed=0, unchanged=0)
+        threading.Thread(target=self.run_reload, args=(mode, batch_size),
+                         daemon=True).start()
+        return {'message': 'Reload of {} started'.format(self.path_name),
+                'success': True}
+
+    def run_reload(self, mode, batch_size):
+        state = self.reload_state
+        try:
+            self.loaded.wait()
+            if mode == 'swap':
+                self.reload_swap()
+            else:
+                self.reload_diff(batch_size)
+            state['finished'] = time.time()
+            state['state'] = 'done'
+        except Exception as e:
+            state['finished'] = time.time()
+            state['error'] = str(e)
+            state['state'] = 'failed'
+
+    def read_records(self):
+        """It yields the customers of the data file with the rules of
+        read_file: the first occurrence of a name wins and the names of
+        other shards are skipped"""
+        seen = set()
+        with open(self.path_name, 'r') as data_file:
+            for line in data_file:
+                record = parse_line(line)
+                if record is None or record[0] in seen \
+                        or not self.owns(record[0]):
+                    continue
+                seen.add(record[0])
+                yield record
+
+    def reload_diff(self, batch_size=RELOAD_BATCH_SIZE):
+        """It makes the customer data match the data file by applying
+        only the differences: the customers of the file are compared in
+        batches under the lock and added or changed when they differ, then
+        the customers missing from the file are removed in batches. The
+        lock is released between the batches so the latency of the other
+        requests stays stable. The changes are logged and replicated like
+        the changes of the clients
+
+        Parameters
+        ----------
+        batch_size : int
+            The number of customers compared per lock acquisition
+        """
+        state = self.reload_state
+        names = set()
+        batch = []
+        for record in self.read_records():
+            names.add(record[0])
+            batch.append(record)
+            if len(batch) >= batch_size:
+                self.apply_reload_batch(batch, state)
+                batch = []
+                time.sleep(RELOAD_PAUSE)
+        if batch:
+            self.apply_reload_batch(batch, state)
+
+        with self.lock.read_locked():
+            removed = [name for name in self.database_dict
+                       if name not in names]
+        for start in range(0, len(removed), batch_size):
+            time.sleep(RELOAD_PAUSE)
+            last_seq = 0
+            with self.lock.write_locked():
+                for name in removed[start:start + batch_size]:
+                    (ans_dict, seq) = self.remove_customer(name)
+                    if ans_dict.get('success'):
+                        state['removed'] += 1
+                    last_seq = max(last_seq, seq)
+            self.wait_durable(last_seq)
+
+    def apply_reload_batch(self, records, state):
+        """It adds or changes the customers of a batch of the data file
+        which differ from the customer data, under one acquisition of the
+        lock"""
+        last_seq = 0
+        with self.lock.write_locked():
+            for (name, age, address, phone) in records:
+                record = self.database_dict.get(name)
+                if record is None:
+                    (ans_dict, seq) = self.insert_customer(name, age,
+                                                           address, phone)
+                    if ans_dict.get('success'):
+                        state['added'] += 1
+                else:
+                    fields = {}
+                    for (field, value) in (('age', age), ('address', address),
+                                           ('phone', phone)):
+                        if getattr(record, field) != value:
+                            fields[field] = value
+                    if not fields:
+                        state['unchanged'] += 1
+                        continue
+                    (ans_dict, seq) = self.modify_customer(name, fields)
+                    if ans_dict.get('success'):
+                        state['changed'] += 1
+                last_seq = max(last_seq, seq)
+        self.wait_durable(last_seq)
+
+    def reload_swap(self):
+        """It builds the customer data of the data file and its indexes
+        aside, then swaps them in under one short acquisition of the lock.
+        The mutation log is emptied as its changes are not part of the new
+        data, and the replicas get a full copy. With a snapshot, the old
+        snapshot and the log stay the restart point until the new snapshot
+        is written: the log gets RELOAD_MARKER, on disk before the reload
+        is finished, so a restart replays the changes made since the swap
+        on the data file and not on the old data
+
+        Raises
+        ------
+        RuntimeError
+            When the new snapshot can not be written
+        """
+        database_dict = {}
+        for record in self.read_records():
+            database_dict[record[0]] = Customer(*record)
+        sorted_index = sorted((name.lower(), name) for name in database_dict)
+        indexes = None
+        if self.indexes is not None:
+            indexes = SecondaryIndexes(self.indexes.fields)
+            indexes.rebuild(database_dict.values())
+
+        state = self.reload_state
+        seq = 0
+        with self.lock.write_locked():
+            old_dict = self.database_dict
+            (self.database_dict, self.sorted_index, self.indexes) = \
+                (database_dict, sorted_index, indexes)
+            self.version += 1
+            if self.stream is not None:
+                self.stream.reset()
+            if self.log is not None and self.snapshot_path:
+                # the changes made after the swap are logged after it
+                seq = self.log.append(RELOAD_MARKER)
+            elif self.log is not None:
+                self.log.truncate()
+        self.wait_durable(seq)
+        # the old customer data is not changed any more once swapped out
+        state['added'] = sum(1 for name in database_dict
+                             if name not in old_dict)
+        state['removed'] = sum(1 for name in old_dict
+                               if name not in database_dict)
+        if self.snapshot_path:
+            # the snapshot would start the server with the old data
+            ans_dict = self.write_snapshot()
+            if not ans_dict.get('success'):
+                raise RuntimeError(ans_dict['message'])
+
+
+def report_request(server_operation_obj, req_dict, session):
+    """It returns the report, one page at a time when the client asks for a
+    page size, otherwise the whole (cached) report framed in the layout
+    asked and the encoding and compression of the connection"""
+    if 'page_size' in req_dict:
+        return server_operation_obj.report_page(req_dict.get('page_size'),
+                                                req_dict.get('cursor', ''))
+    layout = req_dict.get('layout', 'rows')
+    if layout not in REPORT_LAYOUTS:
+        return {'message': 'Layout must be one of {}'.format(
+            ', '.join(REPORT_LAYOUTS))}
+    frame = server_operation_obj.report_frame(session.codec, layout,
+                                              session.compress_min)
+    if frame is None:
+        return {'message': TOO_LARGE_MESSAGE}
+    return frame
+
+
+def profile_request(server_operation_obj, req_dict):
+    """It switches the request profiler on ('start') or off ('stop'), or
+    returns its results ('dump')"""
+    profiler = server_operation_obj.profiler
+    action = req_dict.get('action', 'dump')
+    if action == 'start':
+        try:
+            profiler.start(req_dict.get('sample_every', 100),
+                           req_dict.get('keep', 20))
+        except (TypeError, ValueError):
+            return {'message': 'Invalid profile options'}
+        return {'message': 'Profiling started', 'success': True}
+    if action == 'stop':
+        profiler.stop()
+        return {'message': 'Profiling stopped', 'success': True}
+    if action == 'dump':
+        return profiler.report()
+    return {'message': 'Invalid profile action'}
+
+
+def reload_request(server_operation_obj, req_dict):
+    """It starts a reload of the data file ('start') or returns the
+    progress of the last one ('status')"""
+    action = req_dict.get('action', 'start')
+    if action == 'start':
+        return server_operation_obj.start_reload(
+            req_dict.get('mode', 'diff'),
+            req_dict.get('batch_size', RELOAD_BATCH_SIZE))
+    if action == 'status':
+        return dict(server_operation_obj.reload_state)
+    return {'message': 'Invalid reload action'}
+
+
+def handshake_request(server_operation_obj, req_dict, session):
+    """It chooses the encoding and the compression of the connection among
+    the ones offered by the client. The answer is still sent in the
+    previous encoding, the following requests and responses use the chosen
+    one. The responses of at least compress_min bytes are compressed"""
+    session.codec = negotiate_codec(req_dict.get('encodings'))
+    compression = negotiate_compression(req_dict.get('compression'))
+    session.compress_min = None
+    if compression is not None:
+        compress_min = req_dict.get('compress_min', COMPRESSION_THRESHOLD)
+        if not isinstance(compress_min, int) or compress_min < 0:
+            compress_min = COMPRESSION_THRESHOLD
+        session.compress_min = compress_min
+    return {'encoding': session.codec.name, 'compression': compression,
+            'compress_min': session.compress_min, 'success': True}
+
+
+def update_request(server_operation_obj, req_dict):
+    """It updates the fields of a customer present in the request"""
+    fields = {field: req_dict[field] for field in UPDATABLE_FIELDS
+              if field in req_dict}
+    return server_operation_obj.update_customer(req_dict.get('name', ''),
+                                                fields)
+
+
+# Every choice maps to a function taking the ServerOperations object and
+# the request and returning the response
+REQUEST_HANDLERS = {
+    # To find customer data
+    '1': lambda ops, req: ops.get_customer(req.get('name', '')),
+    # To add customer data
+    '2': lambda ops, req: ops.add_customer(
+        req.get('name', ''), req.get('age', ''), req.get('address', ''),
+        req.get('phone', '')),
+    # To delete specific customer data
+    '3': lambda ops, req: ops.delete_customer(req.get('name', '')),
+    # To update customer age
+    '4': lambda ops, req: ops.update_customer_age(req.get('name', ''),
+                                                  req.get('age', '')),
+    # To update customer address
+    '5': lambda ops, req: ops.update_customer_address(
+        req.get('name', ''), req.get('address', '')),
+    # To update customer phone
+    '6': lambda ops, req: ops.update_customer_phone(req.get('name', ''),
+                                                    req.get('phone', '')),
+    # To save the customer data to the binary snapshot
+    '9': lambda ops, req: ops.write_snapshot(),
+    # To find many customers in one request
+    '10': lambda ops, req: ops.get_customers(req.get('names')),
+    # To add many customers in one request
+    '11': lambda ops, req: ops.add_customers(req.get('customers')),
+    # To delete many customers in one request
+    '12': lambda ops, req: ops.delete_customers(req.get('names')),
+    # To update any of age, address and phone of a customer at once
+    '13': update_request,
+    # To find the customers whose name starts with a prefix
+    '14': lambda ops, req: ops.search_customers(
+        req.get('prefix', ''), req.get('limit', SEARCH_LIMIT),
+        req.get('case_sensitive', False)),
+    # To find the customers with a phone (phone index)
+    '15': lambda ops, req: ops.find_by_phone(
+        req.get('phone', ''), req.get('limit', REPORT_PAGE_SIZE)),
+    # To find the customers in an age range (age index)
+    '16': lambda ops, req: ops.find_by_age(
+        req.get('min_age', ''), req.get('max_age', ''),
+        req.get('limit', REPORT_PAGE_SIZE)),
+    # To find the customers whose address has all the words (address index)
+    '17': lambda ops, req: ops.find_by_address(
+        req.get('address', ''), req.get('limit', REPORT_PAGE_SIZE)),
+    # To return the metrics of the server
+    '19': lambda ops, req: ops.stats(),
+    # To switch the request profiler on/off and return its results
+    '20': profile_request,
+    # To add the customers of a chunk of lines of a data file
+    '22': lambda ops, req: ops.import_lines(req.get('lines')),
+    # To return one page of the customer data as lines of a data file
+    '23': lambda ops, req: ops.export_page(
+        req.get('page_size', EXPORT_PAGE_SIZE), req.get('cursor', '')),
+    # To read the data file again and apply it, or follow the reload
+    '24': reload_request,
+}
+
+# The choices that also need the state of the connection (Session)
+SESSION_HANDLERS = {
+    # To sort and return customer data
+    '7': report_request,
+    # To choose the encoding of the connection
+    HANDSHAKE_CHOICE: handshake_request,
+}
+
+
+class Session:
+    """
+    A class used to keep the state of one client connection
+
+    ...
+    Attributes
+    ----------
+    codec : codec
+        the encoding of the requests and responses, JSON until the client
+        negotiates another one
+    compress_min : int
+        the size from which the responses are compressed, None until the
+        client negotiates the compression
+    profiled : list
+        the profiler records of the requests waiting to be sent
+    """
+
+    def __init__(self):
+        self.codec = JSON_CODEC
+        self.compress_min = None
+        self.profiled = []
+
+
+class Server(socketserver.BaseRequestHandler):
+    """
+    A class used to communicate with client via socket programming
+
+    Requests are read as length-prefixed frames, so a client can pipeline
+    several requests on one connection. Every request gets exactly one
+    response and the responses are sent back in the order of the requests.
+    """
+    def handle(self):
+
+        server_operation_obj = self.server.server_operation_obj
+        metrics = server_operation_obj.metrics
+        reader = FrameReader()
+        session = Session()
+
+        metrics.connection_opened()
+        error = False
+        try:
+            while True:
+                # checking data recieved from client
+                data = self.request.recv(BUFF_SIZE)
+                if not data:
+                    break
+                reader.feed(data)
+
+                # answer every complete request of the batch in one send
+                responses = [
+                    self.process_payload(server_operation_obj, payload,
+                                         session)
+                    for payload in reader.frames()]
+                if session.profiled:
+                    start = time.perf_counter()
+                    self.request.sendall(b''.join(responses))
+                    server_operation_obj.profiler.finish(
+                        session.profiled, time.perf_counter() - start)
+                elif responses:
+                    self.request.sendall(b''.join(responses))
+
+        except OSError as e:
+            # the client went away
+            pass
+        except Exception as e:
+            error = True
+        finally:
+            metrics.connection_closed(error)
+
+    @staticmethod
+    def process_payload(server_operation_obj, payload, session):
+        """It takes one request frame payload and return the framed response
+
+        Parameters
+        ----------
+        server_operation_obj : ServerOperations
+            The object holding the customer data
+        payload : bytes
+            The payload of the request frame
+        session : Session
+            The state of the client connection
+
+        Returns
+        -------
+        bytes
+            a byte string containing the framed response
+        """
+        profiler = server_operation_obj.profiler
+        profiling = profiler.enabled
+        start = decoded = dispatched = time.perf_counter()
+        profile = None
+        # the handshake changes the codec only after its own response
+        (codec, compress_min) = (session.codec, session.compress_min)
+        try:
+            req_dict = decode_message(payload, codec)
+        except ValueError:
+            req_dict = None
+        choice = Server.request_choice(req_dict)
+        error = choice == 'invalid'
+        try:
+            if profiling:
+                decoded = time.perf_counter()
+                (res_data_dict, profile) = profiler.run(
+                    lambda: Server.process_request(server_operation_obj,
+                                                   req_dict, session))
+                dispatched = time.perf_counter()
+            else:
+                res_data_dict = Server.process_request(server_operation_obj,
+                                                       req_dict, session)
+            if isinstance(res_data_dict, bytes):
+                # the response is already framed (cached report)
+                response = res_data_dict
+            else:
+                try:
+                    response = encode_message(res_data_dict, codec,
+                                              compress_min)
+                except ValueError:
+                    # larger than a frame, the client can not receive it
+                    error = True
+                    response = encode_message(
+                        {'message': TOO_LARGE_MESSAGE}, codec)
+        except Exception as e:
+            # one failing request must not close the connection, the
+            # pipelined responses after it still have to be sent
+            error = True
+            response = encode_message({'message': 'Internal server error'},
+                                      codec)
+        end = time.perf_counter()
+        server_operation_obj.metrics.record(
+            choice, end - start, len(payload) + 4, len(response), error)
+        if profiling:
+            # the send phase is added once the batch is sent
+            session.profiled.append({
+                'choice': choice, 'time': time.time(),
+                'decode': decoded - start, 'dispatch': dispatched - decoded,
+                'encode': end - dispatched, 'profile': profile})
+        return response
+
+    @staticmethod
+    def request_choice(req_dict):
+        """It returns the choice of a request for the metrics, 'invalid'
+        when the request has no known choice"""
+        if isinstance(req_dict, dict):
+            choice = req_dict.get('choice', None)
+            if isinstance(choice, str) and (choice in REQUEST_HANDLERS
+                                            or choice in SESSION_HANDLERS):
+                return choice
+        return 'invalid'
+
+    @staticmethod
+    def process_request(server_operation_obj, req_dict, session):
+        """It takes request from the client and return the response
+
+        Parameters
+        ----------
+        server_operation_obj : ServerOperations
+            The object holding the customer data
+        req_dict : dict
+            The request received from the client
+        session : Session
+            The state of the client connection
+
+        Returns
+        -------
+        dict or bytes
+            a dict containing the response for the client, or the already
+            framed response
+        """
+        if not isinstance(req_dict, dict):
+            return {'message': 'Invalid request'}
+
+        choice = req_dict.get('choice', None)
+        if not isinstance(choice, str):
+            return {'message': 'Invalid choice'}
+        if choice in SESSION_HANDLERS:
+            return SESSION_HANDLERS[choice](server_operation_obj, req_dict,
+                                            session)
+        if choice in WRITE_CHOICES \
+                and server_operation_obj.replica is not None:
+            return {'message': 'Replica is read-only, send changes to the '
+                               'primary'}
+        handler = REQUEST_HANDLERS.get(choice)
+        if handler is None:
+            # every request is answered to keep pipelined responses in order
+            return {'message': 'Invalid choice'}
+        return handler(server_operation_obj, req_dict)
+
+
+class ThreadedServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """
+    A class used to serve every client connection in its own thread
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 1024
+
+
+class PooledServer(socketserver.TCPServer):
+    """
+    A class used to serve the client connections with a fixed number of
+    worker threads, connections above the worker count wait in a queue
+
+    ...
+    Attributes
+    ----------
+    workers : int
+        the number of worker threads
+    """
+    allow_reuse_address = True
+    request_queue_size = 1024
+
+    def __init__(self, server_address, RequestHandlerClass, workers=8):
+        socketserver.TCPServer.__init__(self, server_address,
+                                        RequestHandlerClass)
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self.process_request_thread, request,
+                             client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        socketserver.TCPServer.server_close(self)
+        self.executor.shutdown(wait=False)
+
+
+class AsyncServer:
+    """
+    A class used to serve all client connections from a single asyncio
+    event loop, which keeps idle connections cheap. Requests are answered
+    by the same Server.process_request dispatch as the socketserver engines,
+    run by a pool of threads: a request waiting for the lock or for its
+    change to be durable must not stop the loop, the other connections
+    would wait too and the group commit would only ever see one change.
+
+    ...
+    Attributes
+    ----------
+    server_operation_obj : ServerOperations
+        the object holding the customer data
+    server_address : tuple
+        the host and port the server listens on
+    executor : ThreadPoolExecutor
+        the threads answering the requests, one batch of a connection at
+        a time so its responses stay in order
+    """
+
+    def __init__(self, server_address, server_operation_obj=None,
+                 workers=8):
+        self.server_address = server_address
+        self.server_operation_obj = server_operation_obj
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+    async def handle_client(self, stream_reader, stream_writer):
+        """It serves one client connection until the client disconnects
+
+        Parameters
+        ----------
+        stream_reader : asyncio.StreamReader
+            The reading side of the connection
+        stream_writer : asyncio.StreamWriter
+            The writing side of the connection
+        """
+        metrics = self.server_operation_obj.metrics
+        loop = asyncio.get_running_loop()
+        reader = FrameReader()
+        session = Session()
+        metrics.connection_opened()
+        error = False
+        try:
+            while True:
+                data = await stream_reader.read(BUFF_SIZE)
+                if not data:
+                    break
+                reader.feed(data)
+
+                payloads = list(reader.frames())
+                if not payloads:
+                    continue
+                responses = await loop.run_in_executor(
+                    self.executor, self.process_payloads, payloads, session)
+                if session.profiled:
+                    start = time.perf_counter()
+                    stream_writer.write(b''.join(responses))
+                    await stream_writer.drain()
+                    self.server_operation_obj.profiler.finish(
+                        session.profiled, time.perf_counter() - start)
+                elif responses:
+                    stream_writer.write(b''.join(responses))
+                    await stream_writer.drain()
+        except OSError as e:
+            # the client went away
+            pass
+        except Exception as e:
+            error = True
+        finally:
+            metrics.connection_closed(error)
+            stream_writer.close()
+
+    def process_payloads(self, payloads, session):
+        """It answers the request frames of one read of a connection, in
+        a thread of the executor, and return the framed responses in order
+        """
+        return [Server.process_payload(self.server_operation_obj, payload,
+                                       session)
+                for payload in payloads]
+
+    async def serve(self):
+        """It listens on the server address and serves the clients forever
+        """
+        (host, port) = self.server_address
+        server = await asyncio.start_server(self.handle_client, host, port,
+                                            reuse_address=True, backlog=1024)
+        async with server:
+            await server.serve_forever()
+
+    def serve_forever(self):
+        """It runs the event loop of the server until it is interrupted
+        """
+        asyncio.run(self.serve())
+
+
+class SingleServer(socketserver.TCPServer):
+    """
+    A class used to serve one client connection at a time
+    """
+    allow_reuse_address = True
+
+
+def parse_args(argv=None):
+    """It reads the server options from the command line
+
+    Parameters
+    ----------
+    argv : list
+        The command line arguments, sys.argv is used when None
+
+    Returns
+    -------
+    argparse.Namespace
+        the server options
+    """
+    parser = argparse.ArgumentParser(description='Customer database server')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=9999)
+    parser.add_argument('--data', default='data.txt',
+                        help='pipe-delimited file loaded at startup')
+    parser.add_argument('--load-workers', type=int, default=1,
+                        help='processes parsing the data file, 0 uses '
+                             'one per CPU; files under 64 MB and single '
+                             'CPU hosts are always read serially')
+    parser.add_argument('--index', nargs='*', choices=INDEX_FIELDS,
+                        default=[],
+                        help='secondary indexes to maintain')
+    parser.add_argument('--snapshot',
+                        help='binary snapshot written by choice 9, the '
+                             'server starts from it when it exists')
+    parser.add_argument('--log',
+                        help='append-only mutation log, replayed at startup')
+    parser.add_argument('--fsync', choices=FSYNC_POLICIES, default='group',
+                        help='always: fsync every change, group: one fsync '
+                             'per group commit interval, os: no fsync')
+    parser.add_argument('--group-commit-ms', type=float, default=2,
+                        help='shortest interval between group commits in '
+                             'milliseconds')
+    parser.add_argument('--mode',
+                        choices=['single', 'threaded', 'pool', 'asyncio'],
+                        default='threaded',
+                        help='single: one client at a time, threaded: one '
+                             'thread per client, pool: fixed worker pool, '
+                             'asyncio: all clients in one event loop')
+    parser.add_argument('--workers', type=int, default=8,
+                        help='number of worker threads in pool mode, of '
+                             'request threads in asyncio mode')
+    parser.add_argument('--shards', type=int, default=0,
+                        help='start this many shard processes on the next '
+                             'ports and route the requests to them')
+    parser.add_argument('--shard', type=parse_shard, metavar='INDEX/COUNT',
+                        help='serve only the hash partition INDEX of COUNT '
+                             '(set by --shards)')
+    parser.add_argument('--replication-port', type=int,
+                        help='serve the stream of changes to the read '
+                             'replicas on this port')
+    parser.add_argument('--replication-buffer', type=int,
+                        default=STREAM_BUFFER,
+                        help='changes kept for the replicas catching up, '
+                             'older ones need a full copy')
+    parser.add_argument('--replica-of', type=parse_address,
+                        metavar='HOST:PORT',
+                        help='serve the read-only choices from a copy '
+                             'following the replication port of a primary')
+    parser.add_argument('--profile', type=int, metavar='SAMPLE_EVERY',
+                        help='start with the request profiler on, one '
+                             'request in SAMPLE_EVERY runs under cProfile '
+                             '(0 for none)')
+    parser.add_argument('--metrics-port', type=int,
+                        help='local port serving a plain-text dump of the '
+                             'server metrics')
+    args = parser.parse_args(argv)
+    if args.replica_of and (args.log or args.snapshot
+                            or args.replication_port):
+        parser.error('a replica takes its data from the primary, it can '
+                     'not use --log, --snapshot or --replication-port')
+    if args.shards > 1 and (args.replica_of or args.replication_port):
+        parser.error('replication is not supported in the sharded mode')
+    if args.shards > 1 and args.metrics_port:
+        parser.error('--metrics-port is not supported in the sharded mode, '
+                     'choice 19 returns the stats of every shard')
+    return args
+
+
+def parse_shard(value):
+    """It takes an INDEX/COUNT option and return the (index, count) of the
+    shard"""
+    try:
+        (index, count) = [int(part) for part in value.split('/')]
+    except ValueError:
+        raise argparse.ArgumentTypeError('expected INDEX/COUNT')
+    if not 0 <= index < count:
+        raise argparse.ArgumentTypeError('INDEX must be below COUNT')
+    return (index, count)
+
+
+def load_workers_for(path_name, load_workers):
+    """It takes the data file and the --load-workers option and return the
+    number of processes worth parsing the file with, 1 for the serial
+    read_file. The parallel loader is only used with several CPUs and a
+    file of at least PARALLEL_LOAD_MIN_BYTES, otherwise it is slower
+
+    Parameters
+    ----------
+    path_name : str
+        The path of the data file
+    load_workers : int
+        The number of processes asked, 0 for one per CPU
+
+    Returns
+    -------
+    int
+        the number of processes
+    """
+    cpus = os.cpu_count() or 1
+    try:
+        size = os.path.getsize(path_name)
+    except OSError:
+        size = 0
+    if cpus == 1 or size < PARALLEL_LOAD_MIN_BYTES:
+        return 1
+    return load_workers or cpus
+
+
+def create_server(args):
+    """It creates the socket server selected by the options
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        The server options
+
+    Returns
+    -------
+    socketserver.TCPServer or AsyncServer
+        the server bound to the host and port of the options
+    """
+    address = (args.host, args.port)
+    if args.mode == 'asyncio':
+        return AsyncServer(address, workers=args.workers)
+    if args.mode == 'pool':
+        return PooledServer(address, Server, workers=args.workers)
+    if args.mode == 'single':
+        return SingleServer(address, Server)
+    return ThreadedServer(address, Server)
+
+
+if __name__ == '__main__':
 
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    args = parse_args()
 
-    with socketserver.TCPServer((HOST_NAME, PORT), Server) as server:
+    if args.shards > 1:
+        # every shard is a server process of its own, this process only
+        # routes the requests of the clients to them
+        from sharding import run_sharded
+        run_sharded(args, os.path.abspath(__file__))
+    else:
+        server = create_server(args)
+        log = None
+        metrics_server = None
+        replication_server = None
         try:
-            server.server_operation_obj = ServerOperations()
+            if args.log:
+                log = MutationLog(args.log, args.fsync, args.group_commit_ms)
+            stream = None
+            if args.replication_port:
+                # the changes replayed from the log are streamed too, a
+                # replica loading the data file applies them first
+                stream = MutationStream(args.replication_buffer)
+            server.server_operation_obj = ServerOperations(
+                args.data, log, args.snapshot,
+                load_workers_for(args.data, args.load_workers), args.index,
+                args.shard, stream)
+            if stream is not None:
+                replication_server = ReplicationServer(
+                    (args.host, args.replication_port),
+                    server.server_operation_obj)
+                replication_server.start()
+            if args.replica_of:
+                server.server_operation_obj.replica = ReplicaFollower(
+                    server.server_operation_obj, args.replica_of)
+                server.server_operation_obj.replica.start()
+            if args.profile is not None:
+                server.server_operation_obj.profiler.start(args.profile)
+            if args.metrics_port:
+                metrics_server = MetricsServer(
+                    ('localhost', args.metrics_port),
+                    server.server_operation_obj.metrics_text)
+                metrics_server.start()
             print("Server is running !")
             server.serve_forever()
         except Exception as e:
-            print(e)
\ No newline at end of file
+            print(e)
+        finally:
+            if isinstance(server, socketserver.BaseServer):
+                server.server_close()
+            if metrics_server is not None:
+                metrics_server.shutdown()
+                metrics_server.server_close()
+            if replication_server is not None:
+                replication_server.shutdown()
+                replication_server.server_close()
+            if log is not None:
+                log.close()
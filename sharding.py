@@ -0,0 +1,900 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# ----- Program Details -----
+# Sharded deployment of the server. The customer names are split in hash
+# partitions (storage.shard_of), every partition is owned by a server.py
+# process of its own, so the shards use one core each.
+# The requests reach the shards through the ShardRouter, an asyncio
+# front-end speaking the usual protocol on the main port, or straight from
+# a ShardedClient that knows the shard map. A request about one customer
+# goes to the shard owning the name, a batch is split between the shards
+# and put back together in order, the report and the searches are asked to
+# every shard and their sorted partial results are merged with a k-way
+# merge (heapq.merge).
+#
+# Usage:
+#     python server.py --shards 4 --port 9999 --data data.txt
+# starts 4 shards on the ports 10000 to 10003 and the router on 9999.
+
+# The asyncio module runs the router
+import asyncio
+# The heapq module merges the sorted partial results of the shards
+import heapq
+import itertools
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from async_client import AsyncConnection
+from client import (ENCODING, EXPORT_PAGE_SIZE, IMPORT_CHUNK_LINES,
+                    ClientError, Connection, CustomerClient,
+                    add_import_result, export_file, import_totals,
+                    read_chunks)
+from indexes import index_age
+from protocol import (BUFF_SIZE, HANDSHAKE_CHOICE, FrameReader, JSON_CODEC,
+                      decode_message, encode_frame, encode_message,
+                      to_columns)
+from server import (MAX_BATCH_SIZE, RELOAD_BATCH_SIZE, REPORT_LAYOUTS,
+                    REPORT_PAGE_SIZE, SEARCH_LIMIT, TOO_LARGE_MESSAGE,
+                    ServerOperations, Session, handshake_request)
+from storage import parse_line, shard_of
+
+SHARD_MAP_CHOICE = '21'
+# The choices about one customer, served by the shard owning the name
+NAME_CHOICES = {'1', '2', '3', '4', '5', '6', '13'}
+# The batch choices and the key of their items
+BATCH_CHOICES = {'10': 'names', '11': 'customers', '12': 'names',
+                 '22': 'lines'}
+# The choices asked to every shard
+BROADCAST_CHOICES = {'7', '9', '14', '15', '16', '17', '19', '20', '23',
+                     '24'}
+SHARD_CONNECTIONS = 4
+# how often the router checks that the shard processes are still running
+SHARD_CHECK_SECONDS = 1.0
+
+
+def name_key(customer):
+    """It returns the sort key of a customer in the report and the name
+    searches, the same (lower case name, name) as the sorted index"""
+    name = customer.get('name', '')
+    return (name.lower(), name)
+
+
+def age_key(customer):
+    """It returns the sort key of a customer in the age index, the
+    (age, lower case name, name) of SecondaryIndexes"""
+    age = index_age(customer.get('age'))
+    return (age if age is not None else 0, ) + name_key(customer)
+
+
+def line_key(line):
+    """It returns the sort key of a line of an export, like name_key"""
+    name = line.partition('|')[0]
+    return (name.lower(), name)
+
+
+def merge_customers(lists, key=name_key, limit=None):
+    """It takes sorted lists of customers and return them merged in one
+    sorted list (k-way merge), cut at limit
+
+    Parameters
+    ----------
+    lists : list
+        The sorted lists of customer records of the shards
+    key : function
+        The sort key of the lists
+    limit : int
+        The largest number of customers returned, None for all
+
+    Returns
+    -------
+    list
+        a list of customer records
+    """
+    merged = heapq.merge(*lists, key=key)
+    if limit is None:
+        return list(merged)
+    return list(itertools.islice(merged, limit))
+
+
+def merge_reports(reports):
+    """It takes the reports of the shards, dicts ordered by customer name,
+    and return one report ordered by customer name
+
+    Parameters
+    ----------
+    reports : list
+        The reports of the shards
+
+    Returns
+    -------
+    dict
+        a dict containing customers data
+    """
+    return {customer['name']: customer for customer in
+            heapq.merge(*[report.values() for report in reports],
+                        key=name_key)}
+
+
+def merge_pages(pages, page_size):
+    """It takes the report page of every shard, all read after the same
+    cursor, and return the page of the whole data with its next cursor
+
+    Parameters
+    ----------
+    pages : list
+        The pages of the shards, dicts with customers and cursor
+    page_size : int
+        The number of customers in the page
+
+    Returns
+    -------
+    dict
+        a dict containing the list of customers and the cursor of the
+        next page (empty when it was the last page)
+    """
+    page_size = int(page_size)
+    customers = merge_customers([page['customers'] for page in pages],
+                                limit=page_size + 1)
+    more = len(customers) > page_size \
+        or any(page.get('cursor') for page in pages)
+    customers = customers[:page_size]
+    cursor = ''
+    if more and customers:
+        cursor = ServerOperations.encode_cursor(name_key(customers[-1]))
+    return {'customers': customers, 'cursor': cursor}
+
+
+def merge_lines(pages, page_size):
+    """It takes the export page of every shard, all read after the same
+    cursor, and return the export page of the whole data with its next
+    cursor
+
+    Parameters
+    ----------
+    pages : list
+        The pages of the shards, dicts with lines and cursor
+    page_size : int
+        The number of customers in the page
+
+    Returns
+    -------
+    dict
+        a dict containing the lines and the cursor of the next page
+        (empty when it was the last page)
+    """
+    page_size = int(page_size)
+    lines = list(itertools.islice(heapq.merge(
+        *[page['lines'].splitlines(True) for page in pages],
+        key=line_key), page_size + 1))
+    more = len(lines) > page_size or any(page.get('cursor')
+                                         for page in pages)
+    lines = lines[:page_size]
+    cursor = ''
+    if more and lines:
+        cursor = ServerOperations.encode_cursor(line_key(lines[-1]))
+    return {'lines': ''.join(lines), 'cursor': cursor}
+
+
+def batch_item_name(choice, item):
+    """It returns the customer name of an item of a batch, None when it
+    has none"""
+    if choice == '11':
+        return item.get('name') if isinstance(item, dict) else None
+    if choice == '22':
+        record = parse_line(item) if isinstance(item, str) else None
+        return record[0] if record else None
+    return item
+
+
+def plan_request(req_dict, shards):
+    """It takes a request and return the requests to send to the shards
+
+    Parameters
+    ----------
+    req_dict : dict
+        The request of the client
+    shards : int
+        The number of shards
+
+    Returns
+    -------
+    list
+        a list of (shard, request, positions) tuples, positions are the
+        places of the batch items sent to the shard, None when the
+        request is not split
+    """
+    choice = req_dict.get('choice')
+    if choice in NAME_CHOICES:
+        return [(shard_of(req_dict.get('name', ''), shards), req_dict, None)]
+    if choice in BATCH_CHOICES:
+        key = BATCH_CHOICES[choice]
+        items = req_dict.get(key)
+        if not isinstance(items, list) or len(items) > MAX_BATCH_SIZE:
+            # a shard answers with the error message
+            return [(0, req_dict, None)]
+        parts = {}
+        for (position, item) in enumerate(items):
+            (positions, shard_items) = parts.setdefault(
+                shard_of(batch_item_name(choice, item), shards), ([], []))
+            positions.append(position)
+            shard_items.append(item)
+        plan = []
+        for (shard, (positions, shard_items)) in sorted(parts.items()):
+            shard_req_dict = dict(req_dict)
+            shard_req_dict[key] = shard_items
+            plan.append((shard, shard_req_dict, positions))
+        return plan
+    if choice == '7' and 'layout' in req_dict:
+        # the shards send rows, they are merged and laid out here
+        req_dict = {key: value for (key, value) in req_dict.items()
+                    if key != 'layout'}
+    return [(shard, req_dict, None) for shard in range(shards)]
+
+
+def combine_responses(req_dict, plan, responses):
+    """It takes the responses of the shards to the requests of a plan and
+    return the response to the request of the client
+
+    Parameters
+    ----------
+    req_dict : dict
+        The request of the client
+    plan : list
+        The plan returned by plan_request
+    responses : list
+        The responses of the shards, in the order of the plan
+
+    Returns
+    -------
+    dict
+        a dict containing the response for the client
+    """
+    choice = req_dict.get('choice')
+    if choice in NAME_CHOICES:
+        return responses[0]
+    if choice == '7' and 'page_size' not in req_dict:
+        # a whole report is never an error message
+        layout = req_dict.get('layout', 'rows')
+        if layout not in REPORT_LAYOUTS:
+            return {'message': 'Layout must be one of {}'.format(
+                ', '.join(REPORT_LAYOUTS))}
+        report = merge_reports(responses)
+        if layout == 'columns':
+            return {'columns': to_columns(report.values())}
+        return report
+    for response in responses:
+        if 'message' in response and not response.get('success'):
+            return response
+    if choice in BATCH_CHOICES:
+        if plan and plan[0][2] is None:
+            return responses[0]
+        if choice == '22':
+            return combine_imports(plan, responses)
+        results = [None] * len(req_dict[BATCH_CHOICES[choice]])
+        for ((_, _, positions), response) in zip(plan, responses):
+            for (position, result) in zip(positions,
+                                          response.get('results', [])):
+                results[position] = result
+        return {'results': results}
+    if choice == '7':
+        return merge_pages(responses, req_dict['page_size'])
+    if choice == '23':
+        return merge_lines(responses, req_dict.get('page_size',
+                                                   EXPORT_PAGE_SIZE))
+    if choice in ('14', '15', '16', '17'):
+        default_limit = SEARCH_LIMIT if choice == '14' else REPORT_PAGE_SIZE
+        return {'customers': merge_customers(
+            [response.get('customers', []) for response in responses],
+            age_key if choice == '16' else name_key,
+            int(req_dict.get('limit', default_limit)))}
+    combined = {'shards': responses}
+    if choice == '19':
+        combined['customers'] = sum(response.get('customers', 0)
+                                    for response in responses)
+    elif choice == '9':
+        combined['message'] = 'Snapshot saved on {} shards'.format(
+            len(responses))
+        combined['success'] = True
+    elif all(response.get('success') for response in responses):
+        combined['message'] = responses[0]['message']
+        combined['success'] = True
+    return combined
+
+
+def combine_imports(plan, responses):
+    """It adds up the import counts of the shards, the positions of the
+    rejected lines are put back in the chunk of the client"""
+    combined = {'accepted': 0, 'duplicates': 0, 'rejected': 0,
+                'rejected_lines': [], 'success': True}
+    for ((_, _, positions), response) in zip(plan, responses):
+        for key in ('accepted', 'duplicates', 'rejected'):
+            combined[key] += response.get(key, 0)
+        combined['rejected_lines'].extend(
+            positions[position] for position in
+            response.get('rejected_lines', []))
+    combined['rejected_lines'].sort()
+    return combined
+
+
+class RouterSession(Session):
+    """
+    A class used to keep the state of one client connection of the router
+
+    ...
+    Attributes
+    ----------
+    slot : int
+        the connection to every shard used by the client, all the requests
+        of a client to a shard use one connection so they stay in order
+    """
+
+    def __init__(self, slot):
+        Session.__init__(self)
+        self.slot = slot
+
+
+class ShardRouter:
+    """
+    A class used to route the requests of the clients to the shards, from
+    a single asyncio event loop
+
+    ...
+    Attributes
+    ----------
+    server_address : tuple
+        the host and port the router listens on
+    shard_addresses : list
+        the (host, port) of every shard, in shard order
+    connections : list
+        the pipelined AsyncConnection objects of every shard
+    reconnecting : list
+        the asyncio.Lock of every connection, held while it is opened
+        again
+    clients : dict
+        the task serving every open client connection, by its writer
+    sessions : int
+        the number of client connections accepted
+
+    Methods
+    -------
+    connect()
+        It opens the connections to the shards
+    shard_connection(shard, slot)
+        It returns a connection to a shard, opened again when it was lost
+    shard_request(shard, slot, req_dict)
+        It sends a request to a shard and return its response
+    handle_client(stream_reader, stream_writer)
+        It serves one client connection until the client disconnects
+    process_payload(payload, session)
+        It takes one request frame payload and return the framed response
+    route(req_dict, payload, session)
+        It sends a request to its shards and return the response
+    serve_forever()
+        It runs the event loop of the router until it is interrupted or
+        receives SIGTERM
+    """
+
+    def __init__(self, server_address, shard_addresses,
+                 connections=SHARD_CONNECTIONS):
+        self.server_address = server_address
+        self.shard_addresses = list(shard_addresses)
+        self.connection_count = connections
+        self.connections = []
+        self.reconnecting = []
+        self.clients = {}
+        self.sessions = 0
+
+    async def connect(self):
+        """It opens the connections to the shards
+        """
+        self.connections = [[None] * self.connection_count
+                            for _ in self.shard_addresses]
+        self.reconnecting = [[asyncio.Lock()
+                              for _ in range(self.connection_count)]
+                             for _ in self.shard_addresses]
+        await asyncio.gather(*[
+            self.shard_connection(shard, slot)
+            for shard in range(len(self.shard_addresses))
+            for slot in range(self.connection_count)])
+
+    async def shard_connection(self, shard, slot):
+        """It returns the connection slot to a shard. A connection lost
+        (the shard crashed or was restarted) is opened again, the requests
+        which were waiting on it failed with ClientError
+
+        Parameters
+        ----------
+        shard : int
+            The index of the shard
+        slot : int
+            The connection of the client to the shard
+
+        Returns
+        -------
+        AsyncConnection
+            the open connection
+        """
+        connection = self.connections[shard][slot]
+        if connection is not None and not connection.reader_task.done():
+            return connection
+        async with self.reconnecting[shard][slot]:
+            connection = self.connections[shard][slot]
+            if connection is None or connection.reader_task.done():
+                if connection is not None:
+                    await connection.close()
+                (host, port) = self.shard_addresses[shard]
+                connection = await AsyncConnection.open(host, port, 'json')
+                self.connections[shard][slot] = connection
+        return connection
+
+    async def shard_request(self, shard, slot, req_dict):
+        """It sends a request to a shard and return its response"""
+        connection = await self.shard_connection(shard, slot)
+        return await connection.request(req_dict)
+
+    async def handle_client(self, stream_reader, stream_writer):
+        """It serves one client connection until the client disconnects,
+        the requests of a batch are routed concurrently and answered in
+        order
+
+        Parameters
+        ----------
+        stream_reader : asyncio.StreamReader
+            The reading side of the connection
+        stream_writer : asyncio.StreamWriter
+            The writing side of the connection
+        """
+        session = RouterSession(self.sessions % self.connection_count)
+        self.sessions += 1
+        self.clients[stream_writer] = asyncio.current_task()
+        reader = FrameReader()
+        try:
+            while True:
+                data = await stream_reader.read(BUFF_SIZE)
+                if not data:
+                    break
+                reader.feed(data)
+
+                responses = await asyncio.gather(*[
+                    self.process_payload(payload, session)
+                    for payload in reader.frames()])
+                if responses:
+                    stream_writer.write(b''.join(responses))
+                    await stream_writer.drain()
+        except (OSError, ValueError) as e:
+            # the client went away or sent an invalid frame
+            pass
+        finally:
+            del self.clients[stream_writer]
+            stream_writer.close()
+
+    async def process_payload(self, payload, session):
+        """It takes one request frame payload and return the framed response
+
+        Parameters
+        ----------
+        payload : bytes
+            The payload of the request frame
+        session : RouterSession
+            The state of the client connection
+
+        Returns
+        -------
+        bytes
+            a byte string containing the framed response
+        """
+        # the handshake changes the codec only after its own response
+        (codec, compress_min) = (session.codec, session.compress_min)
+        try:
+            req_dict = decode_message(payload, codec)
+        except ValueError:
+            req_dict = None
+        try:
+            res_data_dict = await self.route(req_dict, payload, session)
+        except ClientError as e:
+            res_data_dict = {'message': 'Shard unavailable: {}'.format(e)}
+        except Exception as e:
+            res_data_dict = {'message': 'Internal server error'}
+        try:
+            if isinstance(res_data_dict, bytes):
+                # the response of the shard, already encoded
+                return encode_frame(res_data_dict, compress_min)
+            return encode_message(res_data_dict, codec, compress_min)
+        except ValueError:
+            # the merged report of the shards can be larger than a frame
+            return encode_message({'message': TOO_LARGE_MESSAGE}, codec)
+
+    async def route(self, req_dict, payload, session):
+        """It takes a request, sends it to its shards and return the
+        response for the client
+
+        Parameters
+        ----------
+        req_dict : dict
+            The request received from the client
+        payload : bytes
+            The encoded request
+        session : RouterSession
+            The state of the client connection
+
+        Returns
+        -------
+        dict or bytes
+            a dict containing the response for the client, or the JSON
+            encoded response of a shard
+        """
+        if not isinstance(req_dict, dict):
+            return {'message': 'Invalid request'}
+        choice = req_dict.get('choice', None)
+        if choice == HANDSHAKE_CHOICE:
+            return handshake_request(None, req_dict, session)
+        if choice == SHARD_MAP_CHOICE:
+            return {'shards': [list(address)
+                               for address in self.shard_addresses]}
+        if not isinstance(choice, str) or not (
+                choice in NAME_CHOICES or choice in BATCH_CHOICES
+                or choice in BROADCAST_CHOICES):
+            return {'message': 'Invalid choice'}
+
+        plan = plan_request(req_dict, len(self.connections))
+        if choice in NAME_CHOICES and session.codec is JSON_CODEC:
+            # forwarded and answered as is, without decoding the response
+            connection = await self.shard_connection(plan[0][0],
+                                                     session.slot)
+            return await connection.request_payload(payload)
+        responses = await asyncio.gather(*[
+            self.shard_request(shard, session.slot, shard_req_dict)
+            for (shard, shard_req_dict, _) in plan])
+        return combine_responses(req_dict, plan, responses)
+
+    async def serve(self):
+        """It connects to the shards, listens on the router address and
+        serves the clients until SIGTERM
+        """
+        await self.connect()
+        (host, port) = self.server_address
+        server = await asyncio.start_server(self.handle_client, host, port,
+                                            reuse_address=True, backlog=1024)
+        # SIGTERM ends the loop like a return, the shards are then stopped
+        # by the caller
+        stopping = asyncio.Event()
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM,
+                                                      stopping.set)
+        async with server:
+            await stopping.wait()
+            server.close()
+            # the clients are disconnected before the loop ends, rather
+            # than having their tasks cancelled in the middle of a read
+            for stream_writer in self.clients:
+                stream_writer.close()
+            await asyncio.gather(*self.clients.values(),
+                                 return_exceptions=True)
+
+    def serve_forever(self):
+        """It runs the event loop of the router until it is interrupted
+        or receives SIGTERM
+        """
+        asyncio.run(self.serve())
+
+
+class ShardedClient:
+    """
+    A class used by applications to call the shards straight, without the
+    router. It has the methods of CustomerClient: a request about one
+    customer is sent to the shard owning the name, the other requests are
+    split or sent to every shard like the router does
+
+    ...
+    Attributes
+    ----------
+    clients : list
+        the CustomerClient of every shard, in shard order
+    executor : ThreadPoolExecutor
+        the threads asking the shards at the same time
+
+    Methods
+    -------
+    from_router(host, port, **options)
+        It returns a client for the shards of a router
+    request(req_dict)
+        It sends a request to its shards and returns the response
+    close()
+        It closes the connections to the shards
+    """
+
+    def __init__(self, shard_addresses, pool_size=4, encoding=ENCODING,
+                 timeout=None, compression=None):
+        self.clients = [CustomerClient(host, port, pool_size, encoding,
+                                       timeout, compression)
+                        for (host, port) in shard_addresses]
+        self.executor = ThreadPoolExecutor(max_workers=len(self.clients))
+
+    @classmethod
+    def from_router(cls, host, port, **options):
+        """It asks the shard map to a router and return a client for its
+        shards
+
+        Parameters
+        ----------
+        host : str
+            The host of the router
+        port : int
+            The port of the router
+
+        Returns
+        -------
+        ShardedClient
+            the client of the shards
+        """
+        connection = Connection(host, port)
+        try:
+            res_data_dict = connection.request({'choice': SHARD_MAP_CHOICE})
+        finally:
+            connection.close()
+        if 'shards' not in res_data_dict:
+            raise ClientError('No shard map: {}'.format(
+                res_data_dict.get('message')))
+        return cls([tuple(address) for address in res_data_dict['shards']],
+                   **options)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def request(self, req_dict):
+        """It takes a request, sends it to its shards and returns the
+        response
+
+        Parameters
+        ----------
+        req_dict : dict
+            The request for the server
+
+        Returns
+        -------
+        dict
+            a dict containing the response
+        """
+        plan = plan_request(req_dict, len(self.clients))
+        if len(plan) == 1:
+            responses = [self.clients[plan[0][0]].request(plan[0][1])]
+        else:
+            responses = list(self.executor.map(
+                lambda part: self.clients[part[0]].request(part[1]), plan))
+        return combine_responses(req_dict, plan, responses)
+
+    def client_for(self, name):
+        return self.clients[shard_of(name, len(self.clients))]
+
+    def get_customer(self, name):
+        return self.client_for(name).get_customer(name)
+
+    def add_customer(self, name, age='', address='', phone=''):
+        return self.client_for(name).add_customer(name, age, address, phone)
+
+    def delete_customer(self, name):
+        return self.client_for(name).delete_customer(name)
+
+    def update_customer_age(self, name, age):
+        return self.client_for(name).update_customer_age(name, age)
+
+    def update_customer_address(self, name, address):
+        return self.client_for(name).update_customer_address(name, address)
+
+    def update_customer_phone(self, name, phone):
+        return self.client_for(name).update_customer_phone(name, phone)
+
+    def update_customer(self, name, age=None, address=None, phone=None):
+        return self.client_for(name).update_customer(name, age, address,
+                                                     phone)
+
+    def report(self, layout='rows'):
+        req_dict = {'choice': '7'}
+        if layout != 'rows':
+            req_dict['layout'] = layout
+        return self.request(req_dict)
+
+    def report_pages(self, page_size=REPORT_PAGE_SIZE):
+        req_dict = {'choice': '7', 'page_size': page_size}
+        while True:
+            res_data_dict = self.request(req_dict)
+            if res_data_dict.get('message'):
+                raise ClientError(res_data_dict['message'])
+            yield res_data_dict['customers']
+            if not res_data_dict['cursor']:
+                break
+            req_dict['cursor'] = res_data_dict['cursor']
+
+    def import_file(self, path_name, chunk_lines=IMPORT_CHUNK_LINES):
+        totals = import_totals()
+        for (first_line, lines) in read_chunks(path_name, chunk_lines):
+            add_import_result(totals, first_line,
+                              self.request({'choice': '22', 'lines': lines}))
+        return totals
+
+    def export_file(self, path_name, page_size=EXPORT_PAGE_SIZE):
+        return export_file(self.request, path_name, page_size)
+
+    def reload(self, mode='diff', batch_size=RELOAD_BATCH_SIZE):
+        return self.request({'choice': '24', 'action': 'start',
+                             'mode': mode, 'batch_size': batch_size})
+
+    def reload_status(self):
+        return self.request({'choice': '24', 'action': 'status'})
+
+    def get_customers(self, names):
+        return self.request({'choice': '10', 'names': list(names)})
+
+    def add_customers(self, customers):
+        customers = list(customers)
+        for customer in customers:
+            CustomerClient.check(customer.get('name', ''),
+                                 customer.get('age', ''),
+                                 customer.get('phone', ''))
+        return self.request({'choice': '11', 'customers': customers})
+
+    def delete_customers(self, names):
+        return self.request({'choice': '12', 'names': list(names)})
+
+    def search_customers(self, prefix, limit=SEARCH_LIMIT,
+                         case_sensitive=False):
+        return self.request({'choice': '14', 'prefix': prefix,
+                             'limit': limit,
+                             'case_sensitive': case_sensitive})
+
+    def write_snapshot(self):
+        return self.request({'choice': '9'})
+
+    def find_by_phone(self, phone, limit=None):
+        req_dict = {'choice': '15', 'phone': phone}
+        if limit is not None:
+            req_dict['limit'] = limit
+        return self.request(req_dict)
+
+    def find_by_age(self, min_age, max_age, limit=None):
+        req_dict = {'choice': '16', 'min_age': min_age, 'max_age': max_age}
+        if limit is not None:
+            req_dict['limit'] = limit
+        return self.request(req_dict)
+
+    def find_by_address(self, words, limit=None):
+        req_dict = {'choice': '17', 'address': words}
+        if limit is not None:
+            req_dict['limit'] = limit
+        return self.request(req_dict)
+
+    def stats(self):
+        return self.request({'choice': '19'})
+
+    def profile(self, action='dump', sample_every=100, keep=20):
+        return self.request({'choice': '20', 'action': action,
+                             'sample_every': sample_every, 'keep': keep})
+
+    def close(self):
+        """It closes the connections to the shards
+        """
+        for client in self.clients:
+            client.close()
+        self.executor.shutdown(wait=False)
+
+
+def shard_command(args, script, index):
+    """It returns the command line of the server process of a shard"""
+    port = args.port + 1 + index
+    cmd = [sys.executable, script, '--host', args.host, '--port', str(port),
+           '--data', args.data, '--shard', '{}/{}'.format(index, args.shards),
+           '--mode', args.mode, '--workers', str(args.workers),
+           '--load-workers', str(args.load_workers), '--fsync', args.fsync,
+           '--group-commit-ms', str(args.group_commit_ms)]
+    if args.index:
+        cmd += ['--index'] + list(args.index)
+    # every shard has its own log and snapshot
+    if args.log:
+        cmd += ['--log', '{}.shard{}'.format(args.log, index)]
+    if args.snapshot:
+        cmd += ['--snapshot', '{}.shard{}'.format(args.snapshot, index)]
+    if args.profile is not None:
+        cmd += ['--profile', str(args.profile)]
+    return cmd
+
+
+def wait_for_shards(addresses, processes, timeout=600.0):
+    """It waits until every shard accepts connections"""
+    deadline = time.time() + timeout
+    for ((host, port), process) in zip(addresses, processes):
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError('Shard on port {} exited'.format(port))
+            try:
+                with socket.create_connection((host, port), timeout=1):
+                    break
+            except OSError:
+                if time.time() > deadline:
+                    raise RuntimeError('Shard on port {} did not start'
+                                       .format(port))
+                time.sleep(0.05)
+
+
+def watch_shards(args, script, processes, lock, stopping):
+    """It restarts the shard processes which exited, every
+    SHARD_CHECK_SECONDS until stopping is set. The router opens its
+    connections to a restarted shard again on the next request; the shard
+    reloads the data file and replays its own log
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        The server options
+    script : str
+        The path of server.py
+    processes : list
+        The subprocess.Popen of every shard, replaced when restarted
+    lock : threading.Lock
+        It is held while the processes are checked or stopped
+    stopping : threading.Event
+        It is set when the router stops
+    """
+    while not stopping.wait(SHARD_CHECK_SECONDS):
+        with lock:
+            if stopping.is_set():
+                break
+            for (index, process) in enumerate(processes):
+                if process.poll() is None:
+                    continue
+                print("Shard {} exited with code {}, restarting it !"
+                      .format(index, process.returncode))
+                processes[index] = subprocess.Popen(
+                    shard_command(args, script, index))
+
+
+def run_sharded(args, script):
+    """It starts a server process per shard and routes the requests of
+    the clients to them until it is interrupted, a shard process which
+    exits is started again
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        The server options
+    script : str
+        The path of server.py
+    """
+    processes = []
+    addresses = []
+    lock = threading.Lock()
+    stopping = threading.Event()
+    # stopping the router stops the shards too, the event loop of the
+    # router handles SIGTERM itself once it runs
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        for index in range(args.shards):
+            processes.append(subprocess.Popen(shard_command(args, script,
+                                                            index)))
+            addresses.append((args.host, args.port + 1 + index))
+        wait_for_shards(addresses, processes)
+        threading.Thread(target=watch_shards,
+                         args=(args, script, processes, lock, stopping),
+                         daemon=True).start()
+        print("Router is running, shards on ports {} to {} !".format(
+            addresses[0][1], addresses[-1][1]))
+        ShardRouter((args.host, args.port), addresses).serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        with lock:
+            stopping.set()
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
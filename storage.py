@@ -0,0 +1,711 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# ----- Program Details -----
+# Durable storage used by the server next to the in-memory customer data.
+# The mutation log is an append-only file with one JSON encoded change of
+# the customer data per line. It is replayed on top of the data file at
+# startup so changes made by the clients survive a restart.
+# The snapshot is a compact binary copy of the customer data with a name
+# index, it is memory-mapped at startup instead of parsing the data file.
+# Large data files can be parsed in parallel by a pool of processes.
+# The customer data can be exported back in the format of the data file.
+# In the sharded mode every server process owns the names of one hash
+# partition.
+
+import os
+import sys
+import json
+import mmap
+import array
+import struct
+import threading
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+FSYNC_POLICIES = ('always', 'group', 'os')
+# The characters ending a field or a line of the data file
+FIELD_SEPARATORS = ('|', '\r', '\n')
+
+
+class Customer:
+    """
+    A class used to store one customer record in memory. The fixed slots
+    take far less memory than a dictionary per customer, and the name
+    object is shared with the key of the customer data.
+
+    ...
+    Attributes
+    ----------
+    name : str
+        the name of the customer
+    age : int or str
+        the age of the customer, empty when unknown
+    address : str
+        the address of the customer
+    phone : str
+        the phone of the customer
+
+    Methods
+    -------
+    to_dict()
+        It returns the record as a dictionary for the clients
+    """
+
+    __slots__ = ('name', 'age', 'address', 'phone')
+
+    def __init__(self, name, age='', address='', phone=''):
+        self.name = name
+        self.age = age
+        self.address = address
+        self.phone = phone
+
+    def __eq__(self, other):
+        if not isinstance(other, Customer):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return 'Customer({!r}, {!r}, {!r}, {!r})'.format(
+            self.name, self.age, self.address, self.phone)
+
+    def to_dict(self):
+        """It returns the record as a dictionary for the clients
+
+        Returns
+        -------
+        dict
+            a dict containing the name, age, address and phone
+        """
+        return {'name': self.name, 'age': self.age,
+                'address': self.address, 'phone': self.phone}
+
+
+class MutationLog:
+    """
+    A class used to append the changes of the customer data to a log file
+
+    ...
+    Attributes
+    ----------
+    path_name : str
+        the path of the log file
+    fsync_policy : str
+        'always' syncs the file to disk after every change, 'group'
+        syncs the changes collected during group_commit_ms with a single
+        fsync (group commit), 'os' leaves it to the operating system
+    group_commit_ms : float
+        the shortest interval between two group commits in milliseconds
+
+    Methods
+    -------
+    append(op_dict)
+        It writes one change to the log and return its sequence number
+    wait_durable(seq)
+        It waits until the change with the sequence number is on disk
+    close()
+        It syncs and closes the log file
+    truncate()
+        It empties the log file once its changes are in a snapshot
+    replay(path_name)
+        It yields the changes stored in a log file
+    """
+
+    def __init__(self, path_name, fsync_policy='group', group_commit_ms=2):
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError('Unknown fsync policy: {}'.format(fsync_policy))
+        self.path_name = path_name
+        self.fsync_policy = fsync_policy
+        self.group_commit_ms = group_commit_ms
+        self.truncate_torn_tail(path_name)
+        self.log_file = open(path_name, 'ab')
+        self.condition = threading.Condition()
+        self.pending = threading.Condition(self.condition)
+        self.written_seq = 0
+        self.synced_seq = 0
+        self.closed = False
+        self.flusher = None
+        if fsync_policy == 'group':
+            self.flusher = threading.Thread(target=self.group_commit_loop,
+                                            daemon=True)
+            self.flusher.start()
+
+    def append(self, op_dict):
+        """It writes one change to the log and return its sequence number
+
+        Parameters
+        ----------
+        op_dict : dict
+            The change of the customer data
+
+        Returns
+        -------
+        int
+            the sequence number of the change
+        """
+        line = json.dumps(op_dict, separators=(',', ':')).encode('utf-8')
+        with self.condition:
+            self.log_file.write(line + b'\n')
+            self.written_seq += 1
+            seq = self.written_seq
+            if self.fsync_policy == 'always':
+                self.log_file.flush()
+                os.fsync(self.log_file.fileno())
+                self.synced_seq = seq
+            elif self.fsync_policy == 'os':
+                self.log_file.flush()
+                self.synced_seq = seq
+            else:
+                self.pending.notify()
+        return seq
+
+    def wait_durable(self, seq):
+        """It waits until the change with the sequence number is on disk,
+        it returns at once unless the policy is group commit
+
+        Parameters
+        ----------
+        seq : int
+            The sequence number returned by append
+        """
+        with self.condition:
+            while self.synced_seq < seq:
+                self.condition.wait()
+
+    def group_commit_loop(self):
+        """It syncs the changes written since the last sync and wakes up
+        the writers waiting for them. A sync starts as soon as a change is
+        pending but at most once every group_commit_ms, the changes that
+        arrive meanwhile are covered by the same fsync.
+        """
+        interval = self.group_commit_ms / 1000.0
+        last_sync = 0.0
+        while True:
+            with self.condition:
+                while self.written_seq == self.synced_seq and not self.closed:
+                    self.pending.wait()
+                if self.closed:
+                    break
+            delay = last_sync + interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+            with self.condition:
+                target_seq = self.written_seq
+                self.log_file.flush()
+                fileno = self.log_file.fileno()
+
+            # the sync runs without the lock so writers keep appending
+            last_sync = time.monotonic()
+            os.fsync(fileno)
+
+            with self.condition:
+                self.synced_seq = max(self.synced_seq, target_seq)
+                self.condition.notify_all()
+
+    def close(self):
+        """It syncs and closes the log file
+        """
+        with self.condition:
+            if self.closed:
+                return
+            self.closed = True
+            self.pending.notify()
+        if self.flusher is not None:
+            self.flusher.join()
+        with self.condition:
+            self.log_file.flush()
+            os.fsync(self.log_file.fileno())
+            self.synced_seq = self.written_seq
+            self.log_file.close()
+            self.condition.notify_all()
+
+    @staticmethod
+    def truncate_torn_tail(path_name):
+        """It cuts a last line left incomplete by a crash, so the next
+        change is not appended to it
+
+        Parameters
+        ----------
+        path_name : str
+            The path of the log file
+        """
+        if not os.path.exists(path_name):
+            return
+        with open(path_name, 'r+b') as log_file:
+            valid_size = 0
+            for line in log_file:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    json.loads(line.decode('utf-8'))
+                except ValueError:
+                    break
+                valid_size += len(line)
+            log_file.truncate(valid_size)
+
+    @staticmethod
+    def replay(path_name):
+        """It yields the changes stored in a log file, a last line cut by
+        a crash is ignored
+
+        Parameters
+        ----------
+        path_name : str
+            The path of the log file
+
+        Returns
+        -------
+        generator
+            a generator of change dictionaries
+        """
+        if not os.path.exists(path_name):
+            return
+        with open(path_name, 'rb') as log_file:
+            for line in log_file:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    yield json.loads(line.decode('utf-8'))
+                except ValueError:
+                    break
+
+    def truncate(self):
+        """It empties the log file, it is called once the changes it
+        holds are saved in a snapshot
+        """
+        with self.condition:
+            self.log_file.flush()
+            self.log_file.truncate(0)
+            os.fsync(self.log_file.fileno())
+            self.synced_seq = self.written_seq
+            self.condition.notify_all()
+
+
+class Snapshot:
+    """
+    A class used to read a binary snapshot of the customer data through a
+    memory map, so customers can be looked up without parsing the file
+
+    The file starts with a header (magic, customer count, index offset),
+    followed by the records in name order and an index of 8 byte record
+    offsets in the same order. A record is the name, age, address and
+    phone, the strings are stored as a 1 byte length (or 255 and a 4 byte
+    length) and UTF-8 bytes, the age as a 1 byte kind followed by a 4 or 8
+    byte integer or a string.
+
+    ...
+    Attributes
+    ----------
+    path_name : str
+        the path of the snapshot file
+    count : int
+        the number of customers in the snapshot
+
+    Methods
+    -------
+    write(path_name, records, count)
+        It writes the records (in name order) to a snapshot file
+    find(name)
+        It returns the record of the customer or None
+    record_at(position)
+        It returns the record at a position of the name order
+    close()
+        It closes the memory map of the snapshot
+    """
+
+    MAGIC = b'CSNP'
+    HEADER = struct.Struct('!4sIQ')
+    LENGTH = struct.Struct('!I')
+    OFFSET = struct.Struct('!Q')
+    INTEGER = struct.Struct('!i')
+    LONG_INTEGER = struct.Struct('!q')
+    LONG_TEXT = 255
+    AGE_INT = 1
+    AGE_TEXT = 2
+    AGE_LONG = 3
+
+    def __init__(self, path_name):
+        self.path_name = path_name
+        self.snapshot_file = open(path_name, 'rb')
+        self.mm = mmap.mmap(self.snapshot_file.fileno(), 0,
+                            access=mmap.ACCESS_READ)
+        (magic, self.count, self.index_offset) = \
+            self.HEADER.unpack_from(self.mm, 0)
+        if magic != self.MAGIC:
+            self.close()
+            raise ValueError('{} is not a snapshot file'.format(path_name))
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for position in range(self.count):
+            yield self.record_at(position)
+
+    @classmethod
+    def encode_text(cls, value):
+        if not isinstance(value, str):
+            raise TypeError('{!r} is not a string'.format(value))
+        data = value.encode('utf-8')
+        if len(data) < cls.LONG_TEXT:
+            return bytes((len(data), )) + data
+        return bytes((cls.LONG_TEXT, )) + cls.LENGTH.pack(len(data)) + data
+
+    @classmethod
+    def encode_record(cls, record):
+        """It takes a customer record and return its binary form
+
+        Parameters
+        ----------
+        record : Customer
+            The customer record
+
+        Returns
+        -------
+        bytes
+            a byte string containing the encoded record
+        """
+        age = record.age
+        if isinstance(age, str):
+            age_data = bytes((cls.AGE_TEXT, )) + cls.encode_text(age)
+        elif isinstance(age, bool) or not isinstance(age, int):
+            raise TypeError('{!r} is not an integer'.format(age))
+        elif -2 ** 31 <= age < 2 ** 31:
+            age_data = bytes((cls.AGE_INT, )) + cls.INTEGER.pack(age)
+        elif not -2 ** 63 <= age < 2 ** 63:
+            raise ValueError('{} is larger than 64 bits'.format(age))
+        else:
+            age_data = bytes((cls.AGE_LONG, )) + cls.LONG_INTEGER.pack(age)
+        return b''.join((cls.encode_text(record.name), age_data,
+                         cls.encode_text(record.address),
+                         cls.encode_text(record.phone)))
+
+    @classmethod
+    def write(cls, path_name, records, count):
+        """It writes the records to a snapshot file. The file is written
+        next to the target and renamed, so a crash never leaves a partial
+        snapshot behind
+
+        Parameters
+        ----------
+        path_name : str
+            The path of the snapshot file
+        records : iterable
+            The customer records ordered by (lower case name, name)
+        count : int
+            The number of records
+        """
+        tmp_path = path_name + '.tmp'
+        offsets = array.array('Q')
+        try:
+            with open(tmp_path, 'wb') as snapshot_file:
+                snapshot_file.write(cls.HEADER.pack(cls.MAGIC, count, 0))
+                position = cls.HEADER.size
+                for record in records:
+                    data = cls.encode_record(record)
+                    offsets.append(position)
+                    snapshot_file.write(data)
+                    position += len(data)
+                if len(offsets) != count:
+                    raise ValueError('Snapshot record count mismatch')
+                if sys.byteorder != 'big':
+                    offsets.byteswap()
+                snapshot_file.write(offsets.tobytes())
+                snapshot_file.seek(0)
+                snapshot_file.write(cls.HEADER.pack(cls.MAGIC, count,
+                                                    position))
+                snapshot_file.flush()
+                os.fsync(snapshot_file.fileno())
+        except Exception:
+            # a record that can not be encoded leaves no partial file
+            os.remove(tmp_path)
+            raise
+        os.replace(tmp_path, path_name)
+
+    def read_text(self, offset):
+        length = self.mm[offset]
+        offset += 1
+        if length == self.LONG_TEXT:
+            (length, ) = self.LENGTH.unpack_from(self.mm, offset)
+            offset += self.LENGTH.size
+        return (self.mm[offset:offset + length].decode('utf-8'),
+                offset + length)
+
+    def name_at(self, position):
+        (offset, ) = self.OFFSET.unpack_from(
+            self.mm, self.index_offset + position * self.OFFSET.size)
+        return self.read_text(offset)[0]
+
+    def record_at(self, position):
+        """It returns the record at a position of the name order
+
+        Parameters
+        ----------
+        position : int
+            The position of the record
+
+        Returns
+        -------
+        Customer
+            the customer record
+        """
+        (offset, ) = self.OFFSET.unpack_from(
+            self.mm, self.index_offset + position * self.OFFSET.size)
+        (name, offset) = self.read_text(offset)
+        kind = self.mm[offset]
+        offset += 1
+        if kind == self.AGE_INT:
+            (age, ) = self.INTEGER.unpack_from(self.mm, offset)
+            offset += self.INTEGER.size
+        elif kind == self.AGE_LONG:
+            (age, ) = self.LONG_INTEGER.unpack_from(self.mm, offset)
+            offset += self.LONG_INTEGER.size
+        else:
+            (age, offset) = self.read_text(offset)
+        (address, offset) = self.read_text(offset)
+        (phone, offset) = self.read_text(offset)
+        return Customer(name, age, address, phone)
+
+    def find(self, name):
+        """It returns the record of the customer with a binary search of
+        the name index, or None when the customer is not in the snapshot
+
+        Parameters
+        ----------
+        name : str
+            The name of the customer
+
+        Returns
+        -------
+        Customer
+            the customer record
+        """
+        key = (name.lower(), name)
+        low = 0
+        high = self.count
+        while low < high:
+            middle = (low + high) // 2
+            probe = self.name_at(middle)
+            if (probe.lower(), probe) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count and self.name_at(low) == name:
+            return self.record_at(low)
+        return None
+
+    def close(self):
+        """It closes the memory map of the snapshot
+        """
+        self.mm.close()
+        self.snapshot_file.close()
+
+
+def parse_line(line):
+    """It takes one line of a pipe-delimited data file and return the
+    customer fields. The age is kept only when it is an integer, missing
+    fields are empty
+
+    Parameters
+    ----------
+    line : str
+        The line of the data file
+
+    Returns
+    -------
+    tuple
+        a tuple of (name, age, address, phone) or None without a name
+    """
+    line = line.split('|')
+    name = line[0].strip()
+    if not name:
+        return None
+
+    try:
+        age = int(line[1].strip())
+    except Exception:
+        age = ''
+
+    try:
+        address = line[2].strip()
+    except Exception:
+        address = ''
+
+    try:
+        phone = line[3].strip()
+    except Exception:
+        phone = ''
+
+    return (name, age, address, phone)
+
+
+def is_field_text(value):
+    """It takes a string and return True when it can be written in a field
+    of the data file and of the snapshot: no '|', no line break and no
+    lone surrogate, which UTF-8 can not encode
+
+    Parameters
+    ----------
+    value : str
+        The value of the field
+
+    Returns
+    -------
+    bool
+        True when the value can be written
+    """
+    if any(separator in value for separator in FIELD_SEPARATORS):
+        return False
+    try:
+        value.encode('utf-8')
+    except UnicodeEncodeError:
+        return False
+    return True
+
+
+def format_line(record):
+    """It takes a customer record and return its line in the format of
+    the data file, read back by parse_line
+
+    Parameters
+    ----------
+    record : Customer
+        The customer record
+
+    Returns
+    -------
+    str
+        the line, ending with a line break
+
+    Raises
+    ------
+    ValueError
+        When a field is not a string (an integer for the age) or can not
+        be written in the data file
+    """
+    values = (record.name, record.age, record.address, record.phone)
+    for value in values:
+        if isinstance(value, str):
+            valid = is_field_text(value)
+        else:
+            valid = isinstance(value, int) and not isinstance(value, bool)
+        if not valid:
+            raise ValueError('{!r} of {} can not be written to a data '
+                             'file'.format(value, record.name))
+    return '|'.join(str(value) for value in values) + '\n'
+
+
+def shard_of(name, shards):
+    """It takes a customer name and return the shard owning it. The hash
+    is stable across processes and restarts, unlike the hash() builtin
+
+    Parameters
+    ----------
+    name : str
+        The name of the customer
+    shards : int
+        The number of shards
+
+    Returns
+    -------
+    int
+        the index of the shard, from 0 to shards - 1
+    """
+    if not isinstance(name, str):
+        return 0
+    return zlib.crc32(name.encode('utf-8')) % shards
+
+
+def split_file(path_name, parts):
+    """It splits a file into byte ranges that start and end at line
+    boundaries
+
+    Parameters
+    ----------
+    path_name : str
+        The path of the file
+    parts : int
+        The number of ranges wanted
+
+    Returns
+    -------
+    list
+        a list of (start, end) byte offsets
+    """
+    size = os.path.getsize(path_name)
+    boundaries = [0]
+    with open(path_name, 'rb') as data_file:
+        for part in range(1, parts):
+            data_file.seek(max(size * part // parts, boundaries[-1]))
+            if data_file.tell() > 0:
+                # move to the start of the next line
+                data_file.seek(data_file.tell() - 1)
+                data_file.readline()
+            boundaries.append(data_file.tell())
+    boundaries.append(size)
+    return [(start, end) for (start, end) in zip(boundaries, boundaries[1:])
+            if start < end]
+
+
+def parse_chunk(path_name, start, end):
+    """It parses the lines of a byte range of a data file, only the first
+    occurrence of a name in the range is kept
+
+    Parameters
+    ----------
+    path_name : str
+        The path of the data file
+    start : int
+        The offset of the first line
+    end : int
+        The offset after the last line
+
+    Returns
+    -------
+    list
+        a list of (name, age, address, phone) tuples in file order
+    """
+    records = []
+    seen = set()
+    with open(path_name, 'rb') as data_file:
+        data_file.seek(start)
+        position = start
+        while position < end:
+            line = data_file.readline()
+            if not line:
+                break
+            position += len(line)
+            record = parse_line(line.decode('utf-8'))
+            if record is None or record[0] in seen:
+                continue
+            seen.add(record[0])
+            records.append(record)
+    return records
+
+
+def load_chunks(path_name, workers=None):
+    """It parses a data file with a pool of processes and yields the
+    parsed chunks in file order
+
+    Parameters
+    ----------
+    path_name : str
+        The path of the data file
+    workers : int
+        The number of processes, the number of CPUs when None
+
+    Returns
+    -------
+    generator
+        a generator of lists of (name, age, address, phone) tuples
+    """
+    workers = workers or os.cpu_count() or 1
+    # a few chunks per worker keeps the pool busy when chunks differ
+    ranges = split_file(path_name, workers * 4)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(parse_chunk, path_name, start, end)
+                   for (start, end) in ranges]
+        for future in futures:
+            yield future.result()
@@ -0,0 +1,78 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# ----- Program Details -----
+# Fixtures shared by the tests: a small generated data file and the
+# ServerOperations objects built from it, with their logs closed at the
+# end of the test.
+
+import threading
+
+import pytest
+
+from benchmarks.common import generate_data
+from protocol import FrameReader, decode_message
+from server import Server, ServerOperations, Session, ThreadedServer
+
+ROWS = 200
+
+
+@pytest.fixture
+def data_path(tmp_path):
+    path_name = str(tmp_path / 'data.txt')
+    generate_data(path_name, ROWS)
+    return path_name
+
+
+@pytest.fixture
+def make_operations():
+    logs = []
+
+    def make(path_name, log=None, **options):
+        if log is not None:
+            logs.append(log)
+        server_operation_obj = ServerOperations(path_name, log, **options)
+        assert server_operation_obj.loaded.wait(10)
+        return server_operation_obj
+
+    yield make
+    for log in logs:
+        log.close()
+
+
+@pytest.fixture
+def serve():
+    servers = []
+
+    def start(server_operation_obj):
+        """It serves the ServerOperations object on a free local port and
+        return the port"""
+        server = ThreadedServer(('localhost', 0), Server)
+        server.server_operation_obj = server_operation_obj
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server.server_address[1]
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def customers(server_operation_obj):
+    """It returns the customer data as a dict of customer dicts"""
+    return {name: record.to_dict()
+            for (name, record) in server_operation_obj.database_dict.items()}
+
+
+def request(server_operation_obj, req_dict, session=None):
+    """It returns the decoded response of the server to the request, sent
+    through the same path as the requests of a connection"""
+    if session is None:
+        session = Session()
+    # the answer to a handshake is still in the previous encoding
+    codec = session.codec
+    reader = FrameReader(compressed=session.compress_min is not None)
+    reader.feed(Server.process_payload(
+        server_operation_obj, codec.encode(req_dict), session))
+    return decode_message(reader.next_frame(), codec)
@@ -0,0 +1,123 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# ----- Program Details -----
+# Tests of the asynchronous client of async_client.py: many requests sent
+# at once on a few pipelined connections, answered in order, and failed
+# together when the connection is lost.
+
+import asyncio
+import socket
+import threading
+
+import pytest
+
+from async_client import AsyncConnection, AsyncCustomerClient
+from client import ClientError
+from protocol import encode_message
+from tests.conftest import customers
+
+NAMES = ['Async{:04d}'.format(index) for index in range(300)]
+
+
+@pytest.fixture(params=['json', 'binary'])
+def encoding(request):
+    return request.param
+
+
+def test_pipelined_requests_are_answered(data_path, make_operations, serve,
+                                         encoding):
+    server_operation_obj = make_operations(data_path)
+    port = serve(server_operation_obj)
+
+    async def run():
+        async with AsyncCustomerClient('localhost', port, connections=3,
+                                       encoding=encoding) as client:
+            added = await asyncio.gather(*[
+                client.add_customer(name, '20', 'Rue Guy', '514 555-0101')
+                for name in NAMES])
+            found = await asyncio.gather(*[client.get_customer(name)
+                                           for name in NAMES])
+            batch = await client.get_customers(NAMES[:5])
+            return (added, found, batch)
+
+    (added, found, batch) = asyncio.run(run())
+    assert all(res_data_dict['success'] for res_data_dict in added)
+    assert [res_data_dict['name'] for res_data_dict in found] == NAMES
+    assert [res_data_dict['name'] for res_data_dict in batch['results']] \
+        == NAMES[:5]
+    assert len(customers(server_operation_obj)) == 200 + len(NAMES)
+
+
+def test_requests_about_a_customer_keep_their_order(data_path,
+                                                    make_operations, serve):
+    server_operation_obj = make_operations(data_path)
+    port = serve(server_operation_obj)
+
+    async def run():
+        async with AsyncCustomerClient('localhost', port,
+                                       connections=4) as client:
+            return await asyncio.gather(*[
+                step for name in NAMES[:50] for step in (
+                    client.add_customer(name, '20'),
+                    client.update_customer(name, age='21'),
+                    client.delete_customer(name))])
+
+    res_data_dicts = asyncio.run(run())
+    assert all(res_data_dict['success'] for res_data_dict in res_data_dicts)
+    assert len(customers(server_operation_obj)) == 200
+
+
+def test_invalid_arguments_are_not_sent(data_path, make_operations, serve):
+    port = serve(make_operations(data_path))
+
+    async def run():
+        client = AsyncCustomerClient('localhost', port)
+        with pytest.raises(ClientError):
+            await client.get_customer('Ada')
+        async with client:
+            with pytest.raises(ClientError):
+                await client.add_customer('Ada', 'old')
+            with pytest.raises(ClientError):
+                await client.update_customer('Ada', phone='5145550101')
+            return await client.get_customer('Ada')
+
+    assert asyncio.run(run()) == {'message': 'Customer not found'}
+
+
+def test_lost_connection_fails_the_waiting_requests():
+    listener = socket.create_server(('127.0.0.1', 0))
+
+    def answer():
+        (sock, _) = listener.accept()
+        with sock:
+            # one answer, then the connection is lost
+            sock.recv(1024)
+            sock.sendall(encode_message({'message': 'Customer not found'}))
+
+    thread = threading.Thread(target=answer)
+    thread.start()
+
+    async def run():
+        connection = await AsyncConnection.open(
+            '127.0.0.1', listener.getsockname()[1])
+        results = await asyncio.gather(*[
+            connection.request({'choice': '1', 'name': name})
+            for name in NAMES[:10]], return_exceptions=True)
+        await connection.close()
+        return results
+
+    results = asyncio.run(run())
+    thread.join()
+    listener.close()
+    assert results[0] == {'message': 'Customer not found'}
+    assert all(isinstance(result, ClientError) for result in results[1:])
+
+
+def test_unreachable_server_is_a_client_error():
+    async def run():
+        async with AsyncCustomerClient('localhost', 1):
+            pass
+
+    with pytest.raises(ClientError):
+        asyncio.run(run())
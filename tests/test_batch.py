@@ -0,0 +1,84 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# ----- Program Details -----
+# Tests of the batch choices of server.py: many customers found (10),
+# added (11) or deleted (12) in one request, one result per item.
+
+import pytest
+
+from server import MAX_BATCH_SIZE
+from storage import MutationLog
+from tests.conftest import customers, request
+
+ADA = {'name': 'Ada', 'age': 36, 'address': 'Rue Guy',
+       'phone': '514 555-0101'}
+
+
+def test_multi_get_answers_every_name_in_order(data_path, make_operations):
+    server_operation_obj = make_operations(data_path)
+    expected = customers(server_operation_obj)
+    res_data_dict = request(server_operation_obj, {
+        'choice': '10',
+        'names': ['Customer00000002', 'Nobody', 'Customer00000001', 7, '']})
+    assert res_data_dict == {'results': [
+        expected['Customer00000002'], {'message': 'Customer not found'},
+        expected['Customer00000001'],
+        {'message': 'Please provide Customer name'},
+        {'message': 'Please provide Customer name'}]}
+
+
+def test_multi_add_answers_every_customer(data_path, tmp_path,
+                                          make_operations):
+    log_path = str(tmp_path / 'changes.log')
+    server_operation_obj = make_operations(data_path, MutationLog(log_path))
+    bob = dict(ADA, name='Bob')
+    res_data_dict = request(server_operation_obj, {
+        'choice': '11',
+        'customers': [ADA, 'Ada', dict(ADA, name=None), ADA,
+                      dict(ADA, name='Customer00000001'), bob]})
+    added = {'message': 'Customer has been added', 'success': True}
+    assert res_data_dict == {'results': [
+        added, {'message': 'Invalid customer'},
+        {'message': 'Please provide Customer name'},
+        {'message': 'Customer already exists'},
+        {'message': 'Customer already exists'}, added]}
+    assert server_operation_obj.get_customer('Ada') == ADA
+    assert server_operation_obj.get_customer('Bob') == bob
+    server_operation_obj.log.close()
+    # only the customers added are logged
+    assert [op_dict['name'] for op_dict in MutationLog.replay(log_path)] \
+        == ['Ada', 'Bob']
+
+
+def test_multi_delete_answers_every_name(data_path, make_operations):
+    server_operation_obj = make_operations(data_path)
+    res_data_dict = request(server_operation_obj, {
+        'choice': '12',
+        'names': ['Customer00000001', 'Customer00000001', None,
+                  'Customer00000003']})
+    deleted = {'message': 'Customer has been deleted', 'success': True}
+    assert res_data_dict == {'results': [
+        deleted, {'message': 'Customer does not exists'},
+        {'message': 'Please provide Customer name'}, deleted]}
+    names = set(customers(server_operation_obj))
+    assert not names & {'Customer00000001', 'Customer00000003'}
+    assert 'Customer00000002' in names
+
+
+@pytest.mark.parametrize('choice, key', [('10', 'names'),
+                                         ('11', 'customers'),
+                                         ('12', 'names')])
+def test_batch_must_be_a_list_of_an_accepted_size(data_path,
+                                                  make_operations, choice,
+                                                  key):
+    server_operation_obj = make_operations(data_path)
+    assert request(server_operation_obj, {'choice': choice}) == {
+        'message': 'Please provide a list'}
+    assert request(server_operation_obj,
+                   {'choice': choice, key: 'Customer00000001'}) == {
+        'message': 'Please provide a list'}
+    assert request(server_operation_obj,
+                   {'choice': choice, key: [''] * (MAX_BATCH_SIZE + 1)}) == {
+        'message': 'Batch size must not exceed {}'.format(MAX_BATCH_SIZE)}
+    assert len(customers(server_operation_obj)) == 200
@@ -0,0 +1,107 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# ----- Program Details -----
+# Tests of the CustomerClient library of client.py against a server on a
+# local port: the methods of the choices, the checks made before sending,
+# and the connection pool shared by threads.
+
+import threading
+
+import pytest
+
+from client import ClientError, CustomerClient
+from tests.conftest import customers
+
+ADA = {'name': 'Ada', 'age': '36', 'address': 'Rue Guy',
+       'phone': '514 555-0101'}
+
+
+@pytest.fixture
+def server_operation_obj(data_path, make_operations):
+    return make_operations(data_path, index_fields=('phone', ))
+
+
+@pytest.fixture(params=['json', 'binary'])
+def client(request, server_operation_obj, serve):
+    port = serve(server_operation_obj)
+    with CustomerClient('localhost', port, encoding=request.param) as client:
+        yield client
+
+
+def test_methods_send_their_choice(client, server_operation_obj):
+    assert client.add_customer(**ADA)['success']
+    assert client.get_customer('Ada') == ADA
+    assert client.update_customer_age('Ada', '37')['success']
+    assert client.update_customer_address('Ada', 'Rue Peel')['success']
+    assert client.update_customer_phone('Ada', '514 555-0102')['success']
+    assert client.update_customer('Ada', age='38')['success']
+    assert client.get_customer('Ada') == dict(ADA, age='38',
+                                              address='Rue Peel',
+                                              phone='514 555-0102')
+    assert [record['name'] for record in client.find_by_phone(
+        '514 555-0102')['customers']] == ['Ada']
+    assert [record['name'] for record in client.search_customers(
+        'ad')['customers']] == ['Ada']
+    assert client.delete_customer('Ada')['success']
+    assert client.get_customer('Ada') == {'message': 'Customer not found'}
+    assert client.report() == customers(server_operation_obj)
+
+
+def test_batches_and_pages(client, server_operation_obj):
+    names = ['Ada', 'Bob']
+    assert client.add_customers([dict(ADA, name=name) for name in names]) \
+        == {'results': [{'message': 'Customer has been added',
+                         'success': True}] * 2}
+    assert client.get_customers(names) == {
+        'results': [dict(ADA, name=name) for name in names]}
+    assert client.delete_customers(names)['results'][1]['success']
+    pages = list(client.report_pages(64))
+    assert [len(page) for page in pages] == [64, 64, 64, 8]
+    assert [record['name'] for page in pages for record in page] == \
+        list(customers(server_operation_obj))
+
+
+def test_invalid_arguments_are_not_sent(client, server_operation_obj):
+    version = server_operation_obj.version
+    with pytest.raises(ClientError):
+        client.add_customer('', '36')
+    with pytest.raises(ClientError):
+        client.add_customer('Ada', 'old')
+    with pytest.raises(ClientError):
+        client.update_customer_phone('Ada', '5145550101')
+    with pytest.raises(ClientError):
+        list(client.report_pages(0))
+    assert server_operation_obj.version == version
+
+
+def test_threads_share_the_pool(client, server_operation_obj):
+    errors = []
+
+    def work(index):
+        try:
+            for count in range(20):
+                name = 'Thread{}-{}'.format(index, count)
+                assert client.add_customer(name, '20')['success']
+                assert client.get_customer(name)['name'] == name
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=work, args=(index, ))
+               for index in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert len(customers(server_operation_obj)) == 200 + 8 * 20
+    # the pool keeps at most its size of idle connections
+    assert len(client.pool.idle) <= client.pool.size
+
+
+def test_unreachable_server_is_a_client_error(serve, server_operation_obj):
+    port = serve(server_operation_obj)
+    with CustomerClient('localhost', port) as client:
+        client.get_customer('Ada')
+    with pytest.raises(ClientError):
+        CustomerClient('localhost', 1).get_customer('Ada')
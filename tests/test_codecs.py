@@ -0,0 +1,114 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# ----- Program Details -----
+# Tests of the encodings of protocol.py: the binary codec gives back what
+# JSON gives back, refuses invalid payloads with ValueError, and is used
+# by a connection once the handshake negotiated it.
+
+import json
+import random
+
+import pytest
+
+from protocol import CODECS, JSON_CODEC, negotiate_codec, to_columns
+from server import Session
+from tests.conftest import customers, request
+
+BINARY_CODEC = CODECS['binary']
+RECORDS = [{'name': 'Customer{:08d}'.format(index), 'age': 18 + index,
+            'address': '{} Rue Guy'.format(index),
+            'phone': '514 555-{:04d}'.format(index)}
+           for index in range(50)]
+MESSAGES = [
+    {'choice': '1', 'name': 'Ada'},
+    {'message': 'Customer has been added', 'success': True},
+    RECORDS[0],
+    dict(RECORDS[0], age='36'),
+    dict(RECORDS[0], age=''),
+    dict(RECORDS[0], age=None),
+    {record['name']: record for record in RECORDS},
+    {record['name'].lower(): record for record in RECORDS},
+    {'customers': RECORDS, 'cursor': 'abc'},
+    {'customers': RECORDS[:3] + [dict(RECORDS[3], age='x')]},
+    {'columns': to_columns(RECORDS)},
+    {'results': [RECORDS[0], {'message': 'Customer not found'}]},
+    {'names': ['a', 'b', 7, None, 1.5, [], {}]},
+    {'lines': 'Ada|36|Rue Guy|514 555-0101\n', 'count': 0},
+    {'nul': 'a\0b', 'empty': '', 'list': ['', '\0', '']},
+    {'unicode': 'Zoë Ωmega 漢字 \U0001f600', 'surrogate': '\ud800'},
+    {'ints': [0, -1, 2 ** 31 - 1, -2 ** 31, 2 ** 31, -2 ** 63, 2 ** 63,
+              10 ** 30, -10 ** 30]},
+    {'floats': [0.0, -1.5, 1e300, 3.5], 'bools': [True, False]},
+    {1: 'int key', 'nested': {'a': [{'b': [[], {}]}]}},
+    [], {}, '', 'text', 0, 2 ** 40, None, True, 1.25,
+    (1, 'two', (3, )),
+]
+
+
+@pytest.mark.parametrize('message', MESSAGES)
+def test_binary_round_trip_is_the_json_one(message):
+    payload = BINARY_CODEC.encode(message)
+    assert BINARY_CODEC.decode(payload) == json.loads(json.dumps(message))
+
+
+def test_binary_report_is_smaller_than_json():
+    report = {record['name']: record for record in RECORDS}
+    assert len(BINARY_CODEC.encode(report)) * 2 \
+        < len(JSON_CODEC.encode(report))
+
+
+@pytest.mark.parametrize('message', MESSAGES[:12])
+def test_truncated_binary_payload_is_refused(message):
+    payload = BINARY_CODEC.encode(message)
+    for end in range(len(payload)):
+        with pytest.raises(ValueError):
+            BINARY_CODEC.decode(payload[:end])
+    with pytest.raises(ValueError):
+        BINARY_CODEC.decode(payload + b'N')
+
+
+def test_corrupted_binary_payload_is_a_value_error():
+    rnd = random.Random(0)
+    for message in MESSAGES[:12]:
+        payload = bytearray(BINARY_CODEC.encode(message))
+        for _ in range(200):
+            corrupted = bytearray(payload)
+            corrupted[rnd.randrange(len(payload))] = rnd.randrange(256)
+            try:
+                BINARY_CODEC.decode(bytes(corrupted))
+            except ValueError:
+                pass
+
+
+def test_unencodable_value_is_a_type_error():
+    with pytest.raises(TypeError):
+        BINARY_CODEC.encode({'value': object()})
+
+
+def test_negotiation_falls_back_to_json():
+    assert negotiate_codec(['binary', 'json']) is BINARY_CODEC
+    assert negotiate_codec(['unknown', 'binary']) is BINARY_CODEC
+    assert negotiate_codec(['unknown']) is JSON_CODEC
+    assert negotiate_codec('binary') is JSON_CODEC
+    assert negotiate_codec(None) is JSON_CODEC
+
+
+def test_connection_switches_to_the_negotiated_codec(data_path,
+                                                    make_operations):
+    server_operation_obj = make_operations(data_path)
+    session = Session()
+    assert request(server_operation_obj,
+                   {'choice': '18', 'encodings': ['binary']},
+                   session) == {'encoding': 'binary', 'compression': None,
+                                'compress_min': None, 'success': True}
+    assert session.codec is BINARY_CODEC
+    expected = customers(server_operation_obj)
+    assert request(server_operation_obj, {'choice': '7'}, session) == \
+        expected
+    assert request(server_operation_obj,
+                   {'choice': '1', 'name': 'Customer00000001'},
+                   session) == expected['Customer00000001']
+    page = request(server_operation_obj, {'choice': '7', 'page_size': 5},
+                   session)
+    assert page['customers'] == list(expected.values())[:5]
@@ -0,0 +1,119 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# ----- Program Details -----
+# Tests of the import (22) and export (23) of the customer data in the
+# format of the data file: an export imported again gives back the same
+# customers, and the values the format can not hold are refused before
+# they are stored.
+
+import os
+
+import pytest
+
+from client import CustomerClient
+from storage import Customer, Snapshot, format_line
+from tests.conftest import customers, request
+
+UNUSUAL = [
+    {'name': 'Zoë Ωmega', 'age': 36, 'address': '漢字 Street',
+     'phone': '514 555-0101'},
+    {'name': 'Emoji \U0001f600', 'age': '', 'address': '',
+     'phone': ''},
+    {'name': 'Old', 'age': 2 ** 40, 'address': 'a, b; "c"',
+     'phone': '\t514 555-0102 x'},
+]
+
+
+def test_export_imported_again_gives_back_the_customers(data_path, tmp_path,
+                                                        make_operations,
+                                                        serve):
+    source = make_operations(data_path)
+    assert all(res_data_dict['success'] for res_data_dict in
+               source.add_customers(UNUSUAL)['results'])
+    empty_path = str(tmp_path / 'empty.txt')
+    open(empty_path, 'w').close()
+    target = make_operations(empty_path)
+    export_path = str(tmp_path / 'export.txt')
+    with CustomerClient('localhost', serve(source)) as client:
+        assert client.export_file(export_path, page_size=64) == 203
+    with CustomerClient('localhost', serve(target)) as client:
+        totals = client.import_file(export_path, chunk_lines=50)
+    assert (totals['accepted'], totals['duplicates'], totals['rejected']) \
+        == (203, 0, 0)
+    # the fields are read back stripped, like the data file at startup
+    expected = customers(source)
+    expected['Old']['phone'] = '514 555-0102 x'
+    assert customers(target) == expected
+
+
+@pytest.mark.parametrize('field, value', [
+    ('name', 'Ada|36'), ('name', 'Ada\n'), ('age', '3|6'),
+    ('address', 'Rue Guy\r\nMontreal'), ('phone', '514|555-0101'),
+    ('address', 'lone \ud800 surrogate')])
+def test_values_the_data_file_can_not_hold_are_refused(data_path,
+                                                       make_operations,
+                                                       field, value):
+    server_operation_obj = make_operations(data_path)
+    before = customers(server_operation_obj)
+    message = {'message': '{} must not contain | or a line break'.format(
+        field.capitalize())}
+    ada = dict({'name': 'Ada', 'age': 36, 'address': 'Rue Guy',
+                'phone': '514 555-0101'}, **{field: value})
+    assert request(server_operation_obj, dict(ada, choice='2')) == message
+    if field != 'name':
+        assert request(server_operation_obj,
+                       {'choice': '13', 'name': 'Customer00000001',
+                        field: value}) == message
+    assert customers(server_operation_obj) == before
+
+
+def test_import_rejects_the_lines_it_can_not_store(data_path,
+                                                   make_operations):
+    server_operation_obj = make_operations(data_path)
+    res_data_dict = request(server_operation_obj, {
+        'choice': '22', 'lines': ['Ada|36|Rue Guy|514 555-0101\n',
+                                  'Bob|20|lone \ud800|\n',
+                                  'Customer00000001|1||\n']})
+    assert res_data_dict == {'accepted': 1, 'duplicates': 1, 'rejected': 1,
+                             'rejected_lines': [1], 'success': True}
+    assert request(server_operation_obj, {'choice': '1', 'name': 'Bob'}) \
+        == {'message': 'Customer not found'}
+
+
+def test_age_must_fit_in_64_bits(data_path, make_operations):
+    server_operation_obj = make_operations(data_path)
+    for age in (2 ** 63, -2 ** 63 - 1):
+        assert request(server_operation_obj,
+                       {'choice': '2', 'name': 'Ada', 'age': age}) == {
+            'message': 'Age must fit in 64 bits'}
+    assert request(server_operation_obj, {'choice': '2', 'name': 'Ada',
+                                          'age': 2 ** 63 - 1})['success']
+
+
+@pytest.mark.parametrize('age', [None, 3.5, True, 2 ** 63])
+def test_values_of_other_types_are_not_written(tmp_path, age):
+    record = Customer('Ada', age, 'Rue Guy', '514 555-0101')
+    if not isinstance(age, int) or isinstance(age, bool):
+        with pytest.raises(ValueError):
+            format_line(record)
+    path_name = str(tmp_path / 'customers.snapshot')
+    with pytest.raises((TypeError, ValueError)):
+        Snapshot.write(path_name, [record], 1)
+    # no partial snapshot is left behind
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_failed_snapshot_keeps_the_log(data_path, tmp_path,
+                                       make_operations):
+    snapshot_path = str(tmp_path / 'customers.snapshot')
+    server_operation_obj = make_operations(data_path,
+                                           snapshot_path=snapshot_path)
+    # a record that bypassed the checks
+    server_operation_obj.database_dict['Customer00000001'].age = None
+    res_data_dict = request(server_operation_obj, {'choice': '9'})
+    assert res_data_dict['message'].startswith('Snapshot not saved')
+    assert not os.path.exists(snapshot_path)
+    assert request(server_operation_obj,
+                   {'choice': '23', 'page_size': 10})['message'].startswith(
+        'Customer data can not be exported')
@@ -0,0 +1,137 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# ----- Program Details -----
+# Tests of the secondary indexes of server.py: the phone (15), age range
+# (16) and address (17) queries kept up to date by adds, updates and
+# deletes, and the values refused before they reach the indexes.
+
+import pytest
+
+from indexes import INDEX_FIELDS, SecondaryIndexes
+from server import MAX_REPORT_PAGE_SIZE
+from tests.conftest import customers, request
+
+PHONE = '514 555-0101'
+
+
+@pytest.fixture
+def server_operation_obj(data_path, make_operations):
+    return make_operations(data_path, index_fields=INDEX_FIELDS)
+
+
+def find(server_operation_obj, req_dict):
+    """It returns the names found by an index query"""
+    res_data_dict = request(server_operation_obj, req_dict)
+    return [record['name'] for record in res_data_dict['customers']]
+
+
+def find_all(server_operation_obj):
+    """It returns the names found by a query on each index"""
+    return (find(server_operation_obj, {'choice': '15', 'phone': PHONE}),
+            find(server_operation_obj, {'choice': '16', 'min_age': 120,
+                                        'max_age': 130}),
+            find(server_operation_obj,
+                 {'choice': '17', 'address': 'zanzibar QUAY'}))
+
+
+def check_indexes(server_operation_obj):
+    """It checks that the indexes kept up to date hold the same entries as
+    indexes built again from the customer data"""
+    indexes = server_operation_obj.indexes
+    rebuilt = SecondaryIndexes(indexes.fields)
+    rebuilt.rebuild(server_operation_obj.database_dict.values())
+    assert indexes.phone_index == rebuilt.phone_index
+    assert indexes.age_index == rebuilt.age_index
+    assert indexes.address_index == rebuilt.address_index
+
+
+def test_indexes_follow_adds_updates_and_deletes(server_operation_obj):
+    for name in ('bob', 'Alice', 'Carl'):
+        request(server_operation_obj,
+                {'choice': '2', 'name': name, 'age': 120,
+                 'address': '1 Zanzibar Quay', 'phone': PHONE})
+    # every query orders the customers by name without regard to case
+    assert find_all(server_operation_obj) == (['Alice', 'bob', 'Carl'], ) * 3
+
+    request(server_operation_obj, {'choice': '13', 'name': 'bob',
+                                   'age': '121', 'phone': '514 555-0102'})
+    request(server_operation_obj, {'choice': '5', 'name': 'Alice',
+                                   'address': '2 Rue Guy'})
+    assert find_all(server_operation_obj) == (['Alice', 'Carl'],
+                                              ['Alice', 'Carl', 'bob'],
+                                              ['bob', 'Carl'])
+    assert find(server_operation_obj, {'choice': '16', 'min_age': 121,
+                                       'max_age': 121}) == ['bob']
+
+    request(server_operation_obj, {'choice': '3', 'name': 'Carl'})
+    request(server_operation_obj, {'choice': '12', 'names': ['bob']})
+    assert find_all(server_operation_obj) == (['Alice'], ['Alice'], [])
+    check_indexes(server_operation_obj)
+
+
+def test_queries_stop_at_the_limit(server_operation_obj):
+    for name in ('bob', 'Alice', 'Carl'):
+        server_operation_obj.add_customer(name, 120, '1 Zanzibar Quay',
+                                          PHONE)
+    for req_dict in ({'choice': '15', 'phone': PHONE},
+                     {'choice': '16', 'min_age': 120},
+                     {'choice': '17', 'address': 'zanzibar'}):
+        assert find(server_operation_obj, dict(req_dict, limit=2)) == [
+            'Alice', 'bob']
+        assert request(server_operation_obj, dict(req_dict, limit=0)) == {
+            'message': 'Limit must be between 1 and {}'.format(
+                MAX_REPORT_PAGE_SIZE)}
+
+
+@pytest.mark.parametrize('fields, message', [
+    ({'phone': ['1']}, 'Phone must be a string'),
+    ({'phone': {'a': 1}}, 'Phone must be a string'),
+    ({'phone': None}, 'Phone must be a string'),
+    ({'address': 12}, 'Address must be a string'),
+    ({'age': [36]}, 'Age must be an integer or a string'),
+    ({'age': 3.5}, 'Age must be an integer or a string'),
+    ({'age': True}, 'Age must be an integer or a string')])
+def test_values_of_other_types_are_refused_before_any_change(
+        server_operation_obj, fields, message):
+    before = customers(server_operation_obj)
+    sorted_index = list(server_operation_obj.sorted_index)
+    ada = dict({'name': 'Ada', 'age': 36, 'address': 'Rue Guy',
+                'phone': PHONE}, **fields)
+    assert request(server_operation_obj, dict(ada, choice='2')) == {
+        'message': message}
+    assert request(server_operation_obj,
+                   {'choice': '11', 'customers': [ada]}) == {
+        'results': [{'message': message}]}
+    assert request(server_operation_obj,
+                   dict(fields, choice='13', name='Customer00000001')) == {
+        'message': message}
+    assert customers(server_operation_obj) == before
+    assert server_operation_obj.sorted_index == sorted_index
+    check_indexes(server_operation_obj)
+    # the customer can still be changed and deleted
+    assert request(server_operation_obj,
+                   {'choice': '6', 'name': 'Customer00000001',
+                    'phone': PHONE})['success']
+    assert request(server_operation_obj,
+                   {'choice': '3', 'name': 'Customer00000001'})['success']
+    check_indexes(server_operation_obj)
+
+
+def test_invalid_queries_are_refused(data_path, make_operations,
+                                     server_operation_obj):
+    for phone in ('', ['1'], {'a': 1}):
+        assert request(server_operation_obj,
+                       {'choice': '15', 'phone': phone}) == {
+            'message': 'Please provide Customer phone'}
+    for age in ('', 'ten', [1], 3.5):
+        assert request(server_operation_obj,
+                       {'choice': '16', 'min_age': age}) == {
+            'message': 'Please enter valid age'}
+    for address in ('', ['Guy']):
+        assert request(server_operation_obj,
+                       {'choice': '17', 'address': address}) == {
+            'message': 'Please provide Customer address'}
+    not_indexed = make_operations(data_path, index_fields=('age', ))
+    assert request(not_indexed, {'choice': '15', 'phone': PHONE}) == {
+        'message': 'The phone index is not enabled'}
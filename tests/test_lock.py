@@ -0,0 +1,99 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# ----- Program Details -----
+# Tests of the ReadWriteLock of server.py: readers share the lock, a
+# writer runs alone and waiting writers go before new readers.
+
+import threading
+import time
+
+from server import ReadWriteLock
+
+TIMEOUT = 5.0
+
+
+def wait_until(condition):
+    deadline = time.monotonic() + TIMEOUT
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.001)
+
+
+def test_readers_share_the_lock():
+    lock = ReadWriteLock()
+    lock.acquire_read()
+    acquired = threading.Event()
+
+    def reader():
+        with lock.read_locked():
+            acquired.set()
+
+    thread = threading.Thread(target=reader)
+    thread.start()
+    assert acquired.wait(TIMEOUT)
+    thread.join()
+    lock.release_read()
+
+
+def test_writer_waits_for_the_readers():
+    lock = ReadWriteLock()
+    lock.acquire_read()
+    acquired = threading.Event()
+
+    def writer():
+        with lock.write_locked():
+            acquired.set()
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    wait_until(lambda: lock.waiting_writers == 1)
+    assert not acquired.is_set()
+    lock.release_read()
+    assert acquired.wait(TIMEOUT)
+    thread.join()
+
+
+def test_waiting_writer_goes_before_new_readers():
+    lock = ReadWriteLock()
+    lock.acquire_read()
+    order = []
+
+    def writer():
+        with lock.write_locked():
+            order.append('writer')
+
+    def reader():
+        with lock.read_locked():
+            order.append('reader')
+
+    writer_thread = threading.Thread(target=writer)
+    writer_thread.start()
+    wait_until(lambda: lock.waiting_writers == 1)
+    # a new reader must queue behind the waiting writer
+    reader_thread = threading.Thread(target=reader)
+    reader_thread.start()
+    time.sleep(0.05)
+    assert order == []
+    lock.release_read()
+    writer_thread.join(TIMEOUT)
+    reader_thread.join(TIMEOUT)
+    assert order == ['writer', 'reader']
+
+
+def test_readers_wait_for_the_writer():
+    lock = ReadWriteLock()
+    lock.acquire_write()
+    acquired = threading.Event()
+
+    def reader():
+        with lock.read_locked():
+            acquired.set()
+
+    thread = threading.Thread(target=reader)
+    thread.start()
+    time.sleep(0.05)
+    assert not acquired.is_set()
+    lock.release_write()
+    assert acquired.wait(TIMEOUT)
+    thread.join()
@@ -0,0 +1,99 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# ----- Program Details -----
+# Tests of the request metrics of metrics.py: the counters returned by the
+# stats choice (19), the latency percentiles and the plain-text dump of
+# the metrics port.
+
+import socket
+
+from client import CustomerClient
+from metrics import LATENCY_BUCKETS, Histogram, MetricsServer, ServerMetrics
+from server import Session
+from tests.conftest import request
+
+
+def test_histogram_percentile_is_a_bucket_bound():
+    histogram = Histogram()
+    assert histogram.percentile(50) is None
+    for seconds in [0.0002] * 90 + [0.003] * 9 + [20.0]:
+        histogram.add(seconds)
+    assert histogram.count() == 100
+    assert histogram.percentile(50) == 0.00025
+    assert histogram.percentile(95) == 0.005
+    assert histogram.percentile(99) == 0.005
+    assert histogram.percentile(100) == float('inf')
+    assert histogram.counts[-1] == 1
+
+
+def test_stats_count_the_requests_errors_and_bytes(data_path,
+                                                    make_operations):
+    server_operation_obj = make_operations(data_path)
+    session = Session()
+    for req_dict in ({'choice': '1', 'name': 'Customer00000001'},
+                     {'choice': '1', 'name': 'Nobody'},
+                     {'choice': '2', 'name': 'Ada', 'age': 36},
+                     {'choice': '99'}, ['not', 'a', 'dict']):
+        request(server_operation_obj, req_dict, session)
+    stats = request(server_operation_obj, {'choice': '19'}, session)
+    # the stats request itself is counted once it is answered
+    assert sorted(stats['choices']) == ['1', '2', 'invalid']
+    assert stats['choices']['1']['requests'] == 2
+    assert stats['choices']['1']['errors'] == 0
+    assert stats['choices']['invalid'] == dict(
+        stats['choices']['invalid'], requests=2, errors=2)
+    assert stats['choices']['2']['p50_ms'] <= \
+        stats['choices']['2']['p99_ms'] <= 1000 * LATENCY_BUCKETS[-1]
+    assert stats['bytes_received'] > 0 and stats['bytes_sent'] > 0
+    assert stats['customers'] == 201
+    assert stats['loaded'] is True
+    assert stats['report_cache'] == dict(stats['report_cache'], hits=0,
+                                         misses=0)
+    assert request(server_operation_obj, {'choice': '19'}, session)[
+        'choices']['19']['requests'] == 1
+
+
+def test_stats_count_the_connections(data_path, make_operations, serve):
+    server_operation_obj = make_operations(data_path)
+    port = serve(server_operation_obj)
+    with CustomerClient('localhost', port, pool_size=2) as client:
+        client.get_customer('Customer00000001')
+        stats = client.stats()
+    assert stats['active_connections'] == 1
+    assert stats['connections_total'] == 1
+    assert stats['connection_errors'] == 0
+    assert stats['choices']['1']['requests'] == 1
+
+
+def test_metrics_port_dumps_the_text_format():
+    metrics = ServerMetrics()
+    metrics.record('1', 0.0003, 20, 40)
+    metrics.record('1', 0.2, 20, 40, error=True)
+    metrics_server = MetricsServer(('localhost', 0),
+                                   lambda: metrics.render_text(
+                                       {'customers': 7}))
+    metrics_server.start()
+    try:
+        address = metrics_server.server_address
+        with socket.create_connection(address) as sock:
+            sock.sendall(b'GET /metrics HTTP/1.0\r\n\r\n')
+            response = b''
+            while True:
+                data = sock.recv(4096)
+                if not data:
+                    break
+                response += data
+    finally:
+        metrics_server.shutdown()
+        metrics_server.server_close()
+    (header, body) = response.decode('utf-8').split('\r\n\r\n', 1)
+    assert header.startswith('HTTP/1.0 200 OK')
+    lines = body.splitlines()
+    assert 'server_requests_total{choice="1"} 2' in lines
+    assert 'server_request_errors_total{choice="1"} 1' in lines
+    assert 'server_request_seconds_bucket{choice="1",le="0.0005"} 1' \
+        in lines
+    assert 'server_request_seconds_bucket{choice="1",le="+Inf"} 2' in lines
+    assert 'server_bytes_sent_total 80' in lines
+    assert 'server_customers 7' in lines
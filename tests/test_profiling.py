@@ -0,0 +1,79 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# ----- Program Details -----
+# Tests of the request profiler of profiling.py, switched on and off and
+# dumped with the profile choice (20).
+
+from client import CustomerClient
+from profiling import PHASES, RequestProfiler
+
+
+def test_profiler_is_off_until_started(data_path, make_operations, serve):
+    server_operation_obj = make_operations(data_path)
+    port = serve(server_operation_obj)
+    with CustomerClient('localhost', port, pool_size=1) as client:
+        client.get_customer('Customer00000001')
+        report = client.profile()
+    assert report['enabled'] is False
+    assert report['slowest'] == [] and report['mean_by_choice'] == {}
+
+
+def test_profiler_times_the_phases_of_the_requests(data_path,
+                                                   make_operations, serve):
+    server_operation_obj = make_operations(data_path)
+    port = serve(server_operation_obj)
+    with CustomerClient('localhost', port, pool_size=1) as client:
+        assert client.profile('start', sample_every=2, keep=3) == {
+            'message': 'Profiling started', 'success': True}
+        for index in range(10):
+            client.get_customer('Customer{:08d}'.format(index))
+        client.report()
+        assert client.profile('stop')['success']
+        client.get_customer('Customer00000001')
+        report = client.profile()
+    assert report['enabled'] is False
+    assert report['sample_every'] == 2
+    # the start request is answered before it can be profiled, the stop
+    # request after the profiler is off
+    assert report['mean_by_choice']['1']['requests'] == 10
+    assert report['mean_by_choice']['7']['requests'] == 1
+    slowest = report['slowest']
+    assert len(slowest) == 3
+    totals = [request['total_ms'] for request in slowest]
+    assert totals == sorted(totals, reverse=True)
+    for request in slowest:
+        assert abs(sum(request[phase + '_ms'] for phase in PHASES)
+                   - request['total_ms']) < 1e-6
+    # every second request ran under cProfile, slower than the others
+    profiled = [request for request in slowest if request['profile']]
+    assert profiled and all('function calls' in request['profile']
+               for request in profiled)
+
+
+def test_start_clears_the_results():
+    profiler = RequestProfiler()
+    profiler.start(sample_every=0, keep=1)
+    assert profiler.run(lambda: 7) == (7, None)
+    records = [{'choice': '1', 'time': 0, 'decode': 0.001, 'dispatch': 0.002,
+                'encode': 0.001, 'profile': None},
+               {'choice': '1', 'time': 0, 'decode': 0.001, 'dispatch': 0.004,
+                'encode': 0.001, 'profile': None}]
+    profiler.finish(records, 0.001)
+    assert records == []
+    report = profiler.report()
+    assert [request['dispatch_ms'] for request in report['slowest']] == [4.0]
+    assert report['mean_by_choice']['1']['dispatch_ms'] == 3.0
+    profiler.start()
+    assert profiler.report()['slowest'] == []
+
+
+def test_invalid_profile_requests_are_refused(data_path, make_operations,
+                                              serve):
+    port = serve(make_operations(data_path))
+    with CustomerClient('localhost', port, pool_size=1) as client:
+        assert client.profile('pause') == {
+            'message': 'Invalid profile action'}
+        assert client.profile('start', sample_every='often') == {
+            'message': 'Invalid profile options'}
+        assert client.profile()['enabled'] is False
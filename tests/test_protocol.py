@@ -0,0 +1,166 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# ----- Program Details -----
+# Tests of the framing of protocol.py: frames split by TCP, pipelined
+# frames, the limit on the frame size on both sides of a connection, the
+# compressed frames and the columnar layout of the report.
+
+import socket
+import threading
+import zlib
+
+import pytest
+
+import protocol
+from client import ClientError, Connection, CustomerClient
+from protocol import (COMPRESSED, HEADER, MAX_FRAME_SIZE, FrameReader,
+                      decode_message, encode_frame, encode_message,
+                      from_columns, to_columns)
+from server import TOO_LARGE_MESSAGE, Session
+from tests.conftest import customers, request
+
+
+def test_partial_frame_waits_for_the_rest():
+    frame = encode_message({'choice': '1', 'name': 'Ada'})
+    reader = FrameReader()
+    for position in range(len(frame) - 1):
+        reader.feed(frame[position:position + 1])
+        assert reader.next_frame() is None
+    reader.feed(frame[-1:])
+    assert decode_message(reader.next_frame()) == {'choice': '1',
+                                                   'name': 'Ada'}
+    assert reader.next_frame() is None
+
+
+def test_pipelined_frames_come_out_in_order():
+    messages = [{'choice': '1', 'name': 'Name{}'.format(index)}
+                for index in range(5)]
+    data = b''.join(encode_message(message) for message in messages)
+    reader = FrameReader()
+    # the last frame is cut in two reads
+    reader.feed(data[:-3])
+    payloads = list(reader.frames())
+    reader.feed(data[-3:])
+    payloads += list(reader.frames())
+    assert [decode_message(payload) for payload in payloads] == messages
+
+
+def test_empty_payload_is_a_frame():
+    reader = FrameReader()
+    reader.feed(encode_frame(b'') + encode_frame(b'x'))
+    assert list(reader.frames()) == [b'', b'x']
+
+
+def test_oversized_header_is_rejected_before_buffering():
+    reader = FrameReader(max_size=1024)
+    reader.feed(HEADER.pack(1025))
+    with pytest.raises(ValueError):
+        reader.next_frame()
+
+
+def test_oversized_payload_is_not_framed(monkeypatch):
+    monkeypatch.setattr(protocol, 'MAX_FRAME_SIZE', 1024)
+    assert encode_frame(b'x' * 1024) == HEADER.pack(1024) + b'x' * 1024
+    with pytest.raises(ValueError):
+        encode_frame(b'x' * 1025)
+
+
+def test_oversized_report_points_to_the_pages(data_path, make_operations,
+                                             monkeypatch):
+    server_operation_obj = make_operations(data_path)
+    monkeypatch.setattr(protocol, 'MAX_FRAME_SIZE', 4096)
+    for layout in ('rows', 'columns'):
+        assert request(server_operation_obj,
+                       {'choice': '7', 'layout': layout}) == {
+            'message': TOO_LARGE_MESSAGE}
+    page = request(server_operation_obj, {'choice': '7', 'page_size': 10})
+    assert len(page['customers']) == 10
+
+
+def test_oversized_response_is_a_client_error():
+    listener = socket.create_server(('127.0.0.1', 0))
+
+    def answer():
+        (sock, _) = listener.accept()
+        with sock:
+            sock.recv(1024)
+            sock.sendall(HEADER.pack(MAX_FRAME_SIZE + 1))
+            sock.recv(1024)
+
+    thread = threading.Thread(target=answer)
+    thread.start()
+    connection = Connection('127.0.0.1', listener.getsockname()[1])
+    with pytest.raises(ClientError):
+        connection.request({'choice': '1', 'name': 'Ada'})
+    connection.close()
+    thread.join()
+    listener.close()
+
+
+def test_compressed_frame_needs_negotiation():
+    frame = encode_frame(b'x' * 5000, compress_min=100)
+    (length, ) = HEADER.unpack_from(frame)
+    assert length & COMPRESSED
+    reader = FrameReader()
+    reader.feed(frame)
+    with pytest.raises(ValueError):
+        reader.next_frame()
+    reader = FrameReader(compressed=True)
+    reader.feed(frame)
+    assert reader.next_frame() == b'x' * 5000
+
+
+def test_small_payload_is_not_compressed():
+    frame = encode_frame(b'x' * 10, compress_min=100)
+    assert frame == HEADER.pack(10) + b'x' * 10
+
+
+def test_compressed_frame_can_not_inflate_past_max_size():
+    payload = zlib.compress(b'\0' * 100000)
+    reader = FrameReader(max_size=10000, compressed=True)
+    reader.feed(HEADER.pack(len(payload) | COMPRESSED) + payload)
+    with pytest.raises(ValueError):
+        reader.next_frame()
+
+
+def test_truncated_compressed_frame_is_rejected():
+    payload = zlib.compress(b'x' * 5000)[:-4]
+    reader = FrameReader(compressed=True)
+    reader.feed(HEADER.pack(len(payload) | COMPRESSED) + payload)
+    with pytest.raises(ValueError):
+        reader.next_frame()
+
+
+def test_columns_give_back_the_report(data_path, make_operations):
+    server_operation_obj = make_operations(data_path)
+    expected = customers(server_operation_obj)
+    columns = to_columns(expected.values())
+    assert columns['name'] == list(expected)
+    assert from_columns(columns) == expected
+    assert from_columns(to_columns([])) == {}
+    for encodings in (['json'], ['binary']):
+        session = Session()
+        request(server_operation_obj,
+                {'choice': '18', 'encodings': encodings,
+                 'compression': ['zlib'], 'compress_min': 0}, session)
+        res_data_dict = request(server_operation_obj,
+                                {'choice': '7', 'layout': 'columns'},
+                                session)
+        assert from_columns(res_data_dict['columns']) == expected
+    assert request(server_operation_obj,
+                   {'choice': '7', 'layout': 'tree'}) == {
+        'message': 'Layout must be one of rows, columns'}
+
+
+def test_compressed_session_follows_the_changes(data_path, make_operations,
+                                                serve):
+    server_operation_obj = make_operations(data_path)
+    port = serve(server_operation_obj)
+    with CustomerClient('localhost', port, pool_size=1,
+                        compression='zlib') as client:
+        assert client.report() == customers(server_operation_obj)
+        assert client.add_customer('Ada', '36')['success']
+        report = client.report()
+        assert 'Ada' in report and len(report) == 201
+        assert client.get_customer('Ada')['age'] == '36'
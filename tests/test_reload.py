@@ -0,0 +1,219 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# ----- Program Details -----
+# Tests of the reload of the data file (choice 24): both modes end with the
+# customer data of the file; diff applies and logs only the differences,
+# swap replaces everything at once and sends the replicas a full copy. A
+# restart after a swap starts from the new data even when it crashed before
+# the new snapshot was written.
+
+import time
+
+import pytest
+
+from replication import MutationStream
+from server import RELOAD_MARKER, ServerOperations, reload_request
+from storage import MutationLog, parse_line
+from tests.conftest import customers
+
+TIMEOUT = 10.0
+
+
+def edit_data_file(path_name):
+    """It removes, changes and adds customers in the data file and return
+    the customer data it then holds"""
+    with open(path_name) as data_file:
+        lines = data_file.read().splitlines()
+    edited = []
+    for (index, line) in enumerate(lines):
+        if index % 10 == 0:
+            continue
+        if index % 10 == 1:
+            fields = line.split('|')
+            fields[3] = '000 000-{:04d}'.format(index)
+            line = '|'.join(fields)
+        edited.append(line)
+    edited += ['New{:04d}|30|1 Main St|555 000-0000'.format(index)
+               for index in range(15)]
+    # a second occurrence of a name is ignored like at startup
+    edited.append(edited[0].split('|')[0] + '|1|Elsewhere|')
+    with open(path_name, 'w') as data_file:
+        data_file.write('\n'.join(edited) + '\n')
+    expected = {}
+    for line in edited:
+        (name, age, address, phone) = parse_line(line)
+        expected.setdefault(name, {'name': name, 'age': age,
+                                   'address': address, 'phone': phone})
+    return expected
+
+
+def reload(server_operation_obj, mode, batch_size=7):
+    res_data_dict = reload_request(server_operation_obj, {
+        'action': 'start', 'mode': mode, 'batch_size': batch_size})
+    assert res_data_dict['success']
+    deadline = time.monotonic() + TIMEOUT
+    while True:
+        state = reload_request(server_operation_obj, {'action': 'status'})
+        if state['state'] != 'running':
+            return state
+        assert time.monotonic() < deadline, 'reload did not finish'
+        time.sleep(0.01)
+
+
+@pytest.mark.parametrize('mode', ['diff', 'swap'])
+def test_reload_matches_the_data_file(mode, data_path, make_operations):
+    server_operation_obj = make_operations(data_path, index_fields=('phone',))
+    server_operation_obj.add_customer('Ada', 36, 'Rue Guy', '514 555-0101')
+    expected = edit_data_file(data_path)
+
+    state = reload(server_operation_obj, mode)
+    assert state['state'] == 'done'
+    assert (state['added'], state['removed']) == (15, 21)
+    assert customers(server_operation_obj) == expected
+    # the name index and the secondary indexes follow the new data
+    assert [name for (_, name) in server_operation_obj.sorted_index] == \
+        sorted(expected, key=lambda name: (name.lower(), name))
+    assert len(server_operation_obj.find_by_phone(
+        '555 000-0000')['customers']) == 15
+    assert server_operation_obj.find_by_phone('514 555-0101') == {
+        'customers': []}
+
+
+def test_diff_changes_only_the_differences(data_path, tmp_path,
+                                           make_operations):
+    log_path = str(tmp_path / 'changes.log')
+    stream = MutationStream()
+    server_operation_obj = make_operations(
+        data_path, MutationLog(log_path, 'os'), stream=stream)
+    kept = server_operation_obj.database_dict['Customer00000002']
+    edit_data_file(data_path)
+
+    state = reload(server_operation_obj, 'diff')
+    assert (state['changed'], state['unchanged']) == (20, 160)
+    # the unchanged customers are the same records
+    assert server_operation_obj.database_dict['Customer00000002'] is kept
+    # every difference is logged and streamed like a change of a client
+    changes = list(MutationLog.replay(log_path))
+    assert len(changes) == 15 + 20 + 20
+    assert stream.seq == len(changes)
+    assert stream.can_follow('', 0)
+
+
+def test_swap_replaces_the_data_and_resets_the_stream(data_path, tmp_path,
+                                                     make_operations):
+    log_path = str(tmp_path / 'changes.log')
+    stream = MutationStream()
+    server_operation_obj = make_operations(
+        data_path, MutationLog(log_path, 'os'), stream=stream)
+    server_operation_obj.add_customer('Ada', 36, 'Rue Guy', '514 555-0101')
+    stream_id = stream.stream_id
+    version = server_operation_obj.version
+    expected = edit_data_file(data_path)
+
+    reload(server_operation_obj, 'swap')
+    assert server_operation_obj.version > version
+    # the log held changes to the old data, the file is the new base
+    assert list(MutationLog.replay(log_path)) == []
+    assert not stream.can_follow(stream_id, 1)
+    assert not stream.can_follow('', 0)
+    server_operation_obj.log.close()
+
+    restarted = make_operations(data_path, MutationLog(log_path, 'os'))
+    assert customers(restarted) == expected
+
+
+def test_reload_refuses_invalid_requests(data_path, make_operations):
+    server_operation_obj = make_operations(data_path)
+    assert not reload_request(server_operation_obj, {
+        'action': 'start', 'mode': 'copy'}).get('success')
+    assert not reload_request(server_operation_obj, {
+        'action': 'start', 'batch_size': 0}).get('success')
+    assert reload_request(server_operation_obj, {'action': 'status'}) == {
+        'state': 'idle'}
+    server_operation_obj.path_name = data_path + '.missing'
+    assert reload_request(server_operation_obj, {'action': 'start'}) == {
+        'message': 'Data file not found'}
+
+
+def test_diff_counts_only_the_customers_it_added(data_path, make_operations,
+                                                 monkeypatch):
+    server_operation_obj = make_operations(data_path)
+    expected = edit_data_file(data_path)
+    insert_customer = server_operation_obj.insert_customer
+
+    def refuse_new0000(name, *fields):
+        if name == 'New0000':
+            return ({'message': 'Customer already exists'}, 0)
+        return insert_customer(name, *fields)
+
+    monkeypatch.setattr(server_operation_obj, 'insert_customer',
+                        refuse_new0000)
+    state = reload(server_operation_obj, 'diff')
+    assert (state['added'], state['removed']) == (14, 20)
+    del expected['New0000']
+    assert customers(server_operation_obj) == expected
+
+
+def test_swap_writes_the_new_snapshot(data_path, tmp_path, make_operations):
+    log_path = str(tmp_path / 'changes.log')
+    snapshot_path = str(tmp_path / 'customers.snapshot')
+    server_operation_obj = make_operations(
+        data_path, MutationLog(log_path, 'os'), snapshot_path=snapshot_path)
+    assert server_operation_obj.write_snapshot()['success']
+    server_operation_obj.add_customer('Ada', 36, 'Rue Guy', '514 555-0101')
+    expected = edit_data_file(data_path)
+
+    assert reload(server_operation_obj, 'swap')['state'] == 'done'
+    assert list(MutationLog.replay(log_path)) == []
+    server_operation_obj.log.close()
+    restarted = make_operations(data_path, MutationLog(log_path, 'os'),
+                                snapshot_path=snapshot_path)
+    assert customers(restarted) == expected
+
+
+def test_restart_before_the_new_snapshot_starts_from_the_data_file(
+        data_path, tmp_path, make_operations, monkeypatch):
+    log_path = str(tmp_path / 'changes.log')
+    snapshot_path = str(tmp_path / 'customers.snapshot')
+    server_operation_obj = make_operations(
+        data_path, MutationLog(log_path, 'os'), snapshot_path=snapshot_path)
+    assert server_operation_obj.write_snapshot()['success']
+    server_operation_obj.add_customer('Ada', 36, 'Rue Guy', '514 555-0101')
+    expected = edit_data_file(data_path)
+    # the server crashes before the new snapshot is written
+    monkeypatch.setattr(ServerOperations, 'write_snapshot',
+                        lambda self: {'success': True})
+    assert reload(server_operation_obj, 'swap')['state'] == 'done'
+    assert list(MutationLog.replay(log_path))[-1] == RELOAD_MARKER
+    server_operation_obj.add_customer('Bob', 20, 'Rue Peel', '514 555-0102')
+    server_operation_obj.delete_customer('New0001')
+    server_operation_obj.log.close()
+    monkeypatch.undo()
+
+    restarted = make_operations(data_path, MutationLog(log_path, 'os'),
+                                snapshot_path=snapshot_path)
+    expected['Bob'] = {'name': 'Bob', 'age': 20, 'address': 'Rue Peel',
+                       'phone': '514 555-0102'}
+    del expected['New0001']
+    assert customers(restarted) == expected
+    assert [name for (_, name) in restarted.sorted_index] == \
+        sorted(expected, key=lambda name: (name.lower(), name))
+
+
+def test_swap_fails_when_the_snapshot_is_not_written(data_path, tmp_path,
+                                                     make_operations):
+    log_path = str(tmp_path / 'changes.log')
+    snapshot_path = str(tmp_path / 'missing' / 'customers.snapshot')
+    server_operation_obj = make_operations(
+        data_path, MutationLog(log_path, 'os'), snapshot_path=snapshot_path)
+    server_operation_obj.add_customer('Ada', 36, 'Rue Guy', '514 555-0101')
+    expected = edit_data_file(data_path)
+
+    state = reload(server_operation_obj, 'swap')
+    assert state['state'] == 'failed' and state['error']
+    # the log still makes a restart start from the data file
+    server_operation_obj.log.close()
+    restarted = make_operations(data_path, MutationLog(log_path, 'os'),
+                                snapshot_path=snapshot_path)
+    assert customers(restarted) == expected
@@ -0,0 +1,148 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# ----- Program Details -----
+# Tests of the MutationStream of replication.py: which replicas can follow
+# the stream from where they stopped and which ones need a full copy, and
+# the changes they are sent, and a replica following a primary.
+
+import threading
+import time
+
+from replication import MutationStream, ReplicaFollower, ReplicationServer
+from tests.conftest import customers, request
+
+
+def publish(stream, count):
+    for index in range(count):
+        stream.publish({'op': 'delete', 'name': 'Name{}'.format(index)})
+
+
+def test_new_replica_follows_a_stream_of_the_data_file():
+    stream = MutationStream()
+    assert stream.can_follow('', 0)
+    publish(stream, 3)
+    # every change since the start is kept
+    assert stream.can_follow('', 0)
+    assert [seq for (seq, _, _) in stream.changes_after(0)] == [1, 2, 3]
+
+
+def test_replica_must_know_the_stream():
+    stream = MutationStream()
+    publish(stream, 3)
+    assert stream.can_follow(stream.stream_id, 3)
+    assert stream.can_follow(stream.stream_id, 1)
+    assert not stream.can_follow('another run', 3)
+    assert not stream.can_follow('', 1)
+
+
+def test_sequence_number_must_be_valid():
+    stream = MutationStream()
+    publish(stream, 3)
+    for seq in (-1, 4, '2', None, 1.5):
+        assert not stream.can_follow(stream.stream_id, seq)
+
+
+def test_replica_behind_the_kept_changes_needs_a_copy():
+    stream = MutationStream(buffer_size=2)
+    publish(stream, 5)
+    # only the changes 4 and 5 are kept
+    assert not stream.can_follow(stream.stream_id, 2)
+    assert stream.can_follow(stream.stream_id, 3)
+    assert not stream.can_follow('', 0)
+    assert stream.changes_after(2, timeout=0) is None
+    assert [seq for (seq, _, _) in stream.changes_after(3)] == [4, 5]
+
+
+def test_changes_after_is_cut_at_the_limit():
+    stream = MutationStream()
+    publish(stream, 10)
+    changes = stream.changes_after(2, limit=3)
+    assert [seq for (seq, _, _) in changes] == [3, 4, 5]
+    assert changes[0][2] == {'op': 'delete', 'name': 'Name2'}
+
+
+def test_changes_after_waits_for_a_change():
+    stream = MutationStream()
+    publish(stream, 1)
+    assert stream.changes_after(1, timeout=0.01) == []
+    timer = threading.Timer(0.05, publish, (stream, 1))
+    timer.start()
+    start = time.monotonic()
+    changes = stream.changes_after(1, timeout=5)
+    assert time.monotonic() - start < 5
+    assert [seq for (seq, _, _) in changes] == [2]
+    timer.join()
+
+
+def test_reset_sends_every_replica_a_copy():
+    stream = MutationStream()
+    publish(stream, 3)
+    old_stream_id = stream.stream_id
+    stream.reset()
+    assert stream.stream_id != old_stream_id
+    assert not stream.can_follow(old_stream_id, 3)
+    assert not stream.can_follow('', 0)
+    # a replica still sending the old stream is told it missed changes
+    assert stream.changes_after(3, timeout=0) is None
+    assert stream.can_follow(stream.stream_id, stream.seq)
+
+
+def wait_for(condition, timeout=10):
+    """It waits until the condition function returns True, False after
+    timeout seconds"""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_replica_follows_the_primary(data_path, make_operations):
+    primary = make_operations(data_path, stream=MutationStream())
+    replication_server = ReplicationServer(('localhost', 0), primary)
+    replication_server.start()
+    replica = make_operations(data_path)
+    replica.replica = ReplicaFollower(replica,
+                                      replication_server.server_address)
+    # a change made before the replica connects is sent too
+    primary.add_customer('Ada', 36, 'Rue Guy', '514 555-0101')
+    replica.replica.start()
+    try:
+        primary.update_customer('Customer00000001', {'age': 99})
+        primary.delete_customer('Customer00000002')
+        assert wait_for(lambda: customers(replica) == customers(primary))
+        assert wait_for(lambda: replica.replica.status()['applied_seq'] == 3)
+        status = request(replica, {'choice': '19'})['replication']
+        assert status['role'] == 'replica' and status['lag_ops'] == 0
+        assert status['resyncs'] == 0
+        # the replica refuses the changes
+        assert 'read-only' in request(replica, {
+            'choice': '3', 'name': 'Ada'})['message']
+        assert request(replica, {'choice': '1', 'name': 'Ada'})['name'] \
+            == 'Ada'
+    finally:
+        replication_server.shutdown()
+        replication_server.server_close()
+
+
+def test_replica_missing_changes_gets_a_copy(data_path, make_operations):
+    primary = make_operations(data_path, stream=MutationStream(
+        buffer_size=2))
+    for index in range(5):
+        primary.delete_customer('Customer{:08d}'.format(index))
+    replication_server = ReplicationServer(('localhost', 0), primary)
+    replication_server.start()
+    replica = make_operations(data_path)
+    replica.replica = ReplicaFollower(replica,
+                                      replication_server.server_address)
+    replica.replica.start()
+    try:
+        assert wait_for(lambda: customers(replica) == customers(primary))
+        assert replica.replica.status()['resyncs'] == 1
+        primary.add_customer('Ada', 36, 'Rue Guy', '514 555-0101')
+        assert wait_for(lambda: 'Ada' in customers(replica))
+    finally:
+        replication_server.shutdown()
+        replication_server.server_close()
@@ -0,0 +1,129 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# ----- Program Details -----
+# Tests of the report of server.py (choice 7): the pages walked with a
+# cursor and their behaviour when the customer data changes in between,
+# and the cached report dropped by every change of the customer data.
+
+import pytest
+
+from protocol import from_columns
+from server import MAX_REPORT_PAGE_SIZE
+from tests.conftest import ROWS, customers, request
+
+NAME = 'Customer00000001'
+# every request changing the customer data
+CHANGES = [
+    {'choice': '2', 'name': 'Ada', 'age': 36, 'address': 'Rue Guy',
+     'phone': '514 555-0101'},
+    {'choice': '3', 'name': NAME},
+    {'choice': '4', 'name': NAME, 'age': 99},
+    {'choice': '5', 'name': NAME, 'address': 'Rue Peel'},
+    {'choice': '6', 'name': NAME, 'phone': '514 555-0102'},
+    {'choice': '11', 'customers': [
+        {'name': 'Ada', 'age': 36, 'address': 'Rue Guy',
+         'phone': '514 555-0101'}]},
+    {'choice': '12', 'names': [NAME]},
+    {'choice': '13', 'name': NAME, 'age': 99, 'phone': '514 555-0102'},
+    {'choice': '22', 'lines': ['Ada|36|Rue Guy|514 555-0101\n']}]
+
+
+def report_pages(server_operation_obj, page_size):
+    """It returns the pages of the report walked with the cursors"""
+    pages = []
+    req_dict = {'choice': '7', 'page_size': page_size}
+    while True:
+        res_data_dict = request(server_operation_obj, req_dict)
+        pages.append(res_data_dict['customers'])
+        if not res_data_dict['cursor']:
+            return pages
+        req_dict['cursor'] = res_data_dict['cursor']
+
+
+def test_pages_walk_the_whole_report_in_order(data_path, make_operations):
+    server_operation_obj = make_operations(data_path)
+    server_operation_obj.add_customer('ada', 36, 'Rue Guy', '514 555-0101')
+    server_operation_obj.add_customer('Bob', 41, 'Rue Peel', '514 555-0102')
+    report = request(server_operation_obj, {'choice': '7'})
+    pages = report_pages(server_operation_obj, 30)
+    assert [len(page) for page in pages] == [30] * 6 + [22]
+    customers = [record for page in pages for record in page]
+    # ordered by name without regard to case, like the whole report
+    assert [record['name'] for record in customers] == list(report)
+    assert customers[:2] == [report['ada'], report['Bob']]
+
+
+def test_last_page_is_full_when_the_size_divides_the_report(
+        data_path, make_operations):
+    server_operation_obj = make_operations(data_path)
+    pages = report_pages(server_operation_obj, ROWS // 4)
+    assert [len(page) for page in pages] == [ROWS // 4] * 4
+
+
+def test_cursor_survives_the_changes_between_pages(data_path,
+                                                  make_operations):
+    server_operation_obj = make_operations(data_path)
+    first = request(server_operation_obj, {'choice': '7', 'page_size': 10})
+    names = [record['name'] for record in first['customers']]
+    # the last customer of the page is gone, one is added before the
+    # cursor and one after it
+    server_operation_obj.delete_customer(names[-1])
+    server_operation_obj.add_customer('A', 1, 'Rue Guy', '514 555-0101')
+    server_operation_obj.add_customer(names[-1] + 'b', 1, 'Rue Guy',
+                                      '514 555-0101')
+    second = request(server_operation_obj,
+                     {'choice': '7', 'page_size': 10,
+                      'cursor': first['cursor']})
+    assert second['customers'][0]['name'] == names[-1] + 'b'
+    assert 'A' not in [record['name'] for record in second['customers']]
+
+
+def test_invalid_page_arguments_are_refused(data_path, make_operations):
+    server_operation_obj = make_operations(data_path)
+    size_message = {'message': 'Page size must be between 1 and {}'.format(
+        MAX_REPORT_PAGE_SIZE)}
+    for page_size in (0, -1, MAX_REPORT_PAGE_SIZE + 1, 'ten', None):
+        assert request(server_operation_obj,
+                       {'choice': '7', 'page_size': page_size}) == \
+            size_message
+    assert request(server_operation_obj,
+                   {'choice': '7', 'page_size': 10,
+                    'cursor': 'not a cursor'}) == {
+        'message': 'Invalid cursor'}
+
+
+@pytest.mark.parametrize('change', CHANGES,
+                         ids=[change['choice'] for change in CHANGES])
+def test_every_change_drops_the_cached_report(data_path, make_operations,
+                                              change):
+    server_operation_obj = make_operations(data_path)
+    before = {layout: request(server_operation_obj,
+                              {'choice': '7', 'layout': layout})
+              for layout in ('rows', 'columns')}
+    stats = server_operation_obj.report_cache_stats()
+    assert request(server_operation_obj, {'choice': '7'}) == before['rows']
+    assert server_operation_obj.report_cache_stats()['hits'] == \
+        stats['hits'] + 1
+
+    request(server_operation_obj, change)
+    expected = customers(server_operation_obj)
+    assert expected != before['rows']
+    report = request(server_operation_obj, {'choice': '7'})
+    assert report == expected
+    assert from_columns(request(server_operation_obj,
+                                {'choice': '7', 'layout': 'columns'})[
+        'columns']) == expected
+    assert server_operation_obj.report_cache_stats()['misses'] == \
+        stats['misses'] + 2
+
+
+def test_replicated_change_drops_the_cached_report(data_path,
+                                                   make_operations):
+    server_operation_obj = make_operations(data_path)
+    before = request(server_operation_obj, {'choice': '7'})
+    server_operation_obj.apply_mutation({'op': 'update', 'name': NAME,
+                                         'fields': {'age': 99}})
+    report = request(server_operation_obj, {'choice': '7'})
+    assert report != before
+    assert report[NAME]['age'] == 99
@@ -0,0 +1,84 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# ----- Program Details -----
+# Tests of the name prefix search of server.py (choice 14), backed by the
+# sorted name index.
+
+import pytest
+
+from server import MAX_REPORT_PAGE_SIZE
+from tests.conftest import request
+
+NAMES = ('ada', 'Ada', 'ADAM', 'Adele', 'Bob', 'adb')
+
+
+@pytest.fixture
+def server_operation_obj(data_path, make_operations):
+    server_operation_obj = make_operations(data_path)
+    for name in NAMES:
+        server_operation_obj.add_customer(name, 36, 'Rue Guy',
+                                          '514 555-0101')
+    return server_operation_obj
+
+
+def search(server_operation_obj, **req_dict):
+    """It returns the names found by a search request"""
+    res_data_dict = request(server_operation_obj,
+                            dict(req_dict, choice='14'))
+    return [record['name'] for record in res_data_dict['customers']]
+
+
+def test_search_ignores_the_case_by_default(server_operation_obj):
+    # in the order of the lower case names, then of the names
+    assert search(server_operation_obj, prefix='ada') == ['Ada', 'ada',
+                                                          'ADAM']
+    assert search(server_operation_obj, prefix='AD') == ['Ada', 'ada',
+                                                         'ADAM', 'adb',
+                                                         'Adele']
+    assert search(server_operation_obj, prefix='x') == []
+
+
+@pytest.mark.parametrize('case_sensitive', [True, 'true', '1'])
+def test_case_sensitive_search(server_operation_obj, case_sensitive):
+    assert search(server_operation_obj, prefix='Ad',
+                  case_sensitive=case_sensitive) == ['Ada', 'Adele']
+
+
+@pytest.mark.parametrize('case_sensitive', [False, 'false', '0', None])
+def test_case_insensitive_search(server_operation_obj, case_sensitive):
+    assert search(server_operation_obj, prefix='Ad',
+                  case_sensitive=case_sensitive) == ['Ada', 'ada', 'ADAM',
+                                                     'adb', 'Adele']
+
+
+def test_search_stops_at_the_limit(server_operation_obj):
+    assert search(server_operation_obj, prefix='customer0000000',
+                  limit=3) == ['Customer00000000', 'Customer00000001',
+                               'Customer00000002']
+    # the limit counts the matches only
+    assert search(server_operation_obj, prefix='a', case_sensitive=True,
+                  limit=2) == ['ada', 'adb']
+
+
+def test_search_follows_the_changes(server_operation_obj):
+    server_operation_obj.delete_customer('Ada')
+    server_operation_obj.add_customer('Adam', 1, 'Rue Guy', '514 555-0101')
+    assert search(server_operation_obj, prefix='ada') == ['ada', 'ADAM',
+                                                          'Adam']
+
+
+def test_invalid_searches_are_refused(server_operation_obj):
+    for prefix in ('', None, 7):
+        assert request(server_operation_obj,
+                       {'choice': '14', 'prefix': prefix}) == {
+            'message': 'Please provide the beginning of the name'}
+    for limit in (0, MAX_REPORT_PAGE_SIZE + 1, 'ten'):
+        assert request(server_operation_obj,
+                       {'choice': '14', 'prefix': 'a', 'limit': limit}) == {
+            'message': 'Limit must be between 1 and {}'.format(
+                MAX_REPORT_PAGE_SIZE)}
+    assert request(server_operation_obj,
+                   {'choice': '14', 'prefix': 'a',
+                    'case_sensitive': 'yes'}) == {
+        'message': 'Case sensitive must be true or false'}
@@ -0,0 +1,110 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# ----- Program Details -----
+# Tests of the sharded deployment: the hash partitions of storage.py, the
+# shards loading their part of the data file, and the ShardedClient of
+# sharding.py splitting the batches and merging the answers of the shards.
+
+import collections
+
+import pytest
+
+from server import ServerOperations
+from sharding import ShardedClient, merge_pages, plan_request
+from storage import parse_line, shard_of
+from tests.conftest import ROWS, customers
+
+SHARDS = 3
+
+
+def test_shard_of_is_stable_and_spread():
+    names = ['Customer{:08d}'.format(index) for index in range(4000)]
+    shards = [shard_of(name, 4) for name in names]
+    assert shards == [shard_of(name, 4) for name in names]
+    counts = collections.Counter(shards)
+    assert sorted(counts) == [0, 1, 2, 3]
+    assert min(counts.values()) > 800
+    assert all(shard_of(name, 1) == 0 for name in names)
+
+
+def test_shards_split_the_data_file(data_path, make_operations):
+    with open(data_path) as data_file:
+        names = {parse_line(line)[0] for line in data_file}
+    assert len(names) == ROWS
+    seen = set()
+    for index in range(SHARDS):
+        shard = make_operations(data_path, shard=(index, SHARDS))
+        shard_names = set(shard.database_dict)
+        assert all(shard_of(name, SHARDS) == index for name in shard_names)
+        assert not shard_names & seen
+        seen |= shard_names
+        # a shard refuses the names of the other shards
+        other = next(name for name in names
+                     if shard_of(name, SHARDS) != index)
+        assert shard.add_customer(other, 1, 'a', 'b') == {
+            'message': 'Customer belongs to shard {}'.format(
+                shard_of(other, SHARDS))}
+    assert seen == names
+
+
+def test_batch_is_split_between_the_shards():
+    names = ['Customer{:08d}'.format(index) for index in range(20)]
+    plan = plan_request({'choice': '10', 'names': names}, SHARDS)
+    assert sorted(position for (_, _, positions) in plan
+                  for position in positions) == list(range(20))
+    for (shard, req_dict, positions) in plan:
+        assert req_dict['names'] == [names[position]
+                                     for position in positions]
+        assert all(shard_of(name, SHARDS) == shard
+                   for name in req_dict['names'])
+    assert [shard for (shard, _, _) in plan_request(
+        {'choice': '1', 'name': names[0]}, SHARDS)] == [
+        shard_of(names[0], SHARDS)]
+    assert [shard for (shard, _, _) in plan_request(
+        {'choice': '7'}, SHARDS)] == list(range(SHARDS))
+
+
+def test_merged_pages_cover_the_shards_in_order():
+    pages = [{'customers': [{'name': 'b'}, {'name': 'D'}], 'cursor': 'x'},
+             {'customers': [{'name': 'A'}, {'name': 'c'}], 'cursor': ''}]
+    page = merge_pages(pages, 3)
+    assert [record['name'] for record in page['customers']] == ['A', 'b',
+                                                                'c']
+    assert ServerOperations.decode_cursor(page['cursor']) == ('c', 'c')
+
+
+@pytest.fixture
+def sharded_client(data_path, make_operations, serve):
+    shards = [make_operations(data_path, shard=(index, SHARDS))
+              for index in range(SHARDS)]
+    addresses = [('localhost', serve(shard)) for shard in shards]
+    with ShardedClient(addresses, pool_size=2) as client:
+        yield (client, shards)
+
+
+def test_sharded_client_routes_and_merges(sharded_client):
+    (client, shards) = sharded_client
+    report = client.report()
+    expected = {}
+    for shard in shards:
+        expected.update(customers(shard))
+    assert report == {name: expected[name] for name in sorted(expected)}
+    assert [record['name'] for page in client.report_pages(64)
+            for record in page] == list(report)
+
+    names = ['Ada', 'Bob', 'Carl', 'Dora']
+    assert all(res_data_dict['success'] for res_data_dict in
+               client.add_customers([{'name': name, 'age': '30'}
+                                     for name in names])['results'])
+    for name in names:
+        assert name in shards[shard_of(name, SHARDS)].database_dict
+    assert [res_data_dict['name'] for res_data_dict in
+            client.get_customers(names[::-1])['results']] == names[::-1]
+    assert client.update_customer('Carl', age='31')['success']
+    assert client.get_customer('Carl')['age'] == '31'
+    assert [record['name'] for record in
+            client.search_customers('customer0000000')['customers']] == [
+        'Customer{:08d}'.format(index) for index in range(10)]
+    assert client.delete_customers(names)['results'][2]['success']
+    assert len(client.report()) == ROWS
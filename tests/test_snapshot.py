@@ -0,0 +1,90 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# ----- Program Details -----
+# Tests of the snapshot: written on top of the mutation log, and loaded in
+# the background while the requests change the customer data.
+
+import os
+
+from server import ReadWriteLock, ServerOperations
+from storage import MutationLog
+from tests.conftest import customers
+
+
+class PausingLock(ReadWriteLock):
+    """A lock running the queued calls each time the lock for writing is
+    released, in the releasing thread"""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    def release_write(self):
+        super().release_write()
+        if self.calls:
+            self.calls.pop(0)()
+
+
+def test_snapshot_and_log_round_trip(data_path, tmp_path, make_operations):
+    log_path = str(tmp_path / 'changes.log')
+    snapshot_path = str(tmp_path / 'data.snapshot')
+    server_operation_obj = make_operations(
+        data_path, MutationLog(log_path), snapshot_path=snapshot_path)
+    server_operation_obj.add_customer('Ada', 36, 'Rue Guy', '514 555-0101')
+    assert server_operation_obj.write_snapshot()['success']
+    # the snapshot holds the changes so far, the log only the next ones
+    assert list(MutationLog.replay(log_path)) == []
+    server_operation_obj.delete_customer('Customer00000003')
+    server_operation_obj.update_customer('Ada', {'phone': '514 555-0102'})
+    server_operation_obj.log.close()
+    expected = customers(server_operation_obj)
+
+    # the data file is no longer read once the snapshot exists
+    os.remove(data_path)
+    restarted = make_operations(data_path, MutationLog(log_path),
+                                snapshot_path=snapshot_path)
+    assert customers(restarted) == expected
+    assert restarted.get_customer('Ada')['phone'] == '514 555-0102'
+    assert restarted.get_customer('Customer00000003') == {
+        'message': 'Customer not found'}
+
+
+
+def test_changes_while_the_snapshot_loads(data_path, tmp_path,
+                                          make_operations, monkeypatch):
+    snapshot_path = str(tmp_path / 'data.snapshot')
+    make_operations(data_path, snapshot_path=snapshot_path).write_snapshot()
+    load_snapshot = ServerOperations.load_snapshot
+    monkeypatch.setattr(ServerOperations, 'load_snapshot',
+                        lambda self, batch_size=10000: None)
+    server_operation_obj = ServerOperations(data_path,
+                                            snapshot_path=snapshot_path,
+                                            index_fields=('phone', 'age'))
+    lock = server_operation_obj.lock = PausingLock()
+
+    def change():
+        # the first batch is loaded but not indexed yet
+        assert 'Customer00000001' in server_operation_obj.database_dict
+        for name in ('Customer00000001', 'Customer00000002',
+                     'Customer00000150'):
+            assert server_operation_obj.delete_customer(name)['success']
+        for name in ('Customer00000003', 'Customer00000160'):
+            assert server_operation_obj.update_customer(
+                name, {'age': 120, 'phone': '514 555-0199'})['success']
+        server_operation_obj.add_customer('Ada', 36, 'Rue Guy',
+                                          '514 555-0101')
+
+    lock.calls.append(change)
+    load_snapshot(server_operation_obj, batch_size=50)
+    assert not lock.calls
+    assert server_operation_obj.loaded.is_set()
+    expected = customers(server_operation_obj)
+    assert len(expected) == 198
+    assert server_operation_obj.sorted_index == sorted(
+        (name.lower(), name) for name in expected)
+    assert [record['name'] for record in server_operation_obj.find_by_phone(
+        '514 555-0199')['customers']] == ['Customer00000003',
+                                          'Customer00000160']
+    assert [record['name'] for record in server_operation_obj.find_by_age(
+        120, 120)['customers']] == ['Customer00000003', 'Customer00000160']
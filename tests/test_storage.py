@@ -0,0 +1,74 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# ----- Program Details -----
+# Tests of storage.py: the replay of the mutation log after a crash.
+
+import os
+
+from storage import MutationLog
+from tests.conftest import customers
+
+CHANGES = [{'op': 'add', 'name': 'Ada', 'age': 36, 'address': 'Rue Guy',
+            'phone': '514 555-0101'},
+           {'op': 'update', 'name': 'Ada', 'fields': {'age': 37}},
+           {'op': 'delete', 'name': 'Ada'}]
+
+
+def test_log_replays_the_changes_in_order(tmp_path):
+    log_path = str(tmp_path / 'changes.log')
+    log = MutationLog(log_path, 'os')
+    assert [log.append(op_dict) for op_dict in CHANGES] == [1, 2, 3]
+    log.close()
+    assert list(MutationLog.replay(log_path)) == CHANGES
+
+
+def test_group_commit_makes_the_changes_durable(tmp_path):
+    log_path = str(tmp_path / 'changes.log')
+    log = MutationLog(log_path, 'group', group_commit_ms=1)
+    seq = [log.append(op_dict) for op_dict in CHANGES][-1]
+    log.wait_durable(seq)
+    assert log.synced_seq >= seq
+    log.close()
+    assert list(MutationLog.replay(log_path)) == CHANGES
+
+
+def test_torn_tail_is_ignored_then_truncated(tmp_path):
+    log_path = str(tmp_path / 'changes.log')
+    log = MutationLog(log_path, 'os')
+    for op_dict in CHANGES[:2]:
+        log.append(op_dict)
+    log.close()
+    # a crash in the middle of the last line
+    with open(log_path, 'ab') as log_file:
+        log_file.write(b'{"op":"delete","na')
+    assert list(MutationLog.replay(log_path)) == CHANGES[:2]
+
+    log = MutationLog(log_path, 'os')
+    log.append(CHANGES[2])
+    log.close()
+    assert list(MutationLog.replay(log_path)) == CHANGES
+
+
+def test_invalid_line_stops_the_replay(tmp_path):
+    log_path = str(tmp_path / 'changes.log')
+    with open(log_path, 'wb') as log_file:
+        log_file.write(b'{"op":"delete","name":"A"}\nnot json\n'
+                       b'{"op":"delete","name":"B"}\n')
+    assert list(MutationLog.replay(log_path)) == [
+        {'op': 'delete', 'name': 'A'}]
+    MutationLog.truncate_torn_tail(log_path)
+    assert os.path.getsize(log_path) == len(b'{"op":"delete","name":"A"}\n')
+
+
+def test_changes_survive_a_restart(data_path, tmp_path, make_operations):
+    log_path = str(tmp_path / 'changes.log')
+    server_operation_obj = make_operations(data_path, MutationLog(log_path))
+    server_operation_obj.add_customer('Ada', 36, 'Rue Guy', '514 555-0101')
+    server_operation_obj.delete_customer('Customer00000001')
+    server_operation_obj.update_customer('Customer00000002', {'age': 99})
+    server_operation_obj.log.close()
+    expected = customers(server_operation_obj)
+
+    restarted = make_operations(data_path, MutationLog(log_path))
+    assert customers(restarted) == expected
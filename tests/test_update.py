@@ -0,0 +1,61 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# ----- Program Details -----
+# Tests of the updates of server.py: the multi-field update (choice 13)
+# and the per-field updates (choices 4, 5 and 6) built on it.
+
+from storage import MutationLog
+from tests.conftest import request
+
+NAME = 'Customer00000001'
+
+
+def test_multi_field_update_changes_the_fields_at_once(data_path, tmp_path,
+                                                       make_operations):
+    log_path = str(tmp_path / 'changes.log')
+    server_operation_obj = make_operations(data_path, MutationLog(log_path))
+    before = server_operation_obj.get_customer(NAME)
+    assert request(server_operation_obj, {
+        'choice': '13', 'name': NAME, 'age': 99,
+        'phone': '514 555-0102'}) == {'message': 'Customer has been updated',
+                                      'success': True}
+    assert server_operation_obj.get_customer(NAME) == dict(
+        before, age=99, phone='514 555-0102')
+    server_operation_obj.log.close()
+    # one change in the log for the whole update
+    assert list(MutationLog.replay(log_path)) == [
+        {'op': 'update', 'name': NAME,
+         'fields': {'age': 99, 'phone': '514 555-0102'}}]
+
+
+def test_per_field_updates_keep_their_messages(data_path, make_operations):
+    server_operation_obj = make_operations(data_path)
+    for (choice, field, value) in (('4', 'age', 99),
+                                   ('5', 'address', 'Rue Peel'),
+                                   ('6', 'phone', '514 555-0102')):
+        assert request(server_operation_obj, {
+            'choice': choice, 'name': NAME, field: value}) == {
+            'message': 'Customer {} has been updated'.format(field),
+            'success': True}
+        assert server_operation_obj.get_customer(NAME)[field] == value
+
+
+def test_invalid_updates_change_nothing(data_path, make_operations):
+    server_operation_obj = make_operations(data_path)
+    before = server_operation_obj.get_customer(NAME)
+    version = server_operation_obj.version
+    assert request(server_operation_obj, {'choice': '13', 'name': NAME}) == {
+        'message': 'Please provide the fields to update'}
+    assert request(server_operation_obj, {'choice': '13', 'age': 99}) == {
+        'message': 'Please provide Customer name'}
+    assert request(server_operation_obj,
+                   {'choice': '13', 'name': 'Nobody', 'age': 99}) == {
+        'message': 'Customer not found'}
+    assert server_operation_obj.update_customer(
+        NAME, {'age': 99, 'name': 'Ada'}) == {
+        'message': 'Only age, address and phone can be updated'}
+    assert server_operation_obj.update_customer(NAME, ['age']) == {
+        'message': 'Please provide the fields to update'}
+    assert server_operation_obj.get_customer(NAME) == before
+    assert server_operation_obj.version == version